@@ -0,0 +1,247 @@
+import os
+import time
+import uuid
+import pickle
+import socket
+import logging
+from bson import Binary
+from pymongo import MongoClient, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from itemadapter import is_item
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+
+logger = logging.getLogger(__name__)
+
+# Sent by the ack middlewares with frontier_id and state once a claimed
+# request is fully processed.
+claim_processed = object()
+
+class MongoFrontierScheduler:
+    # Shared crawl frontier: pending requests live in a Mongo collection so
+    # several `scrapy crawl search` processes can work one crawl together.
+    #
+    # * _id is the crawl id and the request fingerprint, so a request enqueued
+    #   by any node of one crawl is stored (and fetched) once, and a new crawl
+    #   id starts over; dont_filter requests get a unique suffix.
+    # * next_request claims one document atomically with find_one_and_update
+    #   and leases it for FRONTIER_LEASE_SECS.
+    # * The claim stays leased until FrontierAckMiddleware reports it
+    #   processed (callback run, items through the pipelines and written to
+    #   Mongo); leases of a worker that died expire and the request is
+    #   claimed again, at most FRONTIER_MAX_ATTEMPTS times.
+    # * Documents are kept per FRONTIER_CRAWL_ID, which is required: a new
+    #   crawl needs a new id, or it would find the last one's URLs done.
+    #
+    # Attachment downloads made by DecisionFilesPipeline bypass the scheduler;
+    # they stay with the node that owns the item, which is unique per claim.
+    def __init__(self, crawler, uri, db_name, coll_name, crawl_id, lease_secs, max_attempts):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.uri = uri
+        self.db_name = db_name
+        self.coll_name = coll_name
+        self.crawl_id = crawl_id
+        self.lease_secs = lease_secs
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.client = None
+        self.coll = None
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        sched = cls(
+            crawler,
+            os.getenv("MONGO_URI", "mongodb://localhost:27017"),
+            os.getenv("MONGO_DB", "kedra"),
+            s.get("FRONTIER_COLLECTION", "frontier"),
+            s.get("FRONTIER_CRAWL_ID") or None,
+            s.getfloat("FRONTIER_LEASE_SECS", 300),
+            s.getint("FRONTIER_MAX_ATTEMPTS", 3),
+        )
+        if not sched.crawl_id:
+            raise ValueError("MongoFrontierScheduler needs FRONTIER_CRAWL_ID, one per crawl")
+        crawler.signals.connect(sched.ack, signal=claim_processed)
+        return sched
+
+    def open(self, spider):
+        self.spider = spider
+        self.client = MongoClient(self.uri, connect=True)
+        self.coll = self.client[self.db_name][self.coll_name]
+        self.coll.create_index([("crawl", ASCENDING), ("state", ASCENDING), ("priority", DESCENDING), ("seq", ASCENDING)])
+        self.coll.create_index([("crawl", ASCENDING), ("lease_until", ASCENDING)])
+        logger.info("Frontier %s.%s crawl=%r worker=%s", self.db_name, self.coll_name, self.crawl_id, self.owner)
+
+    def close(self, reason):
+        if self.client:
+            self.client.close()
+
+    def __len__(self):
+        return self.coll.count_documents({"crawl": self.crawl_id, "state": {"$in": ["pending", "leased"]}})
+
+    def has_pending_requests(self):
+        # Requests leased by other workers count as pending: they may still
+        # fan out into new requests, or come back when a lease expires.
+        return self.coll.find_one({"crawl": self.crawl_id, "state": {"$in": ["pending", "leased"]}}, {"_id": 1}) is not None
+
+    def enqueue_request(self, request):
+        parent = request.meta.pop("frontier_id", None)
+        if parent:
+            # Redirect or retry of a claimed request: the new request carries
+            # the work from here on.
+            self._finish(parent, "done")
+
+        fp = self.crawler.request_fingerprinter.fingerprint(request).hex()
+        _id = f"{self.crawl_id}:{fp}:{uuid.uuid4().hex}" if request.dont_filter else f"{self.crawl_id}:{fp}"
+        doc = {
+            "_id": _id,
+            "crawl": self.crawl_id,
+            "state": "pending",
+            "priority": request.priority,
+            "seq": time.time(),
+            "attempts": 0,
+            "url": request.url,
+            "request": Binary(pickle.dumps(request.to_dict(spider=self.spider), protocol=4)),
+        }
+        try:
+            self.coll.insert_one(doc)
+        except DuplicateKeyError:
+            self.stats.inc_value("frontier/duplicate")
+            return False
+        self.stats.inc_value("frontier/enqueued")
+        return True
+
+    def next_request(self):
+        while True:
+            now = time.time()
+            doc = self.coll.find_one_and_update(
+                {
+                    "crawl": self.crawl_id,
+                    "$or": [
+                        {"state": "pending"},
+                        {"state": "leased", "lease_until": {"$lt": now}},
+                    ],
+                },
+                {
+                    "$set": {"state": "leased", "owner": self.owner, "lease_until": now + self.lease_secs},
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("priority", DESCENDING), ("seq", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc is None:
+                return None
+            if doc["attempts"] > 1:
+                self.stats.inc_value("frontier/lease_recovered")
+            if doc["attempts"] > self.max_attempts:
+                logger.warning("Giving up on %s after %d attempts", doc.get("url"), doc["attempts"] - 1)
+                self._finish(doc["_id"], "failed")
+                self.stats.inc_value("frontier/failed")
+                continue
+            try:
+                request = request_from_dict(pickle.loads(doc["request"]), spider=self.spider)
+            except Exception as e:
+                logger.error("Cannot restore frontier request %s: %s", doc["_id"], e)
+                self._finish(doc["_id"], "failed")
+                self.stats.inc_value("frontier/failed")
+                continue
+            request.meta["frontier_id"] = doc["_id"]
+            self.stats.inc_value("frontier/claimed")
+            return request
+
+    def ack(self, frontier_id, state="done"):
+        self._finish(frontier_id, state)
+        self.stats.inc_value(f"frontier/{state}")
+
+    def _finish(self, _id, state):
+        self.coll.update_one(
+            {"_id": _id, "owner": self.owner},
+            {"$set": {"state": state, "finished_at": time.time()}, "$unset": {"lease_until": ""}},
+        )
+
+def uses_frontier(settings):
+    return issubclass(load_object(settings["SCHEDULER"]), MongoFrontierScheduler)
+
+class FrontierAckMiddleware:
+    # Reports a claimed request processed, for the scheduler to finish it.
+    #
+    # As a spider middleware (outside HttpErrorMiddleware, so filtered
+    # responses get here too) it waits for the callback to return, for every
+    # item it produced to be scraped, dropped or failed, and then for
+    # MongoPipeline to have written them. As a downloader middleware (outside
+    # RetryMiddleware) it fails claims whose download failed for good.
+    # A claim never reported goes back to the frontier when its lease ends.
+    def __init__(self, crawler):
+        if not uses_frontier(crawler.settings):
+            raise NotConfigured
+        self.crawler = crawler
+        self.claims = {}  # frontier_id -> [items still in the pipelines, items produced, callback returned]
+        for sig in (signals.item_scraped, signals.item_dropped, signals.item_error):
+            crawler.signals.connect(self.item_done, signal=sig)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_exception(self, request, exception, spider):
+        _id = request.meta.get("frontier_id")
+        if _id:
+            self.report(_id, "done" if isinstance(exception, IgnoreRequest) else "failed")
+
+    def process_spider_output(self, response, result, spider):
+        claim = self._claim(response)
+        for out in result:
+            if claim is not None and is_item(out):
+                claim[0] += 1
+                claim[1] += 1
+            yield out
+        self._returned(response)
+
+    async def process_spider_output_async(self, response, result, spider):
+        claim = self._claim(response)
+        async for out in result:
+            if claim is not None and is_item(out):
+                claim[0] += 1
+                claim[1] += 1
+            yield out
+        self._returned(response)
+
+    def process_spider_exception(self, response, exception, spider):
+        # Nothing inside recovered from it: the callback is over.
+        self._returned(response)
+
+    def item_done(self, item, response, spider, **kwargs):
+        _id = response.meta.get("frontier_id") if response is not None else None
+        claim = self.claims.get(_id)
+        if claim is not None:
+            claim[0] -= 1
+            self._maybe_done(_id)
+
+    def _claim(self, response):
+        _id = response.meta.get("frontier_id")
+        return self.claims.setdefault(_id, [0, 0, False]) if _id else None
+
+    def _returned(self, response):
+        claim = self._claim(response)
+        if claim is not None:
+            claim[2] = True
+            self._maybe_done(response.meta["frontier_id"])
+
+    def _maybe_done(self, _id):
+        pending, produced, returned = self.claims[_id]
+        if pending or not returned:
+            return
+        del self.claims[_id]
+        mongo = getattr(self.crawler, "mongo_pipeline", None)
+        if not produced or mongo is None:
+            self.report(_id, "done")
+            return
+        mongo.written().addCallbacks(lambda _: self.report(_id, "done"), lambda f: logger.warning(
+            "Leaving %s leased: its items were not written (%s)", _id, f.getErrorMessage()))
+
+    def report(self, _id, state):
+        self.crawler.signals.send_catch_log(claim_processed, frontier_id=_id, state=state)
@@ -0,0 +1,170 @@
+import os
+import time
+import zlib
+import sqlite3
+import logging
+from urllib.parse import urlparse
+from scrapy.extensions.httpcache import DummyPolicy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_EXTS = (".pdf", ".doc", ".docx")
+
+def resource_kind(request):
+    path = urlparse(request.url).path.lower()
+    if path.endswith(ATTACHMENT_EXTS):
+        return "attachment"
+    if "/search" in path:
+        return "search"
+    return "detail"
+
+class ResourceTTLPolicy(DummyPolicy):
+    # Freshness depends on what was fetched: search listings change as new
+    # decisions are published, detail pages rarely, attachments never.
+    # A TTL of 0 keeps the entry until it is evicted. Attachments are only
+    # cached with FILES_STREAM off: streamed ones are never stored (below).
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.ttl = {
+            "search": settings.getint("HTTPCACHE_TTL_SEARCH", 600),
+            "detail": settings.getint("HTTPCACHE_TTL_DETAIL", 7 * 86400),
+            "attachment": settings.getint("HTTPCACHE_TTL_ATTACHMENT", 0),
+        }
+
+    def should_cache_response(self, response, request):
+        # Streamed attachments reach the middleware without their body, and a
+        # 304 has none to replay.
+        return (response.status != 304 and "streamed" not in response.flags
+                and super().should_cache_response(response, request))
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        ttl = self.ttl.get(resource_kind(request), 0)
+        stored_at = request.meta.get("cache_timestamp")
+        if not ttl or stored_at is None:
+            return True
+        if time.time() - stored_at < ttl:
+            return True
+        # Stale: ask the server whether the stored copy still holds.
+        if b"ETag" in cachedresponse.headers:
+            request.headers[b"If-None-Match"] = cachedresponse.headers[b"ETag"]
+        if b"Last-Modified" in cachedresponse.headers:
+            request.headers[b"If-Modified-Since"] = cachedresponse.headers[b"Last-Modified"]
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        # A stale entry is only reused when the server answers our
+        # conditional request with 304; anything else replaces it.
+        conditional = b"If-None-Match" in request.headers or b"If-Modified-Since" in request.headers
+        return conditional and response.status == 304
+
+class SqliteCacheStorage:
+    # One SQLite file per spider under HTTPCACHE_DIR, instead of a directory
+    # of small files per response. Bodies are zlib-compressed unless they are
+    # attachments (already compressed, mostly; cached with FILES_STREAM off).
+    # When the file exceeds HTTPCACHE_SQLITE_MAX_BYTES the least recently
+    # read entries are evicted.
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"], createdir=True)
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.max_bytes = settings.getint("HTTPCACHE_SQLITE_MAX_BYTES", 2 * 1024 ** 3)
+        self.compress_level = settings.getint("HTTPCACHE_SQLITE_COMPRESS_LEVEL", 6)
+        self.db = None
+        self.stats = None
+        self.total_bytes = 0
+
+    def open_spider(self, spider):
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self.stats = spider.crawler.stats
+        path = os.path.join(self.cachedir, f"{spider.name}.sqlite3")
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a new file
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " fp TEXT PRIMARY KEY, kind TEXT, url TEXT, status INTEGER,"
+            " headers BLOB, body BLOB, compressed INTEGER, size INTEGER,"
+            " stored_at REAL, accessed_at REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.stats.set_value("httpcache/sqlite_bytes", self.total_bytes)
+        logger.debug("Using SQLite cache storage in %s", path, extra={"spider": spider})
+
+    def close_spider(self, spider):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def retrieve_response(self, spider, request):
+        kind = resource_kind(request)
+        fp = self._fingerprinter.fingerprint(request).hex()
+        row = self.db.execute(
+            "SELECT url, status, headers, body, compressed, stored_at FROM responses WHERE fp = ?", (fp,)
+        ).fetchone()
+        if row is None:
+            self.stats.inc_value(f"httpcache/sqlite_miss/{kind}")
+            return None
+        url, status, headers, body, compressed, stored_at = row
+        if self.expiration_secs > 0 and time.time() - stored_at > self.expiration_secs:
+            self.stats.inc_value(f"httpcache/sqlite_miss/{kind}")
+            return None
+        self.db.execute("UPDATE responses SET accessed_at = ? WHERE fp = ?", (time.time(), fp))
+        self.stats.inc_value(f"httpcache/sqlite_hit/{kind}")
+
+        body = zlib.decompress(body) if compressed else body
+        headers = Headers(headers_raw_to_dict(headers))
+        request.meta["cache_timestamp"] = stored_at
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        kind = resource_kind(request)
+        fp = self._fingerprinter.fingerprint(request).hex()
+        body = response.body
+        compressed = 0
+        if kind != "attachment" and self.compress_level > 0:
+            body = zlib.compress(body, self.compress_level)
+            compressed = 1
+        headers = headers_dict_to_raw(response.headers)
+        size = len(body) + len(headers)
+        now = time.time()
+
+        old = self.db.execute("SELECT size FROM responses WHERE fp = ?", (fp,)).fetchone()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses"
+            " (fp, kind, url, status, headers, body, compressed, size, stored_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (fp, kind, response.url, response.status, headers, body, compressed, size, now, now),
+        )
+        self.total_bytes += size - (old[0] if old else 0)
+        self.stats.inc_value("httpcache/sqlite_stored_bytes", size)
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self._evict()
+        self.stats.set_value("httpcache/sqlite_bytes", self.total_bytes)
+
+    def _evict(self):
+        # Trim to 90% so eviction does not run on every following store.
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self.total_bytes > target:
+            rows = self.db.execute(
+                "SELECT fp, size FROM responses ORDER BY accessed_at LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            drop = []
+            for fp, size in rows:
+                drop.append((fp,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+            self.db.executemany("DELETE FROM responses WHERE fp = ?", drop)
+            evicted += len(drop)
+        self.db.execute("PRAGMA incremental_vacuum")
+        self.stats.inc_value("httpcache/sqlite_evicted", evicted)
+        logger.info("HTTP cache over %d bytes; evicted %d entries", self.max_bytes, evicted)
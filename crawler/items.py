@@ -4,6 +4,7 @@
 # https://docs.scrapy.org/en/latest/topics/items.html
 
 import scrapy
+from typing import NamedTuple, Optional
 
 
 class CrawlerItem(scrapy.Item):
@@ -22,6 +23,7 @@ class CrawlerItem(scrapy.Item):
     # Source & links
     source_url = scrapy.Field()        # search-card detail link
     detail_url = scrapy.Field()        # same as source_url (kept explicit)
+    detail_validators = scrapy.Field() # {'etag', 'last_modified'} of the detail page
     file_urls = scrapy.Field()         # URLs to download (pdf/doc/docx or html)
     # FilesPipeline will populate this:
     files = scrapy.Field()             # [{'path', 'checksum', 'url'}] (md5 checksum)
@@ -32,3 +34,24 @@ class CrawlerItem(scrapy.Item):
     partition_date = scrapy.Field()    # YYYY-MM
     scraped_at = scrapy.Field()
     extra = scrapy.Field()             # any site-specific bits
+
+
+class CardState(NamedTuple):
+    # What a search card contributes to its item, carried in the detail
+    # request's cb_kwargs instead of a whole CrawlerItem: a plain tuple in
+    # memory and a few hundred bytes in a disk queue.
+    identifier: str
+    title: str
+    description: str
+    decision_date_raw: str
+    decision_date: Optional[str]
+    partition_date: str
+    source_url: str
+    detail_url: str
+
+    def to_item(self):
+        item = CrawlerItem()
+        for field, value in zip(self._fields, self):
+            if value is not None:
+                item[field] = value
+        return item
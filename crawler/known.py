@@ -0,0 +1,37 @@
+import os
+from typing import Any, Dict, Iterable, Optional, Tuple
+from pymongo import MongoClient
+
+Key = Tuple[str, str]
+
+class KnownDecisions:
+    # Read side of MongoPipeline's collection: one indexed $in lookup per
+    # search page tells the spider which cards are already stored.
+    def __init__(self, uri: str, db_name: str, coll_name: str):
+        self.client = MongoClient(uri, serverSelectionTimeoutMS=6000)
+        self.coll = self.client[db_name][coll_name]
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("MONGO_URI", "mongodb://localhost:27017"),
+            os.getenv("MONGO_DB", "kedra"),
+            os.getenv("MONGO_COLLECTION", "decisions"),
+        )
+
+    def lookup(self, keys: Iterable[Key], fields: Optional[Iterable[str]] = None) -> Dict[Key, Dict[str, Any]]:
+        keys = set(keys)
+        if not keys:
+            return {}
+        projection = {"_id": 0, "identifier": 1, "detail_url": 1}
+        for f in fields or ():
+            projection[f] = 1
+        found = {}
+        for doc in self.coll.find({"identifier": {"$in": sorted({k[0] for k in keys})}}, projection):
+            key = (doc.get("identifier"), doc.get("detail_url") or "")
+            if key in keys:
+                found[key] = doc
+        return found
+
+    def close(self):
+        self.client.close()
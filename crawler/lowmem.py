@@ -0,0 +1,106 @@
+import os
+import shutil
+import sqlite3
+import logging
+import tempfile
+from scrapy import signals
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+logger = logging.getLogger(__name__)
+
+class LowMemoryMode:
+    # Settings profile for multi-year backfills, switched on with
+    # -s LOW_MEMORY=1 (listed in ADDONS, a no-op otherwise):
+    #
+    # * JOBDIR: pending requests go to Scrapy's pickle disk queues, and a
+    #   stopped crawl resumes from them when started with the same JOBDIR.
+    #   Without one, a throwaway directory still keeps the queues on disk;
+    #   it is removed when the engine stops.
+    # * SqliteDupeFilter: seen fingerprints in SQLite next to the queues
+    #   rather than a set that grows with every request.
+    # * Smaller Mongo and item buffers, and memusage/* stats checked often.
+    # * The search spider walks pages one at a time (no prefetch_pages or
+    #   result-count fan-out), so pending detail requests stay at one page.
+    def __init__(self, crawler=None):
+        self.crawler = crawler
+        self.temp_jobdir = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def update_settings(self, settings):
+        if not settings.getbool("LOW_MEMORY"):
+            return
+        if not settings.get("JOBDIR"):
+            self.temp_jobdir = tempfile.mkdtemp(prefix="kedra-job-")
+            logger.warning("LOW_MEMORY without JOBDIR: queuing in %s, removed at the end of the crawl",
+                           self.temp_jobdir)
+            settings.set("JOBDIR", self.temp_jobdir, priority="addon")
+            if self.crawler is not None:
+                self.crawler.signals.connect(self.remove_temp_jobdir, signal=signals.engine_stopped)
+        # Above "project" (settings.py sets MONGO_BULK_MAX_PENDING and may set
+        # the others), below "cmdline", so -s NAME=VALUE still wins.
+        for name, value in {
+            "DUPEFILTER_CLASS": "crawler.lowmem.SqliteDupeFilter",
+            "SCHEDULER_DISK_QUEUE": "scrapy.squeues.PickleLifoDiskQueue",
+            "CONCURRENT_ITEMS": settings.getint("LOW_MEMORY_CONCURRENT_ITEMS", 25),
+            "MONGO_BULK_MAX_PENDING": settings.getint("LOW_MEMORY_MONGO_MAX_PENDING", 200),
+            "MEMUSAGE_ENABLED": True,
+            "MEMUSAGE_CHECK_INTERVAL_SECONDS": 15,
+        }.items():
+            settings.set(name, value, priority="spider")
+
+    def remove_temp_jobdir(self):
+        # Not on spider_closed: SpiderState writes JOBDIR/spider.state then.
+        shutil.rmtree(self.temp_jobdir, ignore_errors=True)
+
+class SqliteDupeFilter(RFPDupeFilter):
+    # RFPDupeFilter with the fingerprints in JOBDIR/requests.seen.sqlite3,
+    # so memory stays flat however many requests a crawl makes. Inserts are
+    # committed every DUPEFILTER_SQLITE_COMMIT_EVERY requests and at close.
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, commit_every=1000):
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.temp = path is None
+        if self.temp:
+            fd, self.db_path = tempfile.mkstemp(prefix="requests-seen-", suffix=".sqlite3")
+            os.close(fd)
+        else:
+            self.db_path = os.path.join(path, "requests.seen.sqlite3")
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS seen (fp BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.commit_every = max(1, commit_every)
+        self.uncommitted = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        return cls(
+            job_dir(s),
+            s.getbool("DUPEFILTER_DEBUG"),
+            fingerprinter=crawler.request_fingerprinter,
+            commit_every=s.getint("DUPEFILTER_SQLITE_COMMIT_EVERY", 1000),
+        )
+
+    def request_seen(self, request):
+        cur = self.db.execute("INSERT OR IGNORE INTO seen (fp) VALUES (?)", (self._fingerprint(request),))
+        if cur.rowcount == 0:
+            return True
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.db.commit()
+            self.uncommitted = 0
+        return False
+
+    def close(self, reason):
+        self.db.commit()
+        self.db.close()
+        if self.temp:
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.unlink(self.db_path + suffix)
+                except OSError:
+                    pass
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import logging
+from bisect import bisect_left
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from crawler.httpcache import resource_kind
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CALLBACK_STAGES = {"parse": "search_parse", "parse_detail": "detail_parse"}
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation.
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class StageMetrics:
+    # Timing histograms per crawl stage plus queue/in-flight gauges, written
+    # every METRICS_INTERVAL seconds (and at close) to METRICS_DIR as
+    # metrics-<spider>.prom (Prometheus text format, for a textfile
+    # collector) and/or metrics-<spider>.json.
+    #
+    # Download latencies come from response_received; parse times from
+    # StageTimingMiddleware; pipelines report through crawler.stage_metrics
+    # (observe() and gauge()).
+    def __init__(self, crawler):
+        s = crawler.settings
+        if not s.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.dir = s.get("METRICS_DIR", "logs")
+        self.interval = s.getfloat("METRICS_INTERVAL", 15.0)
+        fmt = s.get("METRICS_FORMAT", "prometheus").lower()
+        self.formats = ("prometheus", "json") if fmt == "both" else (fmt,)
+        self.histograms = {}
+        self.gauges = {}
+        self.spider_name = None
+        self._task = None
+        crawler.stage_metrics = self
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.response_received, signal=signals.response_received)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def observe(self, stage, seconds):
+        h = self.histograms.get(stage)
+        if h is None:
+            h = self.histograms[stage] = Histogram()
+        h.observe(seconds)
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def spider_opened(self, spider):
+        self.spider_name = spider.name
+        engine = self.crawler.engine
+        self.gauge("scheduler_pending", lambda: len(engine_slot(engine).scheduler))
+        self.gauge("downloader_active", lambda: len(engine.downloader.active))
+        self.gauge("downloader_queued", lambda: sum(len(s.queue) for s in engine.downloader.slots.values()))
+        self.gauge("downloader_slots", lambda: len(engine.downloader.slots))
+        self.gauge("scraper_active", lambda: len(engine.scraper.slot.active))
+        self.gauge("scraper_queued", lambda: len(engine.scraper.slot.queue))
+        self.gauge("items_in_pipeline", lambda: engine.scraper.slot.itemproc_size)
+        self.gauge("rss_bytes", current_rss)
+        os.makedirs(self.dir, exist_ok=True)
+        if self.interval > 0:
+            self._task = task.LoopingCall(self.write)
+            self._task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self._task and self._task.running:
+            self._task.stop()
+        self.write()
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.observe(f"download_{resource_kind(request)}", latency)
+
+    def sample_gauges(self):
+        values = {}
+        for name, fn in self.gauges.items():
+            try:
+                values[name] = fn()
+            except Exception:
+                # Engine parts come and go around open/close.
+                continue
+        return values
+
+    def write(self):
+        gauges = self.sample_gauges()
+        stats = {k: v for k, v in self.crawler.stats.get_stats().items()
+                 if isinstance(v, (int, float)) and not isinstance(v, bool)}
+        try:
+            if "prometheus" in self.formats:
+                self._replace(f"metrics-{self.spider_name}.prom", self.prometheus(gauges, stats))
+            if "json" in self.formats:
+                self._replace(f"metrics-{self.spider_name}.json", json.dumps(self.snapshot(gauges, stats), indent=2))
+        except OSError as e:
+            logger.warning("Cannot write metrics to %s: %s", self.dir, e)
+
+    def _replace(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+    def snapshot(self, gauges, stats):
+        return {
+            "spider": self.spider_name,
+            "time": time.time(),
+            "stages": {
+                stage: {
+                    "count": h.count,
+                    "sum_s": round(h.sum, 6),
+                    "max_s": round(h.max, 6),
+                    "p50_s": h.quantile(0.5),
+                    "p90_s": h.quantile(0.9),
+                    "p99_s": h.quantile(0.99),
+                    "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.counts)),
+                }
+                for stage, h in sorted(self.histograms.items())
+            },
+            "gauges": gauges,
+            "stats": stats,
+        }
+
+    def prometheus(self, gauges, stats):
+        spider = self.spider_name
+        out = ["# HELP kedra_stage_seconds Time spent per crawl stage.", "# TYPE kedra_stage_seconds histogram"]
+        for stage, h in sorted(self.histograms.items()):
+            labels = f'spider="{spider}",stage="{stage}"'
+            cumulative = 0
+            for bound, n in zip(h.buckets, h.counts):
+                cumulative += n
+                out.append(f'kedra_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            out.append(f'kedra_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+            out.append(f"kedra_stage_seconds_sum{{{labels}}} {h.sum:.6f}")
+            out.append(f"kedra_stage_seconds_count{{{labels}}} {h.count}")
+        for name, value in sorted(gauges.items()):
+            out.append(f"# TYPE kedra_{name} gauge")
+            out.append(f'kedra_{name}{{spider="{spider}"}} {value}')
+        out.append("# TYPE kedra_stat gauge")
+        for key, value in sorted(stats.items()):
+            out.append(f'kedra_stat{{spider="{spider}",key="{key}"}} {value}')
+        return "\n".join(out) + "\n"
+
+def current_rss():
+    # memusage/max only keeps the peak; this is the resident size now.
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def engine_slot(engine):
+    return getattr(engine, "_slot", None) or engine.slot
+
+class StageTimingMiddleware:
+    # Spider middleware timing the callbacks: the time spent pulling results
+    # out of parse()/parse_detail() is recorded as search_parse/detail_parse.
+    # Enable it close to the spider so other middlewares are not counted.
+    def __init__(self, crawler):
+        if not crawler.settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _stage(self, response):
+        callback = getattr(response.request, "callback", None) if response.request is not None else None
+        name = getattr(callback, "__name__", None) or "parse"
+        return CALLBACK_STAGES.get(name, f"callback_{name}")
+
+    def _observe(self, stage, seconds):
+        metrics = getattr(self.crawler, "stage_metrics", None)
+        if metrics is not None:
+            metrics.observe(stage, seconds)
+
+    def process_spider_output(self, response, result, spider):
+        stage = self._stage(response)
+        elapsed = 0.0
+        it = iter(result)
+        while True:
+            started = time.perf_counter()
+            try:
+                out = next(it)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                break
+            elapsed += time.perf_counter() - started
+            yield out
+        self._observe(stage, elapsed)
+
+    async def process_spider_output_async(self, response, result, spider):
+        stage = self._stage(response)
+        elapsed = 0.0
+        it = result.__aiter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                out = await it.__anext__()
+            except StopAsyncIteration:
+                elapsed += time.perf_counter() - started
+                break
+            elapsed += time.perf_counter() - started
+            yield out
+        self._observe(stage, elapsed)
@@ -4,6 +4,7 @@
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 import random
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
@@ -18,3 +19,14 @@ class UserRotationMiddleware:
     def process_request(self, request, spider):
         request.headers["User-Agent"] = random.choice(self.UAS)
         return None
+
+class PaginationCancelMiddleware:
+    # Drops search pages the spider has since found to be past the last one
+    # (SearchSpider.beyond_last_page), so speculative prefetch stops at the
+    # first empty page instead of downloading the rest of its window.
+    def process_request(self, request, spider):
+        check = getattr(spider, "beyond_last_page", None)
+        if check is not None and check(request):
+            spider.crawler.stats.inc_value("pagination/prefetch_cancelled")
+            raise IgnoreRequest(f"past the last search page: {request.url}")
+        return None
@@ -2,77 +2,404 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-import os, mimetypes
-from scrapy.pipelines.files import FilesPipeline
+import os, mimetypes, hashlib, json, logging, tempfile, time
+from email.utils import formatdate
+from io import BytesIO
+from scrapy import signals
+from scrapy.pipelines.files import FilesPipeline, FSFilesStore
 from scrapy.http import Request
-from crawler.utility import safe_ext_from_ct, sha256_bytes
+from scrapy.http.request import NO_CALLBACK
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from twisted.internet import defer, threads
+from crawler.known import KnownDecisions
+from crawler.utility import safe_ext_from_ct, sha256_bytes, sniff_mime, content_kind
 from datetime import datetime, timezone
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+logger = logging.getLogger(__name__)
+
 class DecisionFilesPipeline(FilesPipeline):
+    # FILES_CAS_ENABLED stores each distinct body once under
+    # FILES_CAS_DIR/<sha[:2]>/<sha[2:4]>/<sha>; the usual
+    # partition/body/identifier path becomes a hardlink to that blob, or a
+    # manifest entry when the filesystem cannot link.
+    #
+    # FILES_FRESHNESS avoids downloading attachments that have not changed
+    # since the last crawl. The previous stored_files entry for the URL is
+    # looked up in Mongo. If its landed file is still in place:
+    #   revalidate  conditional GET with the recorded ETag/Last-Modified, or a
+    #               HEAD compared on Content-Length when none was recorded;
+    #   trust       reuse without asking the server.
+    # An unchanged file keeps its stored_files entry and is not rewritten. A
+    # landed file without a Mongo record is revalidated with its mtime.
+    # off: download everything (FILES_EXPIRES still applies).
+    #
+    # FILES_STREAM has crawler.streaming write bodies to FILES_STORE/.incoming
+    # as they arrive, hashed on the way, and the temp file is renamed into
+    # place here; FILES_MAX_SIZE caps the size of one attachment.
+    cas_enabled = False
+    cas_dir = "blobs"
+    stats = None
+    metrics = None
+    freshness = "off"
+    known = None
+    stream_dir = None
+    max_size = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipe = super().from_crawler(crawler)
+        pipe.stats = crawler.stats
+        pipe.metrics = getattr(crawler, "stage_metrics", None)
+        pipe.cas_dir = crawler.settings.get("FILES_CAS_DIR", cls.cas_dir).strip("/")
+        if crawler.settings.getbool("FILES_CAS_ENABLED", False):
+            if isinstance(pipe.store, FSFilesStore):
+                pipe.cas_enabled = True
+            else:
+                logger.warning("FILES_CAS_ENABLED needs a local FILES_STORE; using the plain layout.")
+        pipe.crawler = crawler
+        pipe.freshness = crawler.settings.get("FILES_FRESHNESS", "off").lower()
+        if pipe.freshness != "off" and not isinstance(pipe.store, FSFilesStore):
+            logger.warning("FILES_FRESHNESS needs a local FILES_STORE; downloading every file.")
+            pipe.freshness = "off"
+        pipe._previous = {}
+        pipe.max_size = crawler.settings.getint("FILES_MAX_SIZE", 0)
+        if crawler.settings.getbool("FILES_STREAM", False):
+            if isinstance(pipe.store, FSFilesStore):
+                pipe.stream_dir = os.path.join(pipe.store.basedir, ".incoming")
+            else:
+                logger.warning("FILES_STREAM needs a local FILES_STORE; buffering downloads in memory.")
+        crawler.signals.connect(pipe.close_known, signal=signals.spider_closed)
+        return pipe
+
+    def close_known(self, spider):
+        if self.known is not None:
+            self.known.close()
+            self.known = None
+
     def get_media_requests(self, item, info):
+        if self.freshness != "off" and item.get("file_urls"):
+            self.lookup_previous(item)
+        meta = {
+            "identifier": item.get("identifier"),
+            "body": item.get("body"),
+            "partition_date": item.get("partition_date"),
+        }
+        if self.stream_dir:
+            meta["files_stream"] = self.stream_dir
+        if self.max_size:
+            meta["download_maxsize"] = self.max_size
         for url in item.get("file_urls", []):
-            yield Request(
-                url,
-                meta={
-                    "identifier": item.get("identifier"),
-                    "body": item.get("body"),
-                    "partition_date": item.get("partition_date"),
-                },
-                dont_filter=True,
-            )
+            yield Request(url, meta=dict(meta), dont_filter=True)
 
     def file_path(self, request, response=None, info=None, *, item=None):
         identifier = (request.meta.get("identifier") or "noid").strip()
         body = str(request.meta.get("body") or "unknown")
         part = request.meta.get("partition_date") or "0000-00"
         ct = response.headers.get("Content-Type", b"").decode("utf-8") if response else ""
+        if response is not None and (not ct or "octet-stream" in ct):
+            ct = sniff_mime(body_head(response)) or ct
         ext = safe_ext_from_ct(ct, request.url)
         fname = f"{identifier}{ext}"
         return os.path.join(part, body, fname).replace("\\", "/")
 
-def file_downloaded(self, response, request, info, *, item=None):
-    checksum = super().file_downloaded(response, request, info, item=item)
-    rel_path = self.file_path(request, response=response, info=info, item=item)
-    abs_path = self.store.path(rel_path)
+    def blob_path(self, file_hash):
+        return f"{self.cas_dir}/{file_hash[:2]}/{file_hash[2:4]}/{file_hash}"
+
+    def media_downloaded(self, response, request, info, *, item=None):
+        if response.status == 304 and item is not None:
+            prev = request.meta.get("files_previous")
+            if prev is None and request.meta.get("files_landed"):
+                prev = self.landed_entry(request, request.meta["files_landed"])
+            if prev is not None:
+                return self.reuse(request, item, prev, "not_modified")
+        streamed = streamed_file(response)
+        if streamed is not None and streamed["size"]:
+            # FilesPipeline would reject the empty body as empty-content.
+            self._inc("file_count")
+            self._inc("file_status_count/downloaded")
+            try:
+                path = self.file_path(request, response=response, info=info, item=item)
+                checksum = self.file_downloaded(response, request, info, item=item)
+            finally:
+                discard(streamed["path"])
+            return {"url": request.url, "path": path, "checksum": checksum, "status": "downloaded"}
+        if streamed is not None:
+            discard(streamed["path"])
+        return super().media_downloaded(response, request, info, item=item)
+
+    def file_downloaded(self, response, request, info, *, item=None):
+        # Everything is derived from the body already in memory, or from the
+        # hashes computed while it streamed to disk; the stored file is never
+        # read back.
+        started = time.perf_counter()
+        streamed = streamed_file(response)
+        head = body_head(response)
+        if streamed is None:
+            body = response.body
+            size, file_hash, checksum = len(body), sha256_bytes(body), hashlib.md5(body).hexdigest()
+        else:
+            body = None
+            size, file_hash, checksum = streamed["size"], streamed["sha256"], streamed["md5"]
+        rel_path = self.file_path(request, response=response, info=info, item=item)
+
+        sf = {"url": response.url, "stored_file_path": rel_path}
+        if self.cas_enabled:
+            blob_rel = self.blob_path(file_hash)
+            sf["layout"] = self.persist_blob(rel_path, blob_rel, file_hash, size, info, body=body,
+                                             tmp=streamed and streamed["path"])
+            sf["blob_hash"] = file_hash
+            sf["blob_path"] = blob_rel
+        elif streamed is not None:
+            self.move_into_store(streamed["path"], rel_path)
+        elif isinstance(self.store, FSFilesStore):
+            self.write_into_store(body, rel_path)
+        else:
+            self.store.persist_file(rel_path, BytesIO(body), info)
+
+        if item is not None:
+            ct_hdr = response.headers.get(b"Content-Type", b"").decode("utf-8", errors="ignore")
+            mime = ct_hdr if ct_hdr and "octet-stream" not in ct_hdr else None
+            mime = mime or sniff_mime(head) or mimetypes.guess_type(rel_path)[0] or ct_hdr or "application/octet-stream"
+            sf.update({
+                "filesize_bytes": size,
+                "file_hash": file_hash,
+                "mime": mime,
+                "checksum": checksum,
+            })
+            if response.url != request.url:
+                sf["request_url"] = request.url
+            for header, key in ((b"ETag", "etag"), (b"Last-Modified", "last_modified")):
+                value = response.headers.get(header)
+                if value:
+                    sf[key] = value.decode("latin-1")
+            self.record_stored_file(item, sf)
+        if self.metrics is not None:
+            self.metrics.observe("file_postprocess", time.perf_counter() - started)
+        return checksum
+
+    def record_stored_file(self, item, sf):
+        item.setdefault("stored_files", []).append(sf)
+        types = set(item.get("content_types") or [])
+        types.add(content_kind(sf.get("mime")))
+        item["content_types"] = list(types)
+
+    def lookup_previous(self, item):
+        key = (item.get("identifier"), item.get("detail_url") or "")
+        if key in self._previous:
+            return
+        if self.known is None:
+            self.known = KnownDecisions.from_env()
+
+        def by_url(found):
+            prev = (found.get(key) or {}).get("stored_files") or []
+            return {sf.get("request_url") or sf.get("url"): sf for sf in prev if sf.get("stored_file_path")}
+
+        def failed(failure):
+            logger.warning("stored_files lookup failed for %s: %s", key[0], failure.value)
+            return {}
+
+        d = threads.deferToThread(self.known.lookup, [key], ("stored_files",))
+        self._previous[key] = d.addCallbacks(by_url, failed)
+
+    def previous_files(self, item):
+        # Every file request of an item waits on the same lookup.
+        shared = self._previous.get((item.get("identifier"), item.get("detail_url") or ""))
+        if shared is None:
+            return defer.succeed({})
+        d = defer.Deferred()
+        shared.addBoth(lambda r: (d.callback(r), r)[1])
+        return d
+
+    def landed(self, prev, expected):
+        # The recorded file is still where this item would put it, at the
+        # recorded size.
+        rel = prev.get("stored_file_path") or ""
+        if prev.get("layout") == "manifest":
+            rel = prev.get("blob_path") or ""
+        if os.path.splitext(prev.get("stored_file_path") or "")[0] != os.path.splitext(expected)[0]:
+            return False
+        try:
+            return os.path.getsize(os.path.join(self.store.basedir, rel)) == prev.get("filesize_bytes")
+        except OSError:
+            return False
+
+    def media_to_download(self, request, info, *, item=None):
+        if self.freshness == "off" or item is None:
+            return super().media_to_download(request, info, item=item)
+        return deferred_from_coro(self._check_freshness(request, info, item))
+
+    async def _check_freshness(self, request, info, item):
+        # Returns a file result to skip the download, or None to download
+        # (conditionally, when there is something to compare with).
+        prev = (await maybe_deferred_to_future(self.previous_files(item))).get(request.url)
+        expected = self.file_path(request, info=info, item=item)
+        if prev is not None and self.landed(prev, expected):
+            if self.freshness == "trust":
+                return self.reuse(request, item, prev, "trusted")
+            if prev.get("etag") or prev.get("last_modified"):
+                if prev.get("etag"):
+                    request.headers["If-None-Match"] = prev["etag"]
+                if prev.get("last_modified"):
+                    request.headers["If-Modified-Since"] = prev["last_modified"]
+                request.meta.update(files_previous=prev, dont_cache=True)
+                self._inc("files/fresh/conditional_sent")
+                return None
+            head = await self.fetch(request.replace(method="HEAD", callback=NO_CALLBACK,
+                                                    meta=dict(request.meta, dont_cache=True)))
+            self._inc("files/fresh/head_sent")
+            size = content_length(head.headers.get(b"Content-Length")) if head is not None and head.status == 200 else None
+            if size is not None and size == prev.get("filesize_bytes"):
+                return self.reuse(request, item, prev, "head_unchanged")
+            return None
+        # No record to go by: the landed file's mtime is the validator.
+        landed = self.landed_file(expected)
+        if landed is not None:
+            path = os.path.join(self.store.basedir, landed)
+            request.headers["If-Modified-Since"] = formatdate(os.path.getmtime(path), usegmt=True)
+            request.meta.update(files_landed=landed, dont_cache=True)
+            self._inc("files/fresh/conditional_sent")
+        return None
+
+    def landed_file(self, expected):
+        # Without a response the extension of `expected` is a guess from the
+        # URL (.bin when it has none), so the landed file is found by its
+        # identifier stem, as landed() compares recorded paths.
+        directory, name = os.path.split(os.path.join(self.store.basedir, *expected.split("/")))
+        stem = os.path.splitext(name)[0]
+        try:
+            names = [n for n in os.listdir(directory)
+                     if os.path.splitext(n)[0] == stem and os.path.isfile(os.path.join(directory, n))]
+        except OSError:
+            return None
+        if name in names:
+            return expected
+        if len(names) != 1:
+            return None
+        return "/".join(expected.split("/")[:-1] + names)
+
+    async def fetch(self, request):
+        engine = self.crawler.engine
+        try:
+            if hasattr(engine, "download_async"):
+                return await engine.download_async(request)
+            return await maybe_deferred_to_future(engine.download(request))
+        except Exception as e:
+            logger.debug("HEAD %s failed: %s", request.url, e)
+            return None
+
+    def landed_entry(self, request, rel_path):
+        sha, md5, size = hashlib.sha256(), hashlib.md5(), 0
+        with open(os.path.join(self.store.basedir, rel_path), "rb") as f:
+            head = f.read(4096)
+            chunk = head
+            while chunk:
+                sha.update(chunk)
+                md5.update(chunk)
+                size += len(chunk)
+                chunk = f.read(1024 * 1024)
+        return {
+            "url": request.url,
+            "stored_file_path": rel_path,
+            "filesize_bytes": size,
+            "file_hash": sha.hexdigest(),
+            "mime": sniff_mime(head) or mimetypes.guess_type(rel_path)[0] or "application/octet-stream",
+            "checksum": md5.hexdigest(),
+        }
+
+    def reuse(self, request, item, prev, why):
+        self.record_stored_file(item, dict(prev))
+        self._inc(f"files/fresh/{why}")
+        self._inc("files/fresh/bytes_avoided", prev.get("filesize_bytes") or 0)
+        return {"url": request.url, "path": prev["stored_file_path"], "checksum": prev.get("checksum"),
+                "status": "uptodate"}
+
+    def item_completed(self, results, item, info):
+        self._previous.pop((item.get("identifier"), item.get("detail_url") or ""), None)
+        return super().item_completed(results, item, info)
+
+    def move_into_store(self, tmp, rel_path):
+        target = os.path.join(self.store.basedir, *rel_path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp, target)
+
+    def write_into_store(self, body, rel_path):
+        # Written next to the target and renamed over it: a landed file can
+        # be a hardlink to a CAS blob or to a curated copy, and writing it in
+        # place would change those too.
+        directory = os.path.join(self.store.basedir, *rel_path.split("/")[:-1])
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".part-", dir=directory)
+        try:
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            self.move_into_store(tmp, rel_path)
+        except BaseException:
+            discard(tmp)
+            raise
+
+    def persist_blob(self, rel_path, blob_rel, file_hash, size, info, body=None, tmp=None):
+        base = self.store.basedir
+        blob_abs = os.path.join(base, *blob_rel.split("/"))
+        if os.path.exists(blob_abs):
+            self._inc("cas/blob_reused")
+            self._inc("cas/bytes_deduplicated", size)
+        elif tmp:
+            self.move_into_store(tmp, blob_rel)
+            self._inc("cas/blob_new")
+        else:
+            self.write_into_store(body, blob_rel)
+            self._inc("cas/blob_new")
+
+        target = os.path.join(base, *rel_path.split("/"))
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target) and os.path.samefile(target, blob_abs):
+                return "hardlink"
+            tmp = target + ".cas-tmp"
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            os.link(blob_abs, tmp)
+            os.replace(tmp, target)
+            return "hardlink"
+        except OSError as e:
+            logger.debug("Hardlink %s -> %s failed (%s); recording in manifest", rel_path, blob_rel, e)
+            with open(os.path.join(base, self.cas_dir, "manifest.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"path": rel_path, "blob": blob_rel, "sha256": file_hash}) + "\n")
+            self._inc("cas/manifest_entries")
+            return "manifest"
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+
+def streamed_file(response):
+    request = getattr(response, "request", None)
+    if request is None or "streamed" not in response.flags:
+        return None
+    return request.meta.get("files_streamed")
+
+def body_head(response, size=4096):
+    streamed = streamed_file(response)
+    if streamed is None:
+        return response.body[:size]
+    with open(streamed["path"], "rb") as f:
+        return f.read(size)
+
+def content_length(value):
+    # None for a missing or malformed header, which then matches no size.
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
-    data = b""
+def discard(path):
     try:
-        with open(abs_path, "rb") as f:
-            data = f.read()
-    except Exception:
-        data = b""
-
-    size = len(data)
-    file_hash = sha256_bytes(data) if data else None
-
-    ct_hdr = response.headers.get(b"Content-Type", b"").decode("utf-8", errors="ignore")
-    guessed, _ = mimetypes.guess_type(abs_path)
-    mime = ct_hdr or (guessed or "application/octet-stream")
-
-    sf = {
-        "url": response.url,
-        "stored_file_path": rel_path,
-        "filesize_bytes": size,
-        "file_hash": file_hash,
-        "mime": mime,
-        "checksum": checksum,
-    }
-    item.setdefault("stored_files", []).append(sf)
-
-    kind = (
-        "pdf" if "pdf" in mime.lower()
-        else "docx" if "officedocument.wordprocessingml.document" in mime.lower()
-        else "doc" if "msword" in mime.lower()
-        else "html" if "html" in mime.lower()
-        else "bin"
-    )
-    types = set(item.get("content_types") or [])
-    types.add(kind)
-    item["content_types"] = list(types)
-
-    return checksum
+        os.unlink(path)
+    except OSError:
+        pass
 
 class MetadataPipeline:
     def process_item(self, item, spider):
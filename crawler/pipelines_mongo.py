@@ -1,33 +1,83 @@
 import os
 import time
-from typing import Any, Dict
+import logging
+from typing import Any, Dict, List, Tuple
 from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from twisted.internet import defer, task, threads
 
 # collection.create_index([("body_id", 1)])
 # collection.create_index([("body", 1)])
 
+logger = logging.getLogger(__name__)
+
+# MONGO_BULK_SIZE > 0 switches to buffered mode: upserts are collected and
+# written as unordered bulk_write calls in the reactor thread pool, flushed on
+# batch size or every MONGO_BULK_INTERVAL seconds. Once MONGO_BULK_MAX_PENDING
+# writes are buffered or in flight, items wait for the oldest flush.
 class MongoPipeline:
-    def __init__(self, uri: str, db_name: str, coll_name: str):
+    def __init__(self, uri: str, db_name: str, coll_name: str, batch_size: int = 0,
+                 flush_interval: float = 2.0, max_pending: int = 0, stats=None, metrics=None):
         self.uri = uri
         self.db_name = db_name
         self.coll_name = coll_name
         self.client = None
         self.coll = None
 
+        self.batch_size = max(0, int(batch_size or 0))
+        self.flush_interval = float(flush_interval or 0)
+        # 0 = four batches; a configured value is used as is, even below one
+        # batch, which then keeps a single flush in flight.
+        self.max_pending = int(max_pending or 0) or self.batch_size * 4
+        self.stats = stats
+        self.metrics = metrics
+        self._buffer: Dict[Tuple[Any, Any], UpdateOne] = {}
+        self._inflight: List[Tuple[defer.Deferred, int]] = []
+        self._waiting: List[defer.Deferred] = []
+        self._last_flush = time.monotonic()
+        self._timer = None
+
     @classmethod
     def from_crawler(cls, crawler):
         uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
         db = os.getenv("MONGO_DB", "kedra")
         coll = os.getenv("MONGO_COLLECTION", "decisions")
-        return cls(uri, db, coll)
+        s = crawler.settings
+        pipe = cls(
+            uri, db, coll,
+            batch_size=s.getint("MONGO_BULK_SIZE", 0),
+            flush_interval=s.getfloat("MONGO_BULK_INTERVAL", 2.0),
+            max_pending=s.getint("MONGO_BULK_MAX_PENDING", 0),
+            stats=crawler.stats,
+            metrics=getattr(crawler, "stage_metrics", None),
+        )
+        crawler.mongo_pipeline = pipe
+        return pipe
+
+    @property
+    def buffered(self):
+        return self.batch_size > 0
 
     def open_spider(self, spider):
         self.client = MongoClient(self.uri, connect=True)
         self.coll = self.client[self.db_name][self.coll_name]
         self.coll.create_index("identifier", unique=False)
         self.coll.create_index([("identifier", 1), ("detail_url", 1)], unique=True)
+        if self.buffered and self.flush_interval > 0:
+            self._timer = task.LoopingCall(self._flush_if_due)
+            self._timer.start(self.flush_interval, now=False)
+        if self.metrics is not None:
+            self.metrics.gauge("mongo_buffered", lambda: len(self._buffer))
+            self.metrics.gauge("mongo_inflight", lambda: sum(n for _, n in self._inflight))
 
+    @defer.inlineCallbacks
     def close_spider(self, spider):
+        if self._timer and self._timer.running:
+            self._timer.stop()
+        if self.buffered:
+            self._flush()
+            while self._inflight:
+                yield self._inflight[0][0]
         if self.client:
             self.client.close()
 
@@ -37,5 +87,92 @@ class MongoPipeline:
         doc["updated_at"] = now
         filt = {"identifier": doc.get("identifier"), "detail_url": doc.get("detail_url")}
         update = {"$set": doc, "$setOnInsert": {"first_seen": now}}
-        self.coll.update_one(filt, update, upsert=True)
+        if not self.buffered:
+            started = time.monotonic()
+            self.coll.update_one(filt, update, upsert=True)
+            if self.metrics is not None:
+                self.metrics.observe("mongo_upsert", time.monotonic() - started)
+            return item
+
+        # Same key twice in one unordered batch could race on the unique
+        # index, so the newest version of a document replaces the older one.
+        key = (filt["identifier"], filt["detail_url"])
+        self._buffer.pop(key, None)
+        self._buffer[key] = UpdateOne(filt, update, upsert=True)
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+
+        if self._pending() >= self.max_pending and self._inflight:
+            self._inc("mongo/backpressure_waits")
+            d = defer.Deferred()
+            self._inflight[0][0].addBoth(lambda r: (d.callback(item), r)[1])
+            return d
         return item
+
+    def written(self) -> defer.Deferred:
+        # Fires once the writes of every item processed so far are done.
+        # Failed writes are logged and counted in mongo/write_errors.
+        ds = [d for d, _ in self._inflight]
+        if self._buffer:
+            d = defer.Deferred()
+            self._waiting.append(d)
+            ds.append(d)
+        if not ds:
+            return defer.succeed(None)
+        return defer.DeferredList(ds, consumeErrors=True)
+
+    def _pending(self):
+        return len(self._buffer) + sum(n for _, n in self._inflight)
+
+    def _flush_if_due(self):
+        if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        ops = list(self._buffer.values())
+        waiting, self._buffer, self._waiting = self._waiting, {}, []
+        started = time.monotonic()
+
+        d = threads.deferToThread(self.coll.bulk_write, ops, ordered=False)
+        d.addCallbacks(self._flush_done, self._flush_failed,
+                       callbackArgs=(len(ops), started), errbackArgs=(len(ops),))
+        entry = (d, len(ops))
+        self._inflight.append(entry)
+        d.addBoth(lambda r: (self._inflight.remove(entry), r)[1])
+        for w in waiting:
+            d.addBoth(lambda r, w=w: (w.callback(None), r)[1])
+
+    def _flush_done(self, result, n, started):
+        elapsed = time.monotonic() - started
+        latency_ms = int(elapsed * 1000)
+        if self.metrics is not None:
+            self.metrics.observe("mongo_upsert", elapsed)
+        self._inc("mongo/flush_count")
+        self._inc("mongo/flush_items", n)
+        self._inc("mongo/flush_latency_ms_total", latency_ms)
+        if self.stats is not None:
+            self.stats.set_value("mongo/flush_latency_ms_last", latency_ms)
+            self.stats.max_value("mongo/flush_latency_ms_max", latency_ms)
+            self.stats.set_value("mongo/batch_size_last", n)
+            self.stats.max_value("mongo/batch_size_max", n)
+
+    def _flush_failed(self, failure, n):
+        self._inc("mongo/flush_failed")
+        err = failure.value
+        if isinstance(err, BulkWriteError):
+            write_errors = err.details.get("writeErrors") or []
+            self._inc("mongo/write_errors", len(write_errors))
+            self._inc("mongo/flush_items", n - len(write_errors))
+            for we in write_errors[:5]:
+                logger.error("Mongo bulk write error (code %s): %s", we.get("code"), we.get("errmsg"))
+        else:
+            self._inc("mongo/write_errors", n)
+            logger.error("Mongo bulk write of %d ops failed: %s", n, err)
+        return None
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
@@ -12,7 +12,13 @@ BOT_NAME = "crawler"
 SPIDER_MODULES = ["crawler.spiders"]
 NEWSPIDER_MODULE = "crawler.spiders"
 
-ADDONS = {}
+ADDONS = {
+    "crawler.lowmem.LowMemoryMode": 0,
+}
+
+# Disk-backed queues (JOBDIR) and dupefilter for long backfills, see
+# crawler/lowmem.py; set JOBDIR per crawl to resume it after a restart
+LOW_MEMORY = False
 
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
@@ -22,7 +28,9 @@ ADDONS = {}
 ROBOTSTXT_OBEY = True
 
 # Concurrency and throttling settings
-CONCURRENT_REQUESTS = 3
+# CONCURRENT_REQUESTS is the global cap; per-domain concurrency starts at
+# CONCURRENT_REQUESTS_PER_DOMAIN and is moved by AdaptiveConcurrencyMiddleware
+CONCURRENT_REQUESTS = 16
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
 # DOWNLOAD_DELAY = 1
 DOWNLOAD_TIMEOUT = 25
@@ -40,21 +48,49 @@ DEFAULT_REQUEST_HEADERS = {
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
-#    "crawler.middlewares.CrawlerSpiderMiddleware": 543,
-#}
+SPIDER_MIDDLEWARES = {
+    "crawler.frontier.FrontierAckMiddleware": 10,
+    "crawler.metrics.StageTimingMiddleware": 950,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
+    "crawler.frontier.FrontierAckMiddleware": 10,
+    "crawler.middlewares.PaginationCancelMiddleware": 50,
     "crawler.middlewares.UserRotationMiddleware": 400,
+    "crawler.throttle.AdaptiveConcurrencyMiddleware": 950,
+    "crawler.throttle.RateBudgetMiddleware": 960,
 }
 
+# AIMD per-slot concurrency and delay (see crawler/throttle.py)
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_MIN_CONCURRENCY = 1
+ADAPTIVE_MAX_CONCURRENCY = 8
+ADAPTIVE_TARGET_LATENCY = 2.0
+ADAPTIVE_INCREASE = 1
+ADAPTIVE_DECREASE = 0.5
+ADAPTIVE_MAX_DELAY = 60
+ADAPTIVE_BACKOFF_HTTP_CODES = [429, 503]
+# Give attachment downloads their own slot (and optionally a lower ceiling)
+ADAPTIVE_ATTACHMENT_SLOT = False
+ADAPTIVE_MAX_CONCURRENCY_ATTACHMENT = 0  # 0 = ADAPTIVE_MAX_CONCURRENCY
+# Hard cap on requests/s sent to the network (0 = off); scripts/backfill.py
+# shares one budget between its worker processes
+RATE_BUDGET_RPS = 0
+
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    "crawler.metrics.StageMetrics": 500,
+}
+
+# Stage latency histograms and queue gauges, written to METRICS_DIR as
+# metrics-<spider>.prom and/or .json (prometheus | json | both)
+METRICS_ENABLED = True
+METRICS_DIR = "logs"
+METRICS_INTERVAL = 15
+METRICS_FORMAT = "both"
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -64,9 +100,15 @@ ITEM_PIPELINES = {
     "crawler.pipelines_mongo.MongoPipeline": 400,
 }
 
+# Buffered Mongo upserts (0 = one blocking update_one per item)
+MONGO_BULK_SIZE = 100
+MONGO_BULK_INTERVAL = 2.0
+MONGO_BULK_MAX_PENDING = 1000
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-AUTOTHROTTLE_ENABLED = True
+# Superseded by AdaptiveConcurrencyMiddleware; do not enable both
+AUTOTHROTTLE_ENABLED = False
 # The initial download delay
 AUTOTHROTTLE_START_DELAY = 0.5
 # The maximum download delay to be set in case of high latencies
@@ -83,11 +125,45 @@ HTTPCACHE_ENABLED = True
 #HTTPCACHE_EXPIRATION_SECS = 0
 #HTTPCACHE_DIR = "httpcache"
 HTTPCACHE_IGNORE_HTTP_CODES = [429, 500, 502, 503, 504]
-#HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+HTTPCACHE_STORAGE = "crawler.httpcache.SqliteCacheStorage"
+HTTPCACHE_POLICY = "crawler.httpcache.ResourceTTLPolicy"
+# Per-resource freshness in seconds (0 = keep until evicted); attachments
+# are only cached with FILES_STREAM = False
+HTTPCACHE_TTL_SEARCH = 600
+HTTPCACHE_TTL_DETAIL = 7 * 24 * 3600
+HTTPCACHE_TTL_ATTACHMENT = 0
+HTTPCACHE_SQLITE_MAX_BYTES = 2 * 1024 ** 3
+HTTPCACHE_SQLITE_COMPRESS_LEVEL = 6
 
 # Set settings whose default value is deprecated to a future-proof value
 FEED_EXPORT_ENCODING = "utf-8"
 
 FILES_STORE = "data/landing"
 REDIRECT_ENABLED = True 
-MEDIA_ALLOW_REDIRECTS = True
\ No newline at end of file
+MEDIA_ALLOW_REDIRECTS = True
+
+# Content-addressed landing layout: one blob per distinct SHA-256, with the
+# partition/body/identifier paths hardlinked to it
+FILES_CAS_ENABLED = False
+FILES_CAS_DIR = "blobs"
+
+# Attachments already in stored_files: "revalidate" (conditional GET or
+# HEAD), "trust" (reuse without asking) or "off" (download again)
+FILES_FRESHNESS = "revalidate"
+
+# Attachments are written to FILES_STORE/.incoming as they download instead
+# of being held in memory, then renamed into place; FILES_MAX_SIZE caps one
+# attachment (0: DOWNLOAD_MAXSIZE)
+FILES_STREAM = True
+FILES_MAX_SIZE = 256 * 1024 ** 2
+DOWNLOAD_HANDLERS = {
+    "http": "crawler.streaming.StreamingDownloadHandler",
+    "https": "crawler.streaming.StreamingDownloadHandler",
+}
+
+# Shared Mongo crawl frontier for running several crawler processes on one
+# crawl: enable with SCHEDULER = "crawler.frontier.MongoFrontierScheduler"
+FRONTIER_COLLECTION = "frontier"
+FRONTIER_CRAWL_ID = None  # required with the frontier: a new id per crawl
+FRONTIER_LEASE_SECS = 300
+FRONTIER_MAX_ATTEMPTS = 3
@@ -1,12 +1,15 @@
-import os
-import re
-from urllib.parse import urlencode, urlparse
+import math
+from urllib.parse import urlencode
 
 import scrapy
-from crawler.items import CrawlerItem
-from crawler.utility import to_iso_date, normalize_identifier, unique_preserve, guess_identifier, prepare_search_query 
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import threads
+from crawler.items import CardState
+from crawler.known import KnownDecisions
+from crawler.utility import to_iso_date, card_identifier, unique_preserve, prepare_search_query
+from crawler.utility import parse_dmy, format_dmy, date_shards, result_total
 from typing import Optional
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 BODY_MAP = {
     1: "Equality Tribunal",
@@ -18,12 +21,40 @@ BODY_MAP = {
 class SearchSpider(scrapy.Spider):
     name = "search"
     allowed_domains = ["www.workplacerelations.ie"]
+    base_url = "https://www.workplacerelations.ie"
 
-    def __init__(self, date_from=None, date_to=None, body=None, *args, **kwargs):
+    def __init__(self, date_from=None, date_to=None, body=None, incremental=None, incremental_pages=1,
+                 shard="month", shard_max_pages=20, detail_policy="skip", prefetch_pages=4, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.date_from = date_from
         self.date_to = date_to
 
+        # shard=month|week|none: the window is split per body into shards that
+        # paginate concurrently; a shard whose first page reports more than
+        # shard_max_pages pages is halved again.
+        self.shard = (shard or "none").lower()
+        self.shard_max_pages = int(shard_max_pages or 0)
+
+        # incremental=1: skip cards MongoPipeline already stored and stop a
+        # body's pagination after `incremental_pages` pages of known cards.
+        self.incremental = str(incremental or "").lower() in ("1", "true", "yes")
+        self.incremental_pages = max(1, int(incremental_pages or 1))
+
+        # prefetch_pages=K: page 1's result count gives the last page and all
+        # the others are requested at once; without a count, K pages ahead are
+        # kept in flight until one comes back empty. 0 walks one page at a
+        # time, as incremental runs always do (they stop on page contents).
+        self.prefetch_pages = max(0, int(prefetch_pages or 0))
+        self.last_pages = {}
+
+        # detail_policy=skip: no detail request for a decision Mongo already
+        # holds with file_urls. revalidate: always ask, but conditionally with
+        # the stored ETag/Last-Modified, reusing stored attachments on 304.
+        # always: unconditional detail fetches.
+        self.detail_policy = (detail_policy or "always").lower()
+        needs_lookup = self.incremental or self.detail_policy in ("skip", "revalidate")
+        self.known = KnownDecisions.from_env() if needs_lookup else None
+
         if body:
             try:
                 self.body_ids = [int(x.strip()) for x in str(body).split(",") if x.strip()]
@@ -33,6 +64,16 @@ class SearchSpider(scrapy.Spider):
         else:
             self.body_ids = list(BODY_MAP.keys())
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if crawler.settings.getbool("LOW_MEMORY") and spider.prefetch_pages:
+            # Fanned-out pages are fetched ahead of their cards' details,
+            # which would then pile up in the queues.
+            spider.logger.info("LOW_MEMORY: walking search pages one at a time")
+            spider.prefetch_pages = 0
+        return spider
+
     def add_args(self, body_id: Optional[int], date_from: Optional[str], date_to: Optional[str], page: int, q: Optional[str] = None):
         params = {"decisions": "1"}
         if date_from:
@@ -45,51 +86,111 @@ class SearchSpider(scrapy.Spider):
             params["pageNumber"] = str(page)
         if q:
             params["q"] = q
-        return "https://www.workplacerelations.ie/en/search/?" + urlencode(params)
+        return f"{self.base_url}/en/search/?" + urlencode(params)
+
+    def search_request(self, body_id, body_name, date_from, date_to, page=1, q=None, priority=0, **extra):
+        url = self.add_args(body_id=body_id, date_from=date_from, date_to=date_to, page=page, q=q)
+        return scrapy.Request(
+            url,
+            callback=self.parse,
+            priority=priority,
+            cb_kwargs={
+                "date_from": date_from,
+                "date_to": date_to,
+                "body_id": body_id,
+                "body_name": body_name,
+                "page": page,
+                "q": q,
+                **extra,
+            },
+        )
+
+    def shard_windows(self):
+        start, end = parse_dmy(self.date_from), parse_dmy(self.date_to)
+        if self.shard not in ("month", "week") or not start or not end or start > end:
+            return [(self.date_from, self.date_to)]
+        return [(format_dmy(s), format_dmy(e)) for s, e in date_shards(start, end, self.shard)]
 
     def start_requests(self):
-        for body_id in self.body_ids:
-            body_name = BODY_MAP.get(body_id, str(body_id))
-            url = self.add_args(body_id=body_id, date_from=self.date_from, date_to=self.date_to, page=1, q=None)
-            yield scrapy.Request(
-                url,
-                callback=self.parse,
-                cb_kwargs={
-                    "date_from": self.date_from,
-                    "date_to": self.date_to,
-                    "body_id": body_id,
-                    "body_name": body_name,
-                    "page": 1,
-                    "q": None,
-                },
-            )
+        windows = self.shard_windows()
+        self.crawler.stats.set_value("shard/initial", len(windows) * len(self.body_ids))
+        for date_from, date_to in windows:
+            for body_id in self.body_ids:
+                body_name = BODY_MAP.get(body_id, str(body_id))
+                yield self.search_request(body_id, body_name, date_from, date_to, page=1, q=None)
+
+    async def start(self):
+        # Scrapy releases after 2.13 no longer fall back to start_requests().
+        for request in self.start_requests():
+            yield request
+
+    def split_shard(self, total, count, body_id, body_name, date_from, date_to, q):
+        # Page 1 of a shard that is still too long: halve the date range and
+        # start both halves from page 1 instead of walking one long chain.
+        if not self.shard_max_pages or self.shard == "none":
+            return None
+        start, end = parse_dmy(date_from), parse_dmy(date_to)
+        if not start or not end or start >= end or not total:
+            return None
+        pages = math.ceil(total / count)
+        if pages <= self.shard_max_pages:
+            return None
+        mid = start + (end - start) // 2
+        self.logger.info("Splitting shard %s-%s for body %s (%d results, ~%d pages)",
+                         date_from, date_to, body_name or "ALL", total, pages)
+        self.crawler.stats.inc_value("shard/split")
+        return [
+            self.search_request(body_id, body_name, format_dmy(s), format_dmy(e), page=1, q=q)
+            for s, e in ((start, mid), (mid + timedelta(days=1), end))
+        ]
+
+    def closed(self, reason):
+        if self.known:
+            self.known.close()
+
+    def card_identity(self, response, s):
+        title_a = s.css("h3 a::attr(href)").get() or s.css("a::attr(href)").get()
+        title_txt = (s.css("h3 a::text").get() or s.css("a::text").get() or "").strip()
+        detail_url = response.urljoin(title_a) if title_a else None
 
-    def parse(self, response, body_id=None, body_name=None, date_from=None, date_to=None, page=1, q=None, **kwargs):
+        identifier = card_identifier(detail_url, title_txt)
+        return title_txt, detail_url, identifier
+
+    async def parse(self, response, body_id=None, body_name=None, date_from=None, date_to=None, page=1, q=None, known_streak=0,
+              pagination=None, result_count=None, page_size=None, **kwargs):
         items_sel = response.css("li.each-item")
         count = len(items_sel)
         self.logger.info("Found %d items on page %s for body %s", count, page, body_name or "ALL")
         if count == 0:
+            if pagination == "prefetch":
+                key = (body_id, date_from, date_to, q)
+                self.last_pages[key] = min(self.last_pages.get(key, page), page - 1)
+                self.crawler.stats.inc_value("pagination/prefetch_empty")
             return
 
-        for s in items_sel:
-            title_a = s.css("h3 a::attr(href)").get() or s.css("a::attr(href)").get()
-            title_txt = (s.css("h3 a::text").get() or s.css("a::text").get() or "").strip()
+        total = self.result_total(response, count) if page == 1 else None
+        if page == 1:
+            halves = self.split_shard(total, count, body_id, body_name, date_from, date_to, q)
+            if halves:
+                for request in halves:
+                    yield request
+                return
+
+        cards = [(s,) + self.card_identity(response, s) for s in items_sel]
+        known = {}
+        if self.known:
+            known = await self.lookup_known([(ident, detail_url or "") for _, _, detail_url, ident in cards])
+            all_known = all((ident, detail_url or "") in known for _, _, detail_url, ident in cards)
+            known_streak = known_streak + 1 if all_known else 0
+
+        for s, title_txt, detail_url, identifier in cards:
+            prev = known.get((identifier, detail_url or ""))
+            if prev is not None and self.incremental:
+                self.crawler.stats.inc_value("incremental/known_skipped")
+                continue
+
             date_txt = (s.css("time::text, .date::text").get() or "").strip()
             desc_txt = (s.css(".summary::text, .teaser::text, p::text").get() or "").strip()
-            detail_url = response.urljoin(title_a) if title_a else None
-
-            ident = normalize_identifier(detail_url or "", title_txt)
-            if not ident or ident == "NOID":
-                g = guess_identifier(f"{title_txt} {detail_url or ''}")
-                ident = g if g else ident
-            if not ident or ident == "NOID":
-                seg = ""
-                if detail_url:
-                    seg = os.path.basename(urlparse(detail_url).path)
-                    seg = re.sub(r"\.(html?|pdf|docx?)$", "", seg, flags=re.IGNORECASE)
-                    seg = re.sub(r"[^A-Za-z0-9\-]+", "-", seg).strip("-")
-                ident = (seg or "NOID").upper()
-            identifier = ident.replace("/", "-").replace("\\", "-").strip()
 
             decision_date, part_yyyy_mm = to_iso_date(date_txt)
 
@@ -102,8 +203,6 @@ class SearchSpider(scrapy.Spider):
             if not initial_files and detail_url:
                 initial_files = [detail_url]
 
-            item = CrawlerItem()
-
             if not identifier or identifier.upper() == "NOID":
                 if not initial_files and not detail_url:
                     self.logger.warning("Dropping: missing identifier and no files (%s)", response.url)
@@ -111,70 +210,177 @@ class SearchSpider(scrapy.Spider):
                     return
                 identifier = ("NOID-" + str(abs(hash(detail_url or title_txt)))).upper()
 
-            item["identifier"] = identifier
-
-            item["title"] = (title_txt or "").strip() or identifier
-            item["description"] = (desc_txt or "").strip()
-            item["decision_date_raw"] = (date_txt or "").strip()
-
             if decision_date:
-                item["decision_date"] = decision_date
-                item["partition_date"] = part_yyyy_mm
+                partition_date = part_yyyy_mm
             else:
                 try:
                     d, m, y = (date_from or "").split("/")
-                    item["partition_date"] = f"{y}-{int(m):02d}"
+                    partition_date = f"{y}-{int(m):02d}"
                 except Exception:
-                    item["partition_date"] = datetime.now(timezone.utc).strftime("%Y-%m")
+                    partition_date = datetime.now(timezone.utc).strftime("%Y-%m")
+
+            card = CardState(
+                identifier=identifier,
+                title=(title_txt or "").strip() or identifier,
+                description=(desc_txt or "").strip(),
+                decision_date_raw=(date_txt or "").strip(),
+                decision_date=decision_date or None,
+                partition_date=partition_date,
+                source_url=detail_url or response.url,
+                detail_url=detail_url or "",
+            )
 
             if body_id is None or body_name is None:
                 self.logger.warning("Missing body info for %s; defaulting to unknown", identifier)
                 self.crawler.stats.inc_value("search/missing_body_info")
-            item["body_id"] = int(body_id) if body_id is not None else -1
-            item["body"]    = str(body_name) if body_name is not None else "unknown"
-
-            item["source_url"] = detail_url or response.url
-            item["detail_url"] = detail_url or ""
 
-            if detail_url:
+            stored_files = (prev or {}).get("file_urls") or []
+            if detail_url and stored_files and self.detail_policy == "skip":
+                self.crawler.stats.inc_value("detail/fetch_avoided")
+                item = self.card_item(card, body_id, body_name)
+                item["file_urls"] = unique_preserve(initial_files + list(stored_files))
+                yield item
+            elif detail_url:
+                headers, meta = {}, {}
+                validators = (prev or {}).get("detail_validators") or {}
+                if stored_files and self.detail_policy == "revalidate" and validators:
+                    if validators.get("etag"):
+                        headers["If-None-Match"] = validators["etag"]
+                    if validators.get("last_modified"):
+                        headers["If-Modified-Since"] = validators["last_modified"]
+                    meta["handle_httpstatus_list"] = [304]
+                    self.crawler.stats.inc_value("detail/conditional_sent")
+                # Details go ahead of chained search pages (priority 0), so a
+                # shard walked page by page keeps at most one page of cards
+                # pending. Pages fanned out by next_pages (priority 2) go
+                # first; LOW_MEMORY turns that off.
                 yield scrapy.Request(
                     detail_url,
                     callback=self.parse_detail,
                     errback=self.on_detail_error,
+                    headers=headers or None,
+                    meta=meta or None,
+                    priority=1,
                     cb_kwargs={
-                        "base_item": item,
-                        "seed_file_urls": unique_preserve(initial_files),
-                        "date_from": date_from,
-                        "date_to": date_to,
+                        "card": card,
+                        "seed_file_urls": tuple(unique_preserve(initial_files)),
                         "body_id": body_id,
                         "body_name": body_name,
+                        "stored_file_urls": tuple(stored_files) if headers else None,
                     },
                 )
             else:
                 files = unique_preserve(initial_files)
                 if not files:
-                    self.logger.warning("Dropping %s: no detail_url and no files", item["identifier"])
+                    self.logger.warning("Dropping %s: no detail_url and no files", identifier)
                     self.crawler.stats.inc_value("search/dropped_no_files")
                     return
+                item = self.card_item(card, body_id, body_name)
                 item["file_urls"] = files
                 yield item
 
-        next_page = (page or 1) + 1
-        next_url = self.add_args(body_id, date_from, date_to, page=next_page, q=q)
-        yield scrapy.Request(
-            next_url,
-            callback=self.parse,
-            cb_kwargs={
-                "body_id": body_id,
-                "body_name": body_name,
-                "date_from": date_from,
-                "date_to": date_to,
-                "page": next_page,
-                "q": q,
-            },
-        )
+        if self.incremental and known_streak >= self.incremental_pages:
+            self.logger.info("Stopping pagination for body %s at page %s: %d page(s) of known decisions",
+                             body_name or "ALL", page, known_streak)
+            self.crawler.stats.inc_value("incremental/pagination_stopped")
+            return
+
+        if self.incremental or not self.prefetch_pages:
+            yield self.search_request(body_id, body_name, date_from, date_to, page=(page or 1) + 1, q=q,
+                                      known_streak=known_streak)
+            return
+        for request in self.next_pages(body_id, body_name, date_from, date_to, q, page or 1, count,
+                                       total or result_count, pagination, page_size):
+            yield request
+
+    # The "Showing 1 - 10 of 95 results" line. Pages without one of these
+    # are searched outside the result cards, whose summaries may quote
+    # counts of their own ("... of 3 decisions").
+    RESULT_COUNT_CSS = ".results-count, .result-count, .search-results-count, .results-summary"
+    RESULT_COUNT_XPATH = ("//body//text()[not(ancestor::li[contains(concat(' ', normalize-space(@class), ' '), ' each-item ')])"
+                          " and not(ancestor::script) and not(ancestor::style)]")
+
+    def result_total(self, response, count):
+        texts = response.css(self.RESULT_COUNT_CSS).xpath(".//text()").getall()
+        total = result_total(" ".join(texts or response.xpath(self.RESULT_COUNT_XPATH).getall()))
+        if total is not None and total < count:
+            # Fewer results than page 1 shows: not the result count.
+            self.crawler.stats.inc_value("pagination/count_ignored")
+            return None
+        return total
+
+    async def lookup_known(self, keys):
+        # Mongo round trip in the reactor's thread pool, not on the reactor.
+        return await maybe_deferred_to_future(
+            threads.deferToThread(self.known.lookup, keys, ("file_urls", "detail_validators")))
+
+    def next_pages(self, body_id, body_name, date_from, date_to, q, page, count, total, pagination, page_size):
+        chain = (body_id, body_name, date_from, date_to)
+        if page == 1 and total:
+            # Ahead of the detail requests, so the listing is not held back
+            # until every card found so far has been fetched. Shard splitting
+            # bounds the pages, and so the cards, this leaves pending.
+            last = math.ceil(total / count)
+            self.crawler.stats.inc_value("pagination/pages_from_count", max(0, last - 1))
+            for p in range(2, last + 1):
+                yield self.search_request(*chain, page=p, q=q, priority=2,
+                                          pagination="count", result_count=total, page_size=count)
+        elif page == 1:
+            for p in range(2, 2 + self.prefetch_pages):
+                yield self.search_request(*chain, page=p, q=q, priority=2, pagination="prefetch")
+        elif pagination == "prefetch":
+            # One more page ahead for each page that had results.
+            nxt = page + self.prefetch_pages
+            if nxt <= self.last_pages.get((body_id, date_from, date_to, q), nxt):
+                yield self.search_request(*chain, page=nxt, q=q, priority=2, pagination="prefetch")
+        elif pagination == "count":
+            # More results by the last page than page 1 announced: the count
+            # was stale, so carry on one page at a time.
+            if page >= math.ceil(total / page_size) and (page - 1) * page_size + count > total:
+                self.crawler.stats.inc_value("pagination/count_exceeded")
+                yield self.search_request(*chain, page=page + 1, q=q, pagination="chain")
+        else:
+            yield self.search_request(*chain, page=page + 1, q=q, pagination="chain")
+
+    def beyond_last_page(self, request):
+        # Prefetched pages past an empty one; PaginationCancelMiddleware drops
+        # them before they are downloaded.
+        kw = request.cb_kwargs
+        if kw.get("pagination") != "prefetch":
+            return False
+        last = self.last_pages.get((kw.get("body_id"), kw.get("date_from"), kw.get("date_to"), kw.get("q")))
+        return last is not None and kw.get("page", 0) > last
+
+    def card_item(self, card, body_id, body_name):
+        item = card.to_item()
+        item["body_id"] = int(body_id) if body_id is not None else -1
+        item["body"] = str(body_name) if body_name is not None else "unknown"
+        return item
+
+    def parse_detail(self, response, card=None, seed_file_urls=(), body_id=None, body_name=None,
+                     stored_file_urls=None, base_item=None, **kwargs):
+        # base_item: requests queued (JOBDIR, frontier) before CardState.
+        base_item = card.to_item() if card is not None else base_item
+        if response.status == 304 and stored_file_urls:
+            self.crawler.stats.inc_value("detail/fetch_avoided")
+            self.crawler.stats.inc_value("detail/not_modified")
+            item = base_item
+            item["file_urls"] = unique_preserve(list(seed_file_urls) + list(stored_file_urls))
+            item["body_id"] = int(body_id) if body_id is not None else None
+            item["body"] = str(body_name) if body_name is not None else None
+            yield item
+            return
+
+        validators = {}
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag:
+            validators["etag"] = etag.decode("latin-1")
+        if last_modified:
+            validators["last_modified"] = last_modified.decode("latin-1")
+        if validators:
+            base_item["detail_validators"] = validators
 
-    def parse_detail(self, response, base_item, seed_file_urls, date_from, date_to, body_id, body_name, **kwargs):
         attach = []
         for href in response.css('a::attr(href)').getall():
             full = response.urljoin(href)
@@ -192,7 +398,9 @@ class SearchSpider(scrapy.Spider):
     def on_detail_error(self, failure):
         request = failure.request
         kw = request.cb_kwargs or {}
-        base_item = kw.get("base_item")
+        card = kw.get("card")
+        base_item = (self.card_item(card, kw.get("body_id"), kw.get("body_name"))
+                     if card is not None else kw.get("base_item"))
         seed_files = kw.get("seed_file_urls") or []
 
         self.logger.warning("Detail request failed for %s (%s). Using seed files only.",
@@ -0,0 +1,216 @@
+import os
+import hashlib
+import inspect
+import logging
+import tempfile
+from functools import partial
+import scrapy
+from scrapy.core.downloader.handlers import http11
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.defer import deferred_from_coro
+from twisted.internet import defer
+
+try:
+    from scrapy.exceptions import ResponseDataLossError  # Scrapy >= 2.14
+    WRAPS_EXCEPTIONS = True
+except ImportError:
+    from twisted.web.client import ResponseFailed as ResponseDataLossError
+    WRAPS_EXCEPTIONS = False
+try:
+    from scrapy.utils._download_handlers import wrap_twisted_exceptions
+except ImportError:
+    wrap_twisted_exceptions = None
+
+# Public up to Scrapy 2.13.
+ScrapyAgent = getattr(http11, "_ScrapyAgent", None) or getattr(http11, "ScrapyAgent", None)
+
+logger = logging.getLogger(__name__)
+
+def missing_internals():
+    # The private parts of Scrapy's HTTP/1.1 handler that streaming hooks
+    # into. Any of them may move in a Scrapy release; without them downloads
+    # are buffered as usual instead of failing.
+    missing = []
+    if not callable(getattr(ScrapyAgent, "_cb_bodyready", None)):
+        missing.append("ScrapyAgent._cb_bodyready")
+    reader = getattr(http11, "_ResponseReader", None)
+    if reader is None or "_bodybuf" not in reader.__init__.__code__.co_names:
+        missing.append("_ResponseReader._bodybuf")
+    if WRAPS_EXCEPTIONS and wrap_twisted_exceptions is None:
+        missing.append("scrapy.utils._download_handlers.wrap_twisted_exceptions")
+    return missing
+
+class StreamingDownloadHandler(HTTP11DownloadHandler):
+    # HTTP(S) handler that writes 200 bodies of requests carrying
+    # meta["files_stream"] (a directory) to a temp file there, hashing as the
+    # chunks arrive, instead of holding them in memory. The response comes
+    # back with an empty body and the "streamed" flag; the file is described
+    # in meta["files_streamed"] (path, size, sha256, md5) for the pipeline
+    # to move into place.
+    #
+    # Downloads go through the stock agent and body reader, so timeouts,
+    # proxies, DOWNLOAD_BIND_ADDRESS, download_maxsize/download_warnsize and
+    # download_fail_on_dataloss behave as for any other request. A streamed
+    # body cut short is only kept when data loss is allowed.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        missing = missing_internals() + [f"HTTP11DownloadHandler.{a}" for a in (
+            "_contextFactory", "_pool", "_default_maxsize", "_default_warnsize", "_fail_on_dataloss", "_crawler",
+        ) if not hasattr(self, a)]
+        self.streaming = not missing
+        if missing:
+            logger.warning("Scrapy %s lacks %s; attachments are buffered in memory instead of streamed",
+                           scrapy.__version__, ", ".join(missing))
+
+    def download_request(self, request, spider=None):
+        if not self.streams(request):
+            if inspect.iscoroutinefunction(super().download_request):
+                return deferred_from_coro(super().download_request(request))
+            return super().download_request(request, spider)
+        return self.stream(request)
+
+    def streams(self, request):
+        return (self.streaming and bool(request.meta.get("files_stream"))
+                and request.method == "GET" and not request.meta.get("proxy"))
+
+    def stream(self, request):
+        kwargs = {}
+        if hasattr(self, "_tls_verbose_logging"):
+            kwargs["tls_verbose_logging"] = self._tls_verbose_logging
+        agent = _StreamingAgent(
+            contextFactory=self._contextFactory,
+            bindAddress=getattr(self, "_bind_address", None),
+            pool=self._pool,
+            maxsize=self._default_maxsize,
+            warnsize=self._default_warnsize,
+            fail_on_dataloss=self._fail_on_dataloss,
+            crawler=self._crawler,
+            **kwargs,
+        )
+        d = agent.download_request(request)
+        if WRAPS_EXCEPTIONS:
+            d.addErrback(_wrap_twisted_exceptions)
+        return d
+
+def _wrap_twisted_exceptions(failure):
+    # What the stock handler does around the agent since Scrapy 2.14, so
+    # RetryMiddleware sees the same exceptions on both paths.
+    with wrap_twisted_exceptions():
+        failure.raiseException()
+
+class _StreamingAgent(ScrapyAgent or object):
+    # The stock agent, except that a plain 200 body is delivered into a
+    # _Spool file instead of the reader's in-memory buffer. (Without an
+    # agent to extend, missing_internals() keeps it from being used.)
+    def _cb_bodyready(self, txresponse, request):
+        encoding = txresponse.headers.getRawHeaders(b"Content-Encoding") or [b"identity"]
+        if txresponse.code != 200 or encoding[-1].lower() not in (b"identity", b""):
+            return super()._cb_bodyready(txresponse, request)
+        try:
+            spool = _Spool(request.meta["files_stream"])
+        except OSError as e:
+            logger.warning("Cannot stream %s to disk (%s); buffering it", request.url, e)
+            return super()._cb_bodyready(txresponse, request)
+
+        deliver = txresponse.deliverBody
+        txresponse.deliverBody = partial(_deliver_to, spool, deliver)
+        try:
+            result = super()._cb_bodyready(txresponse, request)
+        except Exception:
+            spool.discard()
+            self._count_too_large(request, txresponse.length)
+            raise
+        if not isinstance(result, defer.Deferred):
+            # Empty body or a stopped download: nothing was written.
+            spool.discard()
+            return result
+        return result.addCallbacks(self._cb_streamed, self._eb_streamed,
+                                   callbackArgs=(request, spool), errbackArgs=(request, spool))
+
+    def _cb_streamed(self, result, request, spool):
+        try:
+            info = spool.finish()
+        except OSError:
+            spool.discard()
+            raise
+        flags = list(result.get("flags") or [])
+        if "partial" in flags and request.meta.get("download_fail_on_dataloss", self._fail_on_dataloss):
+            # No Content-Length and the connection closed: the file may be
+            # truncated, and unlike a buffered page it would be stored as is.
+            spool.discard()
+            raise ResponseDataLossError(f"{request.url}: connection closed before the body was known to be complete")
+        request.meta["files_streamed"] = info
+        return dict(result, flags=flags + ["streamed"])
+
+    def _eb_streamed(self, failure, request, spool):
+        spool.discard()
+        self._count_too_large(request, spool.size)
+        return failure
+
+    def _count_too_large(self, request, size):
+        maxsize = request.meta.get("download_maxsize", self._maxsize)
+        stats = getattr(self._crawler, "stats", None)
+        if stats is not None and maxsize and isinstance(size, int) and size > maxsize:
+            stats.inc_value("files/too_large")
+
+def _deliver_to(spool, deliver, reader):
+    # The stock reader only ever write()s, truncate()s and getvalue()s its
+    # body buffer, which is what _Spool implements.
+    reader._bodybuf = spool
+    deliver(reader)
+
+class _Spool:
+    # Writes are buffered up to chunk_size, so memory stays at roughly one
+    # chunk per download whatever the file size. A failed write is kept and
+    # raised by finish(), once the reader is done with the connection.
+    chunk_size = 64 * 1024
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix=".part-", dir=directory)
+        os.fchmod(fd, 0o644)
+        self.file = os.fdopen(fd, "wb", buffering=self.chunk_size)
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self.size = 0
+        self.error = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.error is not None or self.file.closed:
+            return
+        try:
+            self.file.write(data)
+        except OSError as e:
+            self.error = e
+            return
+        self.sha256.update(data)
+        self.md5.update(data)
+
+    def truncate(self, size=None):
+        # The reader is over download_maxsize and about to cancel.
+        self.discard()
+
+    def getvalue(self):
+        return b""
+
+    def finish(self):
+        if not self.file.closed:
+            try:
+                self.file.close()
+            except OSError as e:
+                self.error = self.error or e
+        if self.error is not None:
+            raise self.error
+        return {"path": self.path, "size": self.size, "sha256": self.sha256.hexdigest(), "md5": self.md5.hexdigest()}
+
+    def discard(self):
+        if not self.file.closed:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,197 @@
+import time
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.task import deferLater
+from crawler.httpcache import resource_kind
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveConcurrencyMiddleware:
+    # AIMD control of each downloader slot, replacing AutoThrottle (which only
+    # moves the delay). Concurrency grows by ADAPTIVE_INCREASE once a full
+    # window of responses (one per allowed in-flight request) came back under
+    # ADAPTIVE_TARGET_LATENCY; a slow response or a timeout cuts it by
+    # ADAPTIVE_DECREASE, at most once per window. 429/503 cut concurrency to
+    # the minimum and raise the slot delay to Retry-After (or double it), so
+    # the retries RetryMiddleware schedules go out no earlier than asked.
+    #
+    # Sits after RetryMiddleware and HttpCacheMiddleware so it sees raw
+    # network responses; cache hits carry no download_latency and are ignored.
+    def __init__(self, crawler):
+        s = crawler.settings
+        if not s.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_conc = s.getint("ADAPTIVE_MIN_CONCURRENCY", 1)
+        self.max_conc = s.getint("ADAPTIVE_MAX_CONCURRENCY", 8)
+        self.max_conc_files = s.getint("ADAPTIVE_MAX_CONCURRENCY_ATTACHMENT", 0) or self.max_conc
+        self.split_files = s.getbool("ADAPTIVE_ATTACHMENT_SLOT", False)
+        self.target = s.getfloat("ADAPTIVE_TARGET_LATENCY", 2.0)
+        self.increase = s.getint("ADAPTIVE_INCREASE", 1)
+        self.decrease = s.getfloat("ADAPTIVE_DECREASE", 0.5)
+        self.min_delay = s.getfloat("DOWNLOAD_DELAY", 0.0)
+        self.max_delay = s.getfloat("ADAPTIVE_MAX_DELAY", 60.0)
+        self.backoff_codes = set(s.getlist("ADAPTIVE_BACKOFF_HTTP_CODES", [429, 503]))
+        self.state = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request, spider):
+        # Optional separate budget: attachments get their own slot per host,
+        # so slow PDF transfers do not hold back search and detail pages.
+        if self.split_files and "download_slot" not in request.meta and resource_kind(request) == "attachment":
+            request.meta["download_slot"] = f"{urlparse(request.url).hostname}#files"
+        return None
+
+    def process_response(self, request, response, spider):
+        latency = request.meta.get("download_latency")
+        key, slot = self._slot(request)
+        if latency is None or slot is None:
+            return response
+        st = self._state(key)
+        now = time.time()
+        if response.status in self.backoff_codes:
+            wait = retry_after(response.headers.get(b"Retry-After"))
+            self._backoff(key, slot, st, now, wait)
+            self.stats.inc_value(f"adaptive/backoff/{response.status}")
+        elif response.status >= 500 or latency > self.target:
+            self._cut(key, slot, st, now)
+        else:
+            self._grow(key, slot, st, now)
+        self._publish(key, slot)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key, slot = self._slot(request)
+        if slot is not None:
+            self._cut(key, slot, self._state(key), time.time())
+            self.stats.inc_value("adaptive/exception")
+            self._publish(key, slot)
+        return None
+
+    def _slot(self, request):
+        key = request.meta.get("download_slot")
+        if key is None or self.crawler.engine is None:
+            return None, None
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def _state(self, key):
+        st = self.state.get(key)
+        if st is None:
+            st = self.state[key] = {"ok": 0, "last_cut": 0.0, "cooldown_until": 0.0}
+        return st
+
+    def _ceiling(self, key):
+        return self.max_conc_files if key.endswith("#files") else self.max_conc
+
+    def _grow(self, key, slot, st, now):
+        if now < st["cooldown_until"]:
+            return
+        if slot.delay > self.min_delay:
+            # Pay back the backoff delay before adding concurrency.
+            slot.delay = max(self.min_delay, slot.delay / 2 if slot.delay > 0.05 else 0.0)
+            return
+        st["ok"] += 1
+        if st["ok"] >= slot.concurrency and slot.concurrency < self._ceiling(key):
+            slot.concurrency = min(self._ceiling(key), slot.concurrency + self.increase)
+            st["ok"] = 0
+            self.stats.inc_value("adaptive/increase")
+
+    def _cut(self, key, slot, st, now):
+        st["ok"] = 0
+        # One cut per window: the responses already in flight were sent at
+        # the old concurrency and would otherwise cut it again.
+        if now - st["last_cut"] < max(self.target, slot.delay):
+            return
+        st["last_cut"] = now
+        new = max(self.min_conc, int(slot.concurrency * self.decrease))
+        if new < slot.concurrency:
+            slot.concurrency = new
+            self.stats.inc_value("adaptive/decrease")
+
+    def _backoff(self, key, slot, st, now, wait):
+        st["ok"] = 0
+        st["last_cut"] = now
+        slot.concurrency = self.min_conc
+        delay = wait if wait is not None else max(1.0, slot.delay * 2)
+        slot.delay = min(self.max_delay, max(slot.delay, delay))
+        st["cooldown_until"] = now + slot.delay
+        self.stats.inc_value("adaptive/decrease")
+        if wait is not None:
+            self.stats.max_value("adaptive/retry_after_max_s", wait)
+        logger.info("Slot %s backing off: concurrency=%d delay=%.1fs", key, slot.concurrency, slot.delay)
+
+    def _publish(self, key, slot):
+        self.stats.set_value(f"adaptive/{key}/concurrency", slot.concurrency)
+        self.stats.set_value(f"adaptive/{key}/delay_ms", int(slot.delay * 1000))
+        self.stats.max_value(f"adaptive/{key}/concurrency_max", slot.concurrency)
+
+def retry_after(value):
+    # Retry-After is either delta-seconds or an HTTP date.
+    if not value:
+        return None
+    value = value.decode("latin-1").strip() if isinstance(value, bytes) else str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RateBudget:
+    # Evenly spaced send times at `rate` requests/s: each caller reserves the
+    # next free time and waits until then. `next_at` and `lock` may be a
+    # multiprocessing Value("d") and Lock, so several crawler processes share
+    # one budget (scripts/backfill.py); by default they are process-local.
+    def __init__(self, rate, next_at=None, lock=None):
+        self.interval = 1.0 / rate
+        self.next_at = next_at if next_at is not None else _LocalValue()
+        self.lock = lock if lock is not None else threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.time()
+            at = max(now, self.next_at.value)
+            self.next_at.value = at + self.interval
+        return at - now
+
+class _LocalValue:
+    value = 0.0
+
+_shared_budget = None
+
+def share_rate_budget(next_at, lock):
+    # Called by a worker process before its crawls start.
+    global _shared_budget
+    _shared_budget = (next_at, lock)
+
+class RateBudgetMiddleware:
+    # Global cap of RATE_BUDGET_RPS requests/s on everything that reaches the
+    # network, across all slots (and, via share_rate_budget, processes).
+    # Sits after HttpCacheMiddleware so cache hits are not held back.
+    def __init__(self, crawler):
+        rate = crawler.settings.getfloat("RATE_BUDGET_RPS", 0)
+        if rate <= 0:
+            raise NotConfigured
+        self.stats = crawler.stats
+        self.budget = RateBudget(rate, *(_shared_budget or ()))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    async def process_request(self, request, spider):
+        wait = self.budget.reserve()
+        if wait > 0:
+            from twisted.internet import reactor
+            self.stats.inc_value("rate_budget/delayed")
+            self.stats.inc_value("rate_budget/wait_ms", int(wait * 1000))
+            await maybe_deferred_to_future(deferLater(reactor, wait, lambda: None))
+        return None
@@ -1,9 +1,10 @@
 import hashlib
 import os
 import re
+from functools import lru_cache
 from urllib.parse import urlparse
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Tuple
 
 def sha256_bytes(b: bytes):
     h = hashlib.sha256()
@@ -26,6 +27,29 @@ def safe_ext_from_ct(content_type: str, url: str):
             return ext if ext != ".htm" else ".html"
     return ".bin"
 
+def sniff_mime(body: bytes):
+    head = body[:512]
+    if head.startswith(b"%PDF"):
+        return "application/pdf"
+    if head.startswith(b"\xd0\xcf\x11\xe0"):
+        return "application/msword"
+    if head.startswith(b"PK\x03\x04") and b"word/" in body[:4096]:
+        return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    low = head.lstrip().lower()
+    if low.startswith((b"<!doctype html", b"<html")) or b"<html" in low:
+        return "text/html"
+    return None
+
+def content_kind(mime: str):
+    low = (mime or "").lower()
+    return (
+        "pdf" if "pdf" in low
+        else "docx" if "officedocument.wordprocessingml.document" in low
+        else "doc" if "msword" in low
+        else "html" if "html" in low
+        else "bin"
+    )
+
 def to_iso_date(raw: str):
     if not raw:
         return None, None
@@ -38,25 +62,83 @@ def to_iso_date(raw: str):
             continue
     return None, None
 
-ID_PATTERNS = [re.compile(r"\b(ADJ-\d{5,})\b", re.IGNORECASE), re.compile(r"\b(IR-SC-\d{5,})\b", re.IGNORECASE), re.compile(r"\b(LCR-\d{5,})\b", re.IGNORECASE), re.compile(r"\b(EET-\d{5,})\b", re.IGNORECASE), re.compile(r"\b(DEC-\d{5,})\b", re.IGNORECASE), re.compile(r"\b(WTC-[A-Z0-9\-_/]{4,})\b", re.IGNORECASE), re.compile(r"\b(EDA-[A-Z0-9\-_/]{4,})\b", re.IGNORECASE), re.compile(r"\b(UD-[A-Z0-9\-_/]{4,})\b", re.IGNORECASE), re.compile(r"\b(MN-[A-Z0-9\-_/]{4,})\b", re.IGNORECASE), re.compile(r"\b(CA-[A-Z0-9\-_/]{4,})\b", re.IGNORECASE)]
+def parse_dmy(raw: Optional[str]):
+    if not raw:
+        return None
+    for fmt in ("%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(raw.strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def format_dmy(d: date):
+    return f"{d.day}/{d.month}/{d.year}"
+
+def date_shards(start: date, end: date, unit: str = "month") -> List[Tuple[date, date]]:
+    out = []
+    cur = start
+    while cur <= end:
+        if unit == "week":
+            stop = cur + timedelta(days=6 - cur.weekday())
+        else:
+            nxt = date(cur.year + (cur.month == 12), cur.month % 12 + 1, 1)
+            stop = nxt - timedelta(days=1)
+        stop = min(stop, end)
+        out.append((cur, stop))
+        cur = stop + timedelta(days=1)
+    return out
+
+RESULT_TOTAL_RE = re.compile(
+    r"\b(?:of|total:?)\s+([\d,]+)\s+(?:results?|decisions?|items?)\b|\b([\d,]+)\s+(?:results?|decisions?)\s+(?:found|returned)\b",
+    re.IGNORECASE,
+)
+
+def result_total(text: str):
+    m = RESULT_TOTAL_RE.search(text or "")
+    if not m:
+        return None
+    return int((m.group(1) or m.group(2)).replace(",", ""))
+
+ID_PATTERN_SOURCES = [r"ADJ-\d{5,}", r"IR-SC-\d{5,}", r"LCR-\d{5,}", r"EET-\d{5,}", r"DEC-\d{5,}", r"WTC-[A-Z0-9\-_/]{4,}", r"EDA-[A-Z0-9\-_/]{4,}", r"UD-[A-Z0-9\-_/]{4,}", r"MN-[A-Z0-9\-_/]{4,}", r"CA-[A-Z0-9\-_/]{4,}"]
+ID_PATTERNS = [re.compile(rf"\b({p})\b", re.IGNORECASE) for p in ID_PATTERN_SOURCES]
+# All of ID_PATTERNS in one scan. The alternation sits in a zero-width
+# lookahead so overlapping candidates (e.g. ADJ-... inside WTC-...) are all
+# seen; the lowest group number wins, as with trying the patterns in order.
+# The leading class of first letters lets most positions fail before the
+# alternation is tried.
+ID_ANY_RE = re.compile(
+    "\\b(?=[ACDEILMUW])(?=(?:" + "|".join(f"({p})\\b" for p in ID_PATTERN_SOURCES) + "))", re.IGNORECASE
+)
+GUESS_ID_RE = re.compile(r"\b(ADJ|WTC|EET|DEC|LCR|EDA|UD|MN|CA)-?[A-Z0-9\-_/]{4,}\b", re.IGNORECASE)
+DOC_EXT_RE = re.compile(r"\.(html?|pdf|docx?)$", re.IGNORECASE)
+NON_ID_CHARS_RE = re.compile(r"[^A-Za-z0-9\-]+")
+
+def match_identifier(hay: str):
+    best, found = None, None
+    for m in ID_ANY_RE.finditer(hay):
+        i = m.lastindex
+        if best is None or i < best:
+            best = i
+            found = m.group(i)
+            if i == 1:
+                break
+    return found.upper() if found else None
 
 def normalize_identifier(detail_url: str, title_text: str = ""):
-    hay = f"{detail_url} {title_text}".strip()
-    for pat in ID_PATTERNS:
-        m = pat.search(hay)
-        if m:
-            return m.group(1).upper()
+    ident = match_identifier(f"{detail_url} {title_text}".strip())
+    if ident:
+        return ident
     try:
         seg = os.path.basename(urlparse(detail_url).path)
-        seg = re.sub(r"\.(html?|pdf|docx?)$", "", seg, flags=re.IGNORECASE)
-        seg = re.sub(r"[^A-Za-z0-9\-]+", "-", seg).strip("-")
+        seg = NON_ID_CHARS_RE.sub("-", DOC_EXT_RE.sub("", seg)).strip("-")
         if seg:
             return seg.upper()
     except Exception:
         pass
     t = (title_text or "").strip()
     if t:
-        t = re.sub(r"[^A-Za-z0-9\-]+", "-", t).strip("-")
+        t = NON_ID_CHARS_RE.sub("-", t).strip("-")
         if t:
             return t.upper()
     return "NOID"
@@ -64,11 +146,22 @@ def normalize_identifier(detail_url: str, title_text: str = ""):
 def guess_identifier(text_or_url: str):
     if not text_or_url:
         return None
-    m = re.search(r"\b(ADJ|WTC|EET|DEC|LCR|EDA|UD|MN|CA)-?[A-Z0-9\-_/]{4,}\b", text_or_url, re.IGNORECASE)
+    m = GUESS_ID_RE.search(text_or_url)
     if m:
         return m.group(0).upper()
     return None
 
+@lru_cache(maxsize=65536)
+def card_identifier(detail_url: Optional[str], title_text: str = ""):
+    # Identifier of a search card, memoized: incremental and sharded crawls
+    # see the same cards again and again.
+    ident = normalize_identifier(detail_url or "", title_text)
+    if ident == "NOID":
+        # normalize_identifier already fell back to the URL basename, so the
+        # looser guess is all that is left.
+        ident = guess_identifier(f"{title_text} {detail_url or ''}") or ident
+    return ident.replace("/", "-").replace("\\", "-").strip()
+
 def unique_preserve(seq):
     seen = set()
     out = []
@@ -0,0 +1,302 @@
+import os
+import re
+import sys
+import time
+import shutil
+import logging
+import argparse
+
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple
+from datetime import datetime, timezone, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pymongo import MongoClient
+
+from transform_landing import (
+    MONGO_URI, MONGO_DB, SOURCE_COLLECTION, CHECKPOINTS, CURSOR_BATCH_SIZE, decide_partition, body_folder,
+)
+
+logger = logging.getLogger("export_parquet")
+
+EXPORT_DIR       = Path(os.getenv("EXPORT_STORE", "data/export"))
+EXPORT_REVISION  = 2  # bump whenever a schema changes; the next run rebuilds everything
+# Incremental runs start this long before the previous run did, for clock
+# skew between crawler hosts and writes that landed while it was running.
+EXPORT_OVERLAP_S = int(os.getenv("EXPORT_OVERLAP_SECS", "300"))
+
+# partition_date and body are not stored in the files: they come back from
+# the hive-style directories (partition_date=2024-01/body=labour-court).
+DECISIONS = pa.schema([
+    ("identifier", pa.string()),
+    ("title", pa.string()),
+    ("description", pa.string()),
+    ("decision_date_raw", pa.string()),
+    ("decision_date", pa.string()),
+    ("body_id", pa.int64()),
+    ("body_name", pa.string()),
+    ("source_url", pa.string()),
+    ("detail_url", pa.string()),
+    ("content_types", pa.list_(pa.string())),
+    ("file_count", pa.int32()),
+    ("etag", pa.string()),
+    ("last_modified", pa.string()),
+    ("scraped_at", pa.string()),
+    ("first_seen", pa.string()),
+    ("updated_at", pa.string()),
+])
+
+# One row per stored file, joined to decisions on (identifier, detail_url).
+STORED_FILES = pa.schema([
+    ("identifier", pa.string()),
+    ("detail_url", pa.string()),
+    ("file_index", pa.int32()),
+    ("url", pa.string()),
+    ("stored_file_path", pa.string()),
+    ("file_hash", pa.string()),
+    ("filesize_bytes", pa.int64()),
+    ("mime", pa.string()),
+])
+
+TABLES = {"decisions": DECISIONS, "stored_files": STORED_FILES}
+
+# The partition each exported (identifier, detail_url) was last written to,
+# so an incremental run can take a document out of its old partition when
+# its partition_date or body changes.
+KEYS_FILE = "_keys.parquet"
+KEYS = pa.schema([("key", pa.string()), ("partition_date", pa.string()), ("body", pa.string())])
+
+PROJECTION = {
+    "identifier": 1, "title": 1, "description": 1, "decision_date_raw": 1, "decision_date": 1,
+    "body_id": 1, "body": 1, "source_url": 1, "detail_url": 1, "detail_validators": 1,
+    "content_types": 1, "partition_date": 1, "scraped_at": 1, "first_seen": 1, "updated_at": 1,
+    "stored_files.url": 1, "stored_files.stored_file_path": 1, "stored_files.file_hash": 1,
+    "stored_files.filesize_bytes": 1, "stored_files.mime": 1,
+}
+
+def as_int(v) -> Optional[int]:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+def as_str(v) -> Optional[str]:
+    return None if v is None else str(v)
+
+def partition_of(doc: Dict[str, Any]):
+    pd = doc.get("partition_date")
+    if not (isinstance(pd, str) and re.match(r"^\d{4}-\d{2}$", pd)):
+        pd = decide_partition(doc)
+    return pd, body_folder(doc)
+
+def decision_row(doc: Dict[str, Any]):
+    validators = doc.get("detail_validators") or {}
+    return {
+        "identifier":        doc.get("identifier"),
+        "title":             as_str(doc.get("title")),
+        "description":       as_str(doc.get("description")),
+        "decision_date_raw": as_str(doc.get("decision_date_raw")),
+        "decision_date":     as_str(doc.get("decision_date")),
+        "body_id":           as_int(doc.get("body_id")),
+        "body_name":         as_str(doc.get("body")),
+        "source_url":        doc.get("source_url"),
+        "detail_url":        doc.get("detail_url"),
+        "content_types":     sorted(doc.get("content_types") or []),
+        "file_count":        len(doc.get("stored_files") or []),
+        "etag":              validators.get("etag"),
+        "last_modified":     validators.get("last_modified"),
+        "scraped_at":        as_str(doc.get("scraped_at")),
+        "first_seen":        as_str(doc.get("first_seen")),
+        "updated_at":        as_str(doc.get("updated_at")),
+    }
+
+def stored_file_rows(doc: Dict[str, Any]):
+    return [
+        {
+            "identifier":       doc.get("identifier"),
+            "detail_url":       doc.get("detail_url"),
+            "file_index":       i,
+            "url":              sf.get("url"),
+            "stored_file_path": sf.get("stored_file_path"),
+            "file_hash":        sf.get("file_hash"),
+            "filesize_bytes":   as_int(sf.get("filesize_bytes")),
+            "mime":             sf.get("mime"),
+        }
+        for i, sf in enumerate(doc.get("stored_files") or [])
+    ]
+
+def row_keys(table: pa.Table):
+    return pc.binary_join_element_wise(pc.fill_null(table["identifier"], ""),
+                                       pc.fill_null(table["detail_url"], ""), "\x1f")
+
+def partition_path(root: Path, name: str, part: Tuple[str, str]):
+    return root / name / f"partition_date={part[0]}" / f"body={part[1]}" / "part-0.parquet"
+
+def write_partition(root: Path, part: Tuple[str, str], rows: Dict[str, List[Dict[str, Any]]], keys: Set[str]):
+    # Rows of the exported documents replace their previous version; the
+    # partition is rewritten to a temp file and swapped in, so readers never
+    # see half a file and reruns are idempotent.
+    for name, schema in TABLES.items():
+        path = partition_path(root, name, part)
+        new = pa.Table.from_pylist(rows[name], schema=schema)
+        if path.exists():
+            old = pq.read_table(path, schema=schema, partitioning=None)
+            old = old.filter(pc.invert(pc.is_in(row_keys(old), pa.array(list(keys), pa.string()))))
+            new = pa.concat_tables([old, new])
+        if new.num_rows == 0:
+            if path.exists():
+                path.unlink()
+            continue
+        sort = [("identifier", "ascending")] + ([("file_index", "ascending")] if name == "stored_files" else [])
+        new = new.sort_by(sort)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        pq.write_table(new, tmp, compression="zstd")
+        os.replace(tmp, path)
+
+def load_keys(root: Path):
+    path = root / KEYS_FILE
+    if not path.exists():
+        return {}
+    cols = pq.read_table(path, schema=KEYS).to_pydict()
+    return {k: (pd, body) for k, pd, body in zip(cols["key"], cols["partition_date"], cols["body"])}
+
+def save_keys(root: Path, keys: Dict[str, Tuple[str, str]]):
+    table = pa.Table.from_pydict({"key": list(keys), "partition_date": [p[0] for p in keys.values()],
+                                  "body": [p[1] for p in keys.values()]}, schema=KEYS)
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = root / (KEYS_FILE + ".tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, root / KEYS_FILE)
+
+def run(src, root: Path, since: Optional[str] = None):
+    counts = {"docs": 0, "files": 0, "partitions": 0, "moved": 0}
+    filt = {"updated_at": {"$gte": since}} if since else {}
+    # Sorted by partition, so each partition is rewritten once per run and
+    # only one partition is held in memory. Documents whose stored
+    # partition_date is missing may show up out of order; writing their
+    # partition again merges as usual.
+    cursor = (src.find(filt, PROJECTION, no_cursor_timeout=True, allow_disk_use=True)
+              .sort([("partition_date", 1), ("body", 1), ("_id", 1)])
+              .batch_size(CURSOR_BATCH_SIZE))
+    current = None
+    # (identifier, detail_url) -> (decision row, stored file rows); a later
+    # stored version of the same key replaces the earlier one.
+    pending: Dict[str, Tuple[Dict[str, Any], List[Dict[str, Any]]]] = {}
+    keys = load_keys(root) if since else {}
+    left: Dict[Tuple[str, str], Set[str]] = {}  # partition -> keys that moved out of it
+
+    def flush():
+        if pending:
+            rows = {"decisions": [d for d, _ in pending.values()],
+                    "stored_files": [f for _, files in pending.values() for f in files]}
+            write_partition(root, current, rows, set(pending))
+            counts["partitions"] += 1
+        pending.clear()
+
+    try:
+        for doc in cursor:
+            part = partition_of(doc)
+            if part != current:
+                flush()
+                current = part
+            files = stored_file_rows(doc)
+            key = f"{doc.get('identifier') or ''}\x1f{doc.get('detail_url') or ''}"
+            pending[key] = (decision_row(doc), files)
+            prev = keys.get(key)
+            if prev is not None and prev != part:
+                left.setdefault(prev, set()).add(key)
+            keys[key] = part
+            counts["docs"] += 1
+            counts["files"] += len(files)
+        flush()
+    finally:
+        cursor.close()
+    # Only once every partition is written: a key may move back later on.
+    for part, gone in sorted(left.items()):
+        gone = {k for k in gone if keys[k] != part}
+        if gone:
+            write_partition(root, part, {name: [] for name in TABLES}, gone)
+            counts["moved"] += len(gone)
+    save_keys(root, keys)
+    return counts
+
+def load_state(coll, key: str, root: Path):
+    rec = coll.find_one({"_id": key}) or {}
+    if rec.get("revision") != EXPORT_REVISION or rec.get("out") != str(root.resolve()):
+        return None
+    return rec.get("since")
+
+def save_state(coll, key: str, root: Path, since: str, counts: Dict[str, int]):
+    coll.update_one(
+        {"_id": key},
+        {"$set": {"since": since, "revision": EXPORT_REVISION, "out": str(root.resolve()), "counts": counts,
+                  "updated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}},
+        upsert=True,
+    )
+
+def swap_in(build: Path, root: Path):
+    # Replace each table directory of a full rebuild in one rename, then the
+    # key index that goes with them.
+    for name in TABLES:
+        target = root / name
+        old = root / f".{name}.old"
+        if old.exists():
+            shutil.rmtree(old)
+        if target.exists():
+            target.rename(old)
+        if (build / name).exists():
+            (build / name).rename(target)
+        if old.exists():
+            shutil.rmtree(old)
+    os.replace(build / KEYS_FILE, root / KEYS_FILE)
+    shutil.rmtree(build, ignore_errors=True)
+
+def main():
+    ap = argparse.ArgumentParser(description="Export decision metadata to Parquet, partitioned by partition_date and body.")
+    ap.add_argument("--out", default=str(EXPORT_DIR), help="export root (default: $EXPORT_STORE or data/export)")
+    ap.add_argument("--full", action="store_true",
+                    help="rebuild every partition instead of appending documents updated since the last run")
+    args = ap.parse_args()
+
+    try:
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=6000)
+        client.admin.command("ping")
+    except Exception as e:
+        logger.error("Mongo connection failed: %s", e)
+        sys.exit(2)
+
+    db = client[MONGO_DB]
+    src = db[SOURCE_COLLECTION]
+    try:
+        src.create_index([("updated_at", 1)])
+    except Exception as e:
+        logger.warning("Index creation failed (continuing): %s", e)
+
+    root = Path(args.out)
+    root.mkdir(parents=True, exist_ok=True)
+    state = db[CHECKPOINTS]
+    key = f"parquet:{SOURCE_COLLECTION}"
+    since = None if args.full else load_state(state, key, root)
+    next_since = (datetime.now(timezone.utc) - timedelta(seconds=EXPORT_OVERLAP_S)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    started = time.monotonic()
+    if since is None:
+        # Full export: build next to the live tables and swap, so documents
+        # that moved partition or were deleted do not linger.
+        logger.info("Full export of '%s' to %s", SOURCE_COLLECTION, root)
+        build = root / ".build"
+        shutil.rmtree(build, ignore_errors=True)
+        counts = run(src, build)
+        swap_in(build, root)
+    else:
+        logger.info("Exporting documents of '%s' updated since %s to %s", SOURCE_COLLECTION, since, root)
+        counts = run(src, root, since=since)
+    save_state(state, key, root, next_since, counts)
+    client.close()
+    logger.info("Done. docs=%d files=%d partitions=%d moved=%d in %.1fs",
+                counts["docs"], counts["files"], counts["partitions"], counts["moved"], time.monotonic() - started)
+
+if __name__ == "__main__":
+    main()
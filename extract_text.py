@@ -0,0 +1,289 @@
+import os
+import sys
+import time
+import shutil
+import hashlib
+import zipfile
+import logging
+import argparse
+import subprocess
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timezone
+from lxml import etree
+import lxml.html
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from transform_landing import (
+    MONGO_URI, MONGO_DB, CURATED_COLLECTION, CURATED_DIR, query_window, iter_chunks,
+)
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pdftotext (poppler) is used when it is on PATH
+    PdfReader = None
+
+logger = logging.getLogger("extract_text")
+
+EXTRACTOR_REVISION = 1  # bump whenever extraction rules change output
+TEXT_INDEX_MAX_CHARS = int(os.getenv("TEXT_INDEX_MAX_CHARS", "200000"))
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+EP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}"
+
+class Unsupported(Exception):
+    pass
+
+def extract_pdf(path: Path):
+    if PdfReader is not None:
+        reader = PdfReader(str(path))
+        texts = [(page.extract_text() or "").strip() for page in reader.pages]
+        return "\n\f\n".join(texts), len(texts), "pypdf"
+    if shutil.which("pdftotext"):
+        out = subprocess.run(["pdftotext", "-layout", "-enc", "UTF-8", str(path), "-"],
+                             capture_output=True, check=True, timeout=300).stdout.decode("utf-8", "replace")
+        return out, max(1, out.count("\f")), "pdftotext"
+    raise Unsupported("no PDF parser (install pypdf or poppler-utils)")
+
+def extract_docx(path: Path):
+    # WordprocessingML read directly: paragraphs, tabs and line breaks.
+    with zipfile.ZipFile(path) as z:
+        root = etree.fromstring(z.read("word/document.xml"))
+        pages = 1
+        if "docProps/app.xml" in z.namelist():
+            p = etree.fromstring(z.read("docProps/app.xml")).find(f"{EP_NS}Pages")
+            if p is not None and (p.text or "").isdigit():
+                pages = max(1, int(p.text))
+    paras = []
+    for para in root.iter(f"{W_NS}p"):
+        parts = []
+        for el in para.iter(f"{W_NS}t", f"{W_NS}tab", f"{W_NS}br"):
+            if el.tag == f"{W_NS}t":
+                parts.append(el.text or "")
+            else:
+                parts.append("\t" if el.tag == f"{W_NS}tab" else "\n")
+        paras.append("".join(parts))
+    return "\n".join(paras), pages, "docx-xml"
+
+def extract_doc(path: Path):
+    with path.open("rb") as f:
+        head = f.read(8)
+    if head.startswith(b"PK"):
+        return extract_docx(path)
+    for cmd in (["antiword", str(path)], ["catdoc", "-w", str(path)]):
+        if shutil.which(cmd[0]):
+            out = subprocess.run(cmd, capture_output=True, check=True, timeout=300).stdout.decode("utf-8", "replace")
+            return out, max(1, out.count("\f") + 1), cmd[0]
+    raise Unsupported("no .doc parser (install antiword or catdoc)")
+
+def extract_html(path: Path):
+    root = lxml.html.fromstring(path.read_bytes())
+    for el in root.iter("script", "style", "noscript"):
+        el.drop_tree()
+    node = root.find(".//article[@data-curated]")
+    if node is None:
+        node = root.find(".//body")
+    if node is None:
+        node = root
+    lines = (t.strip() for t in node.itertext())
+    return "\n".join(t for t in lines if t), 1, "lxml"
+
+EXTRACTORS = {".pdf": extract_pdf, ".docx": extract_docx, ".doc": extract_doc,
+              ".html": extract_html, ".htm": extract_html}
+
+def extractor_version():
+    return f"{'pypdf' if PdfReader is not None else 'cli'}-{EXTRACTOR_REVISION}"
+
+def text_path_for(path: Path):
+    return path.with_name(path.name + ".txt")
+
+def is_current(prev: Optional[Dict[str, Any]], f: Dict[str, Any], txt: Path):
+    # Unsupported files are not retried until their hash changes (or --force);
+    # failed extractions are.
+    if (prev is None or prev.get("source_hash") != f.get("new_file_hash")
+            or prev.get("extractor_version") != extractor_version()):
+        return False
+    return prev.get("status") == "unsupported" or (prev.get("status") == "extracted" and txt.exists())
+
+def extract_one(rec: Dict[str, Any], curated_root: Path, force: bool = False):
+    # Returns (text_files, pages and files extracted now), or None when every
+    # curated file already has text for its current hash.
+    prev = {t.get("source"): t for t in (rec.get("text_files") or [])}
+    files = [f for f in (rec.get("new_files") or [])
+             if f.get("status") in ("copied", "transformed") and f.get("new_file_path")]
+    results: List[Dict[str, Any]] = []
+    pages_done = files_done = 0
+    changed = set(prev) != {f["new_file_path"] for f in files}
+    for f in files:
+        src = curated_root / f["new_file_path"]
+        txt = text_path_for(src)
+        old = prev.get(f["new_file_path"])
+        if not force and is_current(old, f, txt):
+            results.append(old)
+            continue
+        changed = True
+        entry = {"source": f["new_file_path"], "source_hash": f.get("new_file_hash"),
+                 "extractor_version": extractor_version()}
+        try:
+            fn = EXTRACTORS.get(src.suffix.lower())
+            if fn is None:
+                raise Unsupported(f"no extractor for {src.suffix or 'files without extension'}")
+            text, pages, engine = fn(src)
+            data = text.encode("utf-8")
+            txt.write_bytes(data)
+            pages_done += pages
+            files_done += 1
+            entry.update({
+                "status": "extracted",
+                "text_path": str(txt.relative_to(curated_root)),
+                "text_hash": hashlib.sha256(data).hexdigest(),
+                "pages": pages,
+                "chars": len(text),
+                "engine": engine,
+            })
+        except Unsupported as e:
+            entry.update({"status": "unsupported", "error": str(e)})
+        except Exception as e:
+            logger.warning("Text extraction failed for %s: %s", src, e)
+            entry.update({"status": "error", "error": str(e)})
+        results.append(entry)
+
+    # Text of curated files that no longer exist.
+    for source, old in prev.items():
+        if source not in {f["new_file_path"] for f in files} and old.get("text_path"):
+            try:
+                (curated_root / old["text_path"]).unlink()
+            except OSError:
+                pass
+    if not changed:
+        return None
+    return results, pages_done, files_done
+
+def indexed_text(curated_root: Path, text_files: List[Dict[str, Any]]):
+    parts = []
+    size = 0
+    for t in text_files:
+        if t.get("status") != "extracted" or size >= TEXT_INDEX_MAX_CHARS:
+            continue
+        try:
+            s = (curated_root / t["text_path"]).read_text(encoding="utf-8")
+        except OSError:
+            continue
+        parts.append(s[: TEXT_INDEX_MAX_CHARS - size])
+        size += len(parts[-1])
+    return "\n\n".join(parts)
+
+def extract_chunk(recs: List[Dict[str, Any]], curated_root: Path, force: bool = False):
+    # Runs in a worker process. Each entry: (_id, update or None, pages, files, error).
+    out = []
+    for rec in recs:
+        try:
+            res = extract_one(rec, curated_root, force=force)
+            if res is None:
+                out.append((rec["_id"], None, 0, 0, None))
+                continue
+            text_files, pages, files = res
+            update = {
+                "text_files": text_files,
+                "text": indexed_text(curated_root, text_files),
+                "text_extracted_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            out.append((rec["_id"], update, pages, files, None))
+        except Exception as e:
+            logger.exception("Extraction failed for %s: %s", rec.get("identifier"), e)
+            out.append((rec["_id"], None, 0, 0, str(e)))
+    return out
+
+def run(dst, filt, workers: int, chunk_size: int, force: bool = False):
+    counts = {"processed": 0, "updated": 0, "skipped": 0, "errs": 0, "pages": 0, "files": 0}
+    started = time.monotonic()
+    last_log = 0
+
+    def drain(result):
+        nonlocal last_log
+        ops = []
+        for _id, update, pages, files, err in result:
+            counts["processed"] += 1
+            if err is not None:
+                counts["errs"] += 1
+                continue
+            if update is None:
+                counts["skipped"] += 1
+                continue
+            counts["pages"] += pages
+            counts["files"] += files
+            counts["errs"] += sum(1 for t in update["text_files"] if t.get("status") == "error")
+            ops.append(UpdateOne({"_id": _id}, {"$set": update}))
+        if ops:
+            try:
+                dst.bulk_write(ops, ordered=False)
+                counts["updated"] += len(ops)
+            except BulkWriteError as e:
+                failed = len(e.details.get("writeErrors") or [])
+                counts["updated"] += len(ops) - failed
+                counts["errs"] += failed
+                logger.error("bulk_write reported %d write errors", failed)
+        if counts["processed"] // 200 > last_log // 200:
+            log_progress(counts, started)
+        last_log = counts["processed"]
+
+    projection = {"identifier": 1, "new_files": 1, "text_files": 1}
+    chunks = iter_chunks(dst.find(filt, projection, no_cursor_timeout=True), chunk_size)
+    if workers > 1:
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk in chunks:
+                pending.append(pool.submit(extract_chunk, chunk, CURATED_DIR, force))
+                if len(pending) >= workers * 2:
+                    drain(pending.popleft().result())
+            while pending:
+                drain(pending.popleft().result())
+    else:
+        for chunk in chunks:
+            drain(extract_chunk(chunk, CURATED_DIR, force))
+    log_progress(counts, started, final=True)
+    return counts
+
+def log_progress(counts: Dict[str, int], started: float, final: bool = False):
+    elapsed = max(time.monotonic() - started, 1e-9)
+    logger.info("%s processed=%d updated=%d skipped=%d errs=%d files=%d pages=%d (%.1f pages/s)",
+                "Done." if final else "...", counts["processed"], counts["updated"], counts["skipped"],
+                counts["errs"], counts["files"], counts["pages"], counts["pages"] / elapsed)
+
+def main():
+    ap = argparse.ArgumentParser(description="Extract plain text from curated decisions and index it.")
+    ap.add_argument("--start", required=True, help="YYYY-MM-DD inclusive")
+    ap.add_argument("--end",   required=True, help="YYYY-MM-DD inclusive")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="extraction processes")
+    ap.add_argument("--chunk-size", type=int, default=20, help="curated documents per worker task")
+    ap.add_argument("--force", action="store_true", help="re-extract even if the file hash is unchanged")
+    args = ap.parse_args()
+    # force: importing transform_landing has already set up the root logger.
+    logging.basicConfig(level=os.getenv("EXTRACT_LOGLEVEL", "INFO"),
+                        format="%(asctime)s [%(levelname)s] %(message)s", force=True)
+
+    if PdfReader is None and not shutil.which("pdftotext"):
+        logger.warning("Neither pypdf nor pdftotext is available; PDFs will be marked unsupported.")
+
+    try:
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=6000)
+        client.admin.command("ping")
+    except Exception as e:
+        logger.error("Mongo connection failed: %s", e)
+        sys.exit(2)
+
+    dst = client[MONGO_DB][CURATED_COLLECTION]
+    try:
+        dst.create_index([("text", "text")], name="text_search", default_language="english")
+    except OperationFailure as e:
+        logger.warning("Text index creation failed (continuing): %s", e)
+
+    run(dst, query_window(args.start, args.end), max(1, args.workers), max(1, args.chunk_size), force=args.force)
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""Backfill a range of months with a pool of crawler processes.
+
+usage: backfill.py START_YYYY-MM END_YYYY-MM [--bodies 1,2,3,15376] [--q Q]
+                   [--workers N] [--rps R] [--retries N] [--out-dir DIR]
+                   [--force] [-s NAME=VALUE]
+
+Every (month, body) pair is a shard, crawled as `scrapy crawl search` would
+with -a date_from/date_to/body over that month. --workers processes each run
+one CrawlerProcess and take shards from a shared queue until none are left,
+so the interpreter, the imports and the reactor start once per worker and
+not once per shard. Each shard is still its own crawler, with its own
+middlewares, pipelines and cache storage. All workers draw from one budget
+of --rps requests/s (RateBudgetMiddleware, crawler/throttle.py).
+
+SQLite allows one writer at a time, so each worker slot keeps its own HTTP
+cache file under HTTPCACHE_DIR/backfill-<N>. A worker that replaces a dead
+one takes over its slot and its cache.
+
+A shard that raises, finishes with another finish_reason than "finished",
+sends no request or gets no response, or whose worker dies is queued again,
+up to --retries times. A shard that
+completes writes its feed to DIR/<YYYY-MM>_<body>.jsonl and its stats to
+DIR/.backfill/<YYYY-MM>_<body>.json. Shards with a stats file are skipped on
+later runs unless --force is given, so an interrupted backfill is rerun with
+the same command.
+
+At the end, the feeds of every completed shard in the range are merged into
+DIR/backfill_<START>_<END>.jsonl. The report, with per-shard results and
+summed stats (maxima for */max keys), is printed and written to
+DIR/backfill_<START>_<END>.report.json. Worker logs go to
+logs/backfill-w<N>.log.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import logging
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+from datetime import date
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "crawler.settings")
+
+from month_span import months_between, month_last_day  # noqa: E402
+
+logger = logging.getLogger("backfill")
+
+
+def make_shards(start, end, bodies):
+    shards = []
+    for y, m in months_between(start, end):
+        first, last = date(y, m, 1), month_last_day(y, m)
+        for body in bodies:
+            shards.append({
+                "id": f"{y}-{m:02d}_{body}",
+                "date_from": f"{first.day}/{first.month}/{first.year}",
+                "date_to": f"{last.day}/{last.month}/{last.year}",
+                "body": body,
+            })
+    return shards
+
+
+def jsonable(stats):
+    out = {}
+    for k, v in stats.items():
+        if isinstance(v, (int, float, str, bool)) or v is None:
+            out[k] = v
+        else:
+            out[k] = str(v)
+    return out
+
+
+def worker(wid, slot, tasks, results, next_at, lock, overrides, q, log_file):
+    # One CrawlerProcess running shards back to back in a single reactor.
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    from scrapy.utils.reactor import install_reactor
+    from crawler.spiders.search import SearchSpider
+    from crawler.throttle import share_rate_budget
+
+    share_rate_budget(next_at, lock)
+    settings = get_project_settings()
+    settings.set("LOG_FILE", log_file)
+    for k, v in overrides.items():
+        settings.set(k, v, priority="cmdline")
+    settings.set("HTTPCACHE_DIR", os.path.join(settings.get("HTTPCACHE_DIR") or "httpcache", f"backfill-{slot}"),
+                 priority="cmdline")
+    # The reactor is needed before the first crawl is created.
+    if settings.get("TWISTED_REACTOR"):
+        install_reactor(settings["TWISTED_REACTOR"], settings.get("ASYNCIO_EVENT_LOOP"))
+    process = CrawlerProcess(settings)
+
+    from twisted.internet import defer, reactor, threads
+
+    def next_shard():
+        # Polls, so the reactor's thread pool can still shut down.
+        try:
+            return tasks.get(timeout=1.0)
+        except queue.Empty:
+            return False
+
+    @defer.inlineCallbacks
+    def run_shards():
+        try:
+            while True:
+                shard = yield threads.deferToThread(next_shard)
+                if shard is False:
+                    continue
+                if shard is None:
+                    break
+                results.put({"event": "start", "worker": wid, "shard": shard["id"]})
+                crawler = process.create_crawler(SearchSpider)
+                started = time.time()
+                error = None
+                try:
+                    yield process.crawl(crawler, date_from=shard["date_from"], date_to=shard["date_to"],
+                                        body=shard["body"], q=q, shard_id=shard["id"])
+                except Exception as e:
+                    error = repr(e)
+                results.put({
+                    "event": "done", "worker": wid, "shard": shard["id"], "error": error,
+                    "elapsed_s": round(time.time() - started, 3),
+                    "stats": jsonable(crawler.stats.get_stats()) if crawler.stats else {},
+                })
+        finally:
+            if reactor.running:
+                reactor.stop()
+
+    reactor.callWhenRunning(run_shards)
+    process.start(stop_after_crawl=False)
+
+
+def shard_failure(ev):
+    # Why a finished shard does not count as done, or None. A crawl that
+    # never got a response (no start requests, every download failed) also
+    # finishes with "finished", and would otherwise be skipped for good.
+    stats = ev["stats"]
+    reason = stats.get("finish_reason")
+    if ev["error"] is not None:
+        return ev["error"]
+    if reason != "finished":
+        return f"finish_reason={reason}"
+    if not stats.get("downloader/request_count"):
+        return "no requests sent"
+    if not stats.get("response_received_count"):
+        return "no responses received"
+    return None
+
+
+def merge_stats(stats_list):
+    total = {}
+    for stats in stats_list:
+        for k, v in stats.items():
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                continue
+            if k.endswith("/max") or k.endswith("_max") or k.startswith("memusage/"):
+                total[k] = max(total.get(k, v), v)
+            else:
+                total[k] = total.get(k, 0) + v
+    return dict(sorted(total.items()))
+
+
+class Pool:
+    def __init__(self, ctx, size, args, overrides):
+        self.ctx = ctx
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.next_at = ctx.Value("d", 0.0, lock=False)
+        self.lock = ctx.Lock()
+        self.args = args
+        self.overrides = overrides
+        self.size = size
+        self.procs = {}
+        self.slots = {}  # worker id -> cache slot
+        self.running = {}  # worker id -> shard id
+        self.next_wid = 0
+        for _ in range(size):
+            self.spawn()
+
+    def spawn(self):
+        wid = self.next_wid
+        self.next_wid += 1
+        slot = min(set(range(self.size)) - set(self.slots.values()))
+        self.slots[wid] = slot
+        os.makedirs("logs", exist_ok=True)
+        p = self.ctx.Process(
+            target=worker,
+            args=(wid, slot, self.tasks, self.results, self.next_at, self.lock, self.overrides,
+                  self.args.q, f"logs/backfill-w{wid}.log"),
+            daemon=False,
+        )
+        p.start()
+        self.procs[wid] = p
+
+    def reap(self):
+        # Shards held by workers that died (OOM, kill -9) come back as errors.
+        lost = []
+        for wid, p in list(self.procs.items()):
+            if not p.is_alive():
+                del self.procs[wid]
+                del self.slots[wid]
+                shard = self.running.pop(wid, None)
+                if shard is not None:
+                    lost.append({"event": "done", "worker": wid, "shard": shard, "stats": {},
+                                 "error": f"worker exited with code {p.exitcode}", "elapsed_s": None})
+        return lost
+
+    def close(self, timeout=None):
+        for _ in self.procs:
+            self.tasks.put(None)
+        for p in self.procs.values():
+            p.join(timeout)
+
+
+def run(args, shards, state_dir, overrides):
+    by_id = {s["id"]: s for s in shards}
+    attempts = {s["id"]: 0 for s in shards}
+    results = {}
+    pool = Pool(mp.get_context("spawn"), min(args.workers, len(shards)), args, overrides)
+    for s in shards:
+        pool.tasks.put(s)
+    outstanding = len(shards)
+
+    def finish(ev):
+        nonlocal outstanding
+        sid = ev["shard"]
+        attempts[sid] += 1
+        stats = ev["stats"]
+        failure = shard_failure(ev)
+        if failure is None:
+            rec = {"shard": by_id[sid], "attempts": attempts[sid], "elapsed_s": ev["elapsed_s"],
+                   "stats": stats, "completed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+            tmp = state_dir / f"{sid}.json.tmp"
+            tmp.write_text(json.dumps(rec, indent=1), encoding="utf-8")
+            os.replace(tmp, state_dir / f"{sid}.json")
+            results[sid] = "ok"
+            outstanding -= 1
+            logger.info("%s done: %s items in %.1fs", sid, stats.get("item_scraped_count", 0), ev["elapsed_s"])
+        elif attempts[sid] <= args.retries:
+            logger.warning("%s failed (%s), retrying (%d/%d)", sid, failure, attempts[sid], args.retries)
+            pool.tasks.put(by_id[sid])
+        else:
+            logger.error("%s failed (%s) after %d attempt(s)", sid, failure, attempts[sid])
+            results[sid] = failure
+            outstanding -= 1
+
+    try:
+        while outstanding:
+            try:
+                ev = pool.results.get(timeout=2.0)
+            except queue.Empty:
+                ev = None
+            if ev is not None and ev["event"] == "start":
+                if ev["worker"] in pool.procs:
+                    pool.running[ev["worker"]] = ev["shard"]
+                else:
+                    finish(dict(ev, event="done", stats={}, elapsed_s=None, error="worker exited"))
+            elif ev is not None:
+                pool.running.pop(ev["worker"], None)
+                finish(ev)
+            # After the event, so a start from a worker that has since died
+            # is already recorded against it.
+            for lost in pool.reap():
+                finish(lost)
+            if outstanding and len(pool.procs) < min(args.workers, outstanding):
+                pool.spawn()
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; waiting for workers to stop (completed shards are kept)")
+    finally:
+        pool.close(timeout=60)
+    return results, attempts
+
+
+def merge_feeds(shards, out_dir, state_dir, dest):
+    tmp = dest.with_name(dest.name + ".tmp")
+    with tmp.open("wb") as out:
+        for s in shards:
+            feed = out_dir / f"{s['id']}.jsonl"
+            if (state_dir / f"{s['id']}.json").exists() and feed.exists():
+                with feed.open("rb") as f:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+    os.replace(tmp, dest)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Backfill month shards with a pool of crawler processes.")
+    ap.add_argument("start", metavar="START_YYYY-MM")
+    ap.add_argument("end", metavar="END_YYYY-MM")
+    ap.add_argument("--bodies", default=os.getenv("BODIES", "1,2,3,15376"))
+    ap.add_argument("--q", default=os.getenv("Q_ARG") or None)
+    ap.add_argument("--workers", type=int, default=4, help="crawler processes")
+    ap.add_argument("--rps", type=float, default=4.0, help="requests/s shared by all workers (0 = no budget)")
+    ap.add_argument("--retries", type=int, default=2, help="re-runs of a failed shard")
+    ap.add_argument("--out-dir", default="data/landing", help="per-shard feeds, merged feed and report")
+    ap.add_argument("--force", action="store_true", help="re-crawl shards completed by an earlier run")
+    ap.add_argument("-s", dest="set", action="append", default=[], help="setting override NAME=VALUE")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    out_dir = Path(args.out_dir)
+    state_dir = out_dir / ".backfill"
+    state_dir.mkdir(parents=True, exist_ok=True)
+    bodies = [b.strip() for b in args.bodies.split(",") if b.strip()]
+    shards = make_shards(args.start, args.end, bodies)
+    if args.force:
+        todo = shards
+    else:
+        todo = [s for s in shards if not (state_dir / f"{s['id']}.json").exists()]
+    logger.info("%d shard(s) in %s..%s, %d to crawl", len(shards), args.start, args.end, len(todo))
+
+    overrides = {
+        "RATE_BUDGET_RPS": args.rps,
+        "FEEDS": {str(out_dir.resolve() / "%(shard_id)s.jsonl"): {"format": "jsonlines", "overwrite": True}},
+    }
+    for kv in args.set:
+        k, _, v = kv.partition("=")
+        overrides[k] = v
+
+    started = time.time()
+    results, attempts = run(args, todo, state_dir, overrides) if todo else ({}, {})
+
+    name = f"backfill_{args.start}_{args.end}"
+    merge_feeds(shards, out_dir, state_dir, out_dir / f"{name}.jsonl")
+    done = {}
+    for s in shards:
+        path = state_dir / f"{s['id']}.json"
+        if path.exists():
+            done[s["id"]] = json.loads(path.read_text(encoding="utf-8"))
+    report = {
+        "range": [args.start, args.end],
+        "bodies": bodies,
+        "elapsed_s": round(time.time() - started, 1),
+        "shards": {
+            s["id"]: {
+                "status": results.get(s["id"], "ok" if s["id"] in done else "pending"),
+                "skipped": s["id"] in done and s["id"] not in results,
+                "attempts": attempts.get(s["id"], done.get(s["id"], {}).get("attempts", 0)),
+                "items": done.get(s["id"], {}).get("stats", {}).get("item_scraped_count", 0),
+                "elapsed_s": done.get(s["id"], {}).get("elapsed_s"),
+            }
+            for s in shards
+        },
+        "totals": merge_stats(d["stats"] for d in done.values()),
+    }
+    (out_dir / f"{name}.report.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    failed = [sid for sid, r in report["shards"].items() if r["status"] != "ok"]
+    totals = report["totals"]
+    print(f"shards: {len(shards) - len(failed)}/{len(shards)} complete"
+          f" ({sum(r['skipped'] for r in report['shards'].values())} from earlier runs)")
+    print(f"items: {totals.get('item_scraped_count', 0)}  requests: {totals.get('downloader/request_count', 0)}"
+          f"  elapsed: {report['elapsed_s']}s")
+    for sid in failed:
+        print(f"  {sid}: {report['shards'][sid]['status']}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Compare the bs4 and lxml HTML cleaners in transform_landing.
+
+usage: bench_clean_html.py [--corpus DIR] [--docs N] [--paragraphs N] [--repeat N]
+
+Without --corpus a synthetic set of large decision pages is generated. Each
+engine runs in its own process so peak RSS is measured independently, and
+the outputs of both engines are compared structurally (title, element
+sequence and text).
+"""
+import sys
+import time
+import random
+import resource
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lxml.html  # noqa: E402
+import transform_landing as tl  # noqa: E402
+
+BOILER = [
+    '<header class="site-header"><div class="masthead">Workplace Relations</div></header>',
+    '<nav class="navbar"><ul>{links}</ul></nav>',
+    '<div class="breadcrumb"><a href="/">Home</a> &gt; <a href="/en/search">Search</a></div>',
+    '<div id="cookie-consent" class="modal popup">We use cookies. <button>Accept</button></div>',
+    '<aside class="sidebar"><div class="social share">Share this</div></aside>',
+    '<!-- tracking snippet --><script>var x = {n};</script><style>.a{{color:red}}</style>',
+    '<footer class="site-footer"><p>Copyright</p><div class="pager pagination">1 2 3</div></footer>',
+]
+
+WORDS = ("the complainant respondent adjudication officer hearing section act employment "
+         "redress decision notice payment unfair dismissal equality tribunal labour court").split()
+
+
+def synthetic_page(rnd: random.Random, paragraphs: int):
+    links = "".join(f'<li><a href="/p{i}">Link {i}</a></li>' for i in range(40))
+    body = []
+    for i in range(paragraphs):
+        words = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 80)))
+        if i % 25 == 0:
+            body.append(f"<h2>Section {i // 25 + 1}</h2>")
+        body.append(f"<p>{words} <strong>{rnd.choice(WORDS)}</strong> {words[:40]}</p>")
+        if i % 40 == 0:
+            body.append('<div class="spacer"> </div><p>  </p>')
+    side = f'<div class="related">{" ".join(rnd.choice(WORDS) for _ in range(50))}</div>'
+    return (
+        "<!doctype html><html><head><title> ADJ-000{} Decision </title></head><body>".format(rnd.randint(10000, 99999))
+        + BOILER[0] + BOILER[1].format(links=links) + BOILER[2] + BOILER[3]
+        + "<main><div class='content'>" + "".join(body) + "</div>" + side + BOILER[4] + "</main>"
+        + BOILER[5].format(n=rnd.randint(0, 9)) + BOILER[6]
+        + "</body></html>"
+    )
+
+
+def load_corpus(args):
+    if args.corpus:
+        paths = sorted(p for p in Path(args.corpus).rglob("*") if tl.is_html_path(p))[: args.docs]
+        return [p.read_text(encoding="utf-8", errors="ignore") for p in paths]
+    rnd = random.Random(42)
+    return [synthetic_page(rnd, args.paragraphs) for _ in range(args.docs)]
+
+
+def signature(html: str):
+    root = lxml.html.document_fromstring(html)
+    title = root.findtext(".//title") or ""
+    tags = [el.tag for el in root.iter() if isinstance(el.tag, str)]
+    text = " ".join(" ".join(root.itertext()).split())
+    return title.strip(), tags, text
+
+
+def run_engine(engine, args, q):
+    docs = load_corpus(args)
+    fn = tl.CLEANERS[engine]
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for html in docs:
+            fn(html)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    q.put((engine, len(docs) * args.repeat / elapsed if elapsed else 0.0, peak_kb))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark clean_html engines.")
+    ap.add_argument("--corpus", help="directory of landed .html files (default: synthetic)")
+    ap.add_argument("--docs", type=int, default=50)
+    ap.add_argument("--paragraphs", type=int, default=2000, help="paragraphs per synthetic page")
+    ap.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args()
+
+    # Engines run first, in fresh processes: ru_maxrss survives fork/exec, so
+    # the parent must not have parsed anything large yet.
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    results = []
+    for engine in ("bs4", "lxml"):
+        p = ctx.Process(target=run_engine, args=(engine, args, q))
+        p.start()
+        results.append(q.get())
+        p.join()
+
+    docs = load_corpus(args)
+    if not docs:
+        print("no documents found")
+        sys.exit(1)
+    avg_kb = sum(len(d) for d in docs) / len(docs) / 1024
+    print(f"corpus: {len(docs)} docs, avg {avg_kb:.0f} KiB")
+
+    mismatches = 0
+    for i, html in enumerate(docs):
+        if signature(tl.clean_html_bs4(html)) != signature(tl.clean_html_lxml(html)):
+            mismatches += 1
+            print(f"  output differs for doc #{i}")
+    print(f"equivalence: {len(docs) - mismatches}/{len(docs)} identical")
+
+    for engine, rate, peak_kb in results:
+        print(f"{engine:5s} {rate:8.2f} docs/sec  peak RSS {peak_kb / 1024:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
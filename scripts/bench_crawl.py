@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""Offline end-to-end benchmark of SearchSpider and the item pipelines.
+
+usage: bench_crawl.py [--pages N] [--per-page N] [--latency-ms MS] [--error-rate F]
+                      [--replay SQLITE] [--mongo-uri URI] [-s NAME=VALUE] [-a NAME=VALUE]
+                      [--out JSON] [--baseline JSON]
+
+A local HTTP server (its own process) stands in for workplacerelations.ie:
+search pages with the li.each-item / h3 a / time markup, detail pages linking
+one attachment, and the attachments themselves. Every search shard serves
+--pages full pages, then an empty one. --latency-ms (with +-50% jitter) and
+--error-rate (503 with Retry-After: 1, or 429 for one in four) apply to every
+response. --replay serves recorded responses from an HTTP cache file written
+by crawler.httpcache.SqliteCacheStorage instead, matched on path and query.
+
+The spider runs with the project settings and pipelines. FILES_STORE goes to
+a temporary directory and the HTTP cache is off unless overridden with -s.
+Without --mongo-uri, MongoDB is replaced by mongomock. With it, a scratch
+collection is used and dropped afterwards.
+
+Reported: items/s, requests/s, p50/p99 download latency per resource kind,
+p50/p99 time from a detail response to its item being stored, Mongo flush
+latency, and peak RSS. --out writes them as JSON, and --baseline prints the
+change against an earlier --out file.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import resource
+import argparse
+import tempfile
+import multiprocessing as mp
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "crawler.settings")
+
+LIVE = "https://www.workplacerelations.ie"
+
+
+def card_ids(body, date_from, page, per_page):
+    out = []
+    for i in range(per_page):
+        h = hashlib.sha1(f"{body}|{date_from}|{page}|{i}".encode()).hexdigest()
+        out.append(f"ADJ-{int(h[:12], 16) % 10 ** 10:010d}")
+    return out
+
+
+def search_page(qs, cfg):
+    body = qs.get("body", [""])[0]
+    date_from = qs.get("from", [""])[0]
+    page = int(qs.get("pageNumber", ["1"])[0])
+    ids = card_ids(body, date_from, page, cfg["per_page"]) if page <= cfg["pages"] else []
+    day, month, year = (date_from.split("/") + ["1", "1", "2024"])[:3]
+    cards = "".join(
+        f'<li class="each-item"><h3><a href="/en/cases/{year}/{month}/{i}.html">{i}</a></h3>'
+        f'<time>{int(day):02d}/{int(month):02d}/{year}</time>'
+        f'<p class="summary">Adjudication decision {i} under the Unfair Dismissals Acts.</p></li>'
+        for i in ids
+    )
+    total = cfg["pages"] * cfg["per_page"]
+    return (
+        "<!doctype html><html><head><title>Search</title></head><body>"
+        f'<div class="results-count">Showing {len(ids)} of {total} results</div>'
+        f'<ul class="search-results">{cards}</ul></body></html>'
+    ).encode()
+
+
+def detail_page(ident, cfg):
+    rnd = random.Random(ident)
+    paras = "".join(f"<p>Paragraph {n} of the decision text for {ident}.</p>" for n in range(cfg["paragraphs"]))
+    link = f'<a href="/en/files/{ident}.pdf">Download PDF</a>' if rnd.random() < cfg["attachment_rate"] else ""
+    return f"<html><head><title>{ident}</title></head><body><h1>{ident}</h1>{paras}{link}</body></html>".encode()
+
+
+def attachment(ident, cfg):
+    rnd = random.Random(ident)
+    return b"%PDF-1.4\n" + rnd.randbytes(cfg["attachment_kb"] * 1024) + b"\n%%EOF\n"
+
+
+def load_replay(path, base):
+    import sqlite3
+    import zlib
+    from w3lib.http import headers_raw_to_dict
+    db = sqlite3.connect(path)
+    out = {}
+    for url, status, headers, body, compressed in db.execute(
+            "SELECT url, status, headers, body, compressed FROM responses"):
+        body = zlib.decompress(body) if compressed else body
+        u = urlparse(url)
+        hdrs = {k.decode(): v[0].decode("latin-1") for k, v in headers_raw_to_dict(headers).items()}
+        if "html" in hdrs.get("Content-Type", "html"):
+            body = body.replace(LIVE.encode(), base.encode())
+        out[u.path + ("?" + u.query if u.query else "")] = (status, hdrs, body)
+    db.close()
+    return out
+
+
+def serve(cfg, port_q):
+    replay = None
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body, ctype="text/html; charset=utf-8", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            rnd = random.Random()
+            if cfg["latency_ms"]:
+                time.sleep(cfg["latency_ms"] / 1000 * rnd.uniform(0.5, 1.5))
+            u = urlparse(self.path)
+            if u.path == "/robots.txt":
+                return self.send(200, b"User-agent: *\nAllow: /\n", "text/plain")
+            if cfg["error_rate"] and rnd.random() < cfg["error_rate"]:
+                status = 429 if rnd.random() < 0.25 else 503
+                return self.send(status, b"busy", "text/plain", {"Retry-After": "1"})
+            if replay is not None:
+                hit = replay.get(self.path)
+                if hit is None:
+                    return self.send(404, b"not recorded", "text/plain")
+                status, headers, body = hit
+                headers = {k: v for k, v in headers.items() if k.lower() not in ("content-length", "transfer-encoding", "content-encoding")}
+                ctype = headers.pop("Content-Type", "text/html")
+                return self.send(status, body, ctype, headers)
+            if u.path.startswith("/en/search"):
+                return self.send(200, search_page(parse_qs(u.query), cfg))
+            if u.path.startswith("/en/cases/"):
+                ident = Path(u.path).stem
+                return self.send(200, detail_page(ident, cfg), headers={"ETag": f'"{ident}"'})
+            if u.path.startswith("/en/files/"):
+                return self.send(200, attachment(Path(u.path).stem, cfg), "application/pdf")
+            self.send(404, b"", "text/plain")
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 256  # the default backlog of 5 drops SYNs (1 s retransmit)
+
+    httpd = Server(("127.0.0.1", 0), Handler)
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    if cfg["replay"]:
+        replay = load_replay(cfg["replay"], base)
+    port_q.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def use_mongomock():
+    import mongomock
+    import mongomock.collection
+    import crawler.known
+    import crawler.pipelines_mongo
+    # pymongo >= 4.11 passes sort= to bulk builders; older mongomock rejects it.
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+    mongomock.collection.BulkOperationBuilder.add_update = lambda self, *a, sort=None, **kw: add_update(self, *a, **kw)
+    shared = mongomock.MongoClient()
+    factory = lambda *a, **kw: shared  # noqa: E731
+    crawler.known.MongoClient = factory
+    crawler.pipelines_mongo.MongoClient = factory
+
+
+def run_crawl(base, args, files_dir):
+    from scrapy import signals
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    from crawler.httpcache import resource_kind
+    from crawler.spiders.search import SearchSpider
+
+    class BenchSpider(SearchSpider):
+        base_url = base
+        allowed_domains = ["127.0.0.1"]
+
+    settings = get_project_settings()
+    settings.set("FILES_STORE", files_dir)
+    settings.set("HTTPCACHE_ENABLED", False)
+    settings.set("LOG_LEVEL", "WARNING")
+    settings.set("TELNETCONSOLE_ENABLED", False)
+    for kv in args.set:
+        k, _, v = kv.partition("=")
+        settings.set(k, v, priority="cmdline")
+
+    latencies = {"search": [], "detail": [], "attachment": []}
+    detail_seen = {}
+    item_latency = []
+
+    def on_response(response, request, spider):
+        lat = request.meta.get("download_latency")
+        if lat is not None:
+            kind = resource_kind(request)
+            latencies[kind].append(lat)
+            if kind == "detail":
+                detail_seen[request.url] = time.perf_counter()
+
+    def on_item(item, response, spider):
+        t0 = detail_seen.pop(item.get("detail_url"), None)
+        if t0 is not None:
+            item_latency.append(time.perf_counter() - t0)
+
+    spider_args = {"date_from": args.date_from, "date_to": args.date_to, "body": args.body}
+    for kv in args.arg:
+        k, _, v = kv.partition("=")
+        spider_args[k] = v
+
+    process = CrawlerProcess(settings, install_root_handler=True)
+    crawler = process.create_crawler(BenchSpider)
+    crawler.signals.connect(on_response, signal=signals.response_received)
+    crawler.signals.connect(on_item, signal=signals.item_scraped)
+    t0 = time.perf_counter()
+    process.crawl(crawler, **spider_args)
+    process.start()
+    elapsed = time.perf_counter() - t0
+    return crawler.stats.get_stats(), elapsed, latencies, item_latency
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline end-to-end crawler benchmark.")
+    ap.add_argument("--date-from", default="1/1/2024")
+    ap.add_argument("--date-to", default="31/3/2024")
+    ap.add_argument("--body", default="15376")
+    ap.add_argument("--pages", type=int, default=5, help="full search pages per shard")
+    ap.add_argument("--per-page", type=int, default=10)
+    ap.add_argument("--paragraphs", type=int, default=60, help="paragraphs per detail page")
+    ap.add_argument("--attachment-rate", type=float, default=0.8)
+    ap.add_argument("--attachment-kb", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=50)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--replay", help="SQLite HTTP cache file to serve instead of synthetic pages")
+    ap.add_argument("--mongo-uri", help="local mongod; mongomock when omitted")
+    ap.add_argument("-s", dest="set", action="append", default=[], help="setting override NAME=VALUE")
+    ap.add_argument("-a", dest="arg", action="append", default=[], help="spider argument NAME=VALUE")
+    ap.add_argument("--out", help="write results as JSON")
+    ap.add_argument("--baseline", help="earlier --out file to compare with")
+    args = ap.parse_args()
+
+    cfg = {k: getattr(args, k) for k in ("pages", "per_page", "paragraphs", "attachment_rate",
+                                          "attachment_kb", "latency_ms", "error_rate", "replay")}
+    ctx = mp.get_context("spawn")
+    port_q = ctx.Queue()
+    server = ctx.Process(target=serve, args=(cfg, port_q), daemon=True)
+    server.start()
+    base = f"http://127.0.0.1:{port_q.get(timeout=30)}"
+
+    coll = f"bench_{int(time.time())}"
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+        os.environ["MONGO_COLLECTION"] = coll
+    else:
+        use_mongomock()
+
+    files_dir = tempfile.mkdtemp(prefix="bench_crawl_")
+    try:
+        stats, elapsed, latencies, item_latency = run_crawl(base, args, files_dir)
+    finally:
+        shutil.rmtree(files_dir, ignore_errors=True)
+        server.terminate()
+        if args.mongo_uri:
+            from pymongo import MongoClient
+            client = MongoClient(args.mongo_uri)
+            client[os.getenv("MONGO_DB", "kedra")].drop_collection(coll)
+            client.close()
+
+    items = stats.get("item_scraped_count", 0)
+    requests = stats.get("downloader/request_count", 0)
+    result = {
+        "elapsed_s": round(elapsed, 3),
+        "items": items,
+        "requests": requests,
+        "items_per_s": round(items / elapsed, 2),
+        "requests_per_s": round(requests / elapsed, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "retries": stats.get("retry/count", 0),
+        "mongo_flush_ms_max": stats.get("mongo/flush_latency_ms_max"),
+    }
+    stages = dict(latencies, item=item_latency)
+    for stage, values in stages.items():
+        for q in (50, 99):
+            v = percentile(values, q)
+            result[f"{stage}_p{q}_ms"] = round(v * 1000, 1) if v is not None else None
+
+    print(f"{'metric':<22} {'value':>10}" + (f" {'baseline':>10} {'change':>8}" if args.baseline else ""))
+    base_result = json.load(open(args.baseline)) if args.baseline else {}
+    for k, v in result.items():
+        line = f"{k:<22} {v if v is not None else '-':>10}"
+        if args.baseline:
+            b = base_result.get(k)
+            change = f"{(v - b) / b * 100:+.1f}%" if isinstance(v, (int, float)) and b else "-"
+            line += f" {b if b is not None else '-':>10} {change:>8}"
+        print(line)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), **result}, f, indent=2)
+    sys.exit(0 if items else 1)
+
+
+if __name__ == "__main__":
+    main()
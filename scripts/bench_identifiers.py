@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Compare search-card identifier extraction before and after the combined regex.
+
+usage: bench_identifiers.py [--corpus JSONL] [--cards N] [--repeat N]
+
+Without --corpus a synthetic set of card titles and detail URLs is generated
+in the shapes the site uses (ADJ/IR-SC/LCR/... identifiers, year/month URL
+paths, titles without a recognised identifier). With --corpus, `title` and
+`detail_url` are read from a crawl output file such as data/landing/out.jsonl.
+The previous per-pattern implementation is kept below as the reference; every
+card must give the same identifier.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from crawler import utility  # noqa: E402
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
+
+def legacy_card_identifier(detail_url, title_txt):
+    # SearchSpider.card_identity before the combined regex.
+    def normalize(detail_url, title_text=""):
+        hay = f"{detail_url} {title_text}".strip()
+        for pat in utility.ID_PATTERNS:
+            m = pat.search(hay)
+            if m:
+                return m.group(1).upper()
+        try:
+            seg = os.path.basename(urlparse(detail_url).path)
+            seg = re.sub(r"\.(html?|pdf|docx?)$", "", seg, flags=re.IGNORECASE)
+            seg = re.sub(r"[^A-Za-z0-9\-]+", "-", seg).strip("-")
+            if seg:
+                return seg.upper()
+        except Exception:
+            pass
+        t = (title_text or "").strip()
+        if t:
+            t = re.sub(r"[^A-Za-z0-9\-]+", "-", t).strip("-")
+            if t:
+                return t.upper()
+        return "NOID"
+
+    def guess(text_or_url):
+        if not text_or_url:
+            return None
+        m = re.search(r"\b(ADJ|WTC|EET|DEC|LCR|EDA|UD|MN|CA)-?[A-Z0-9\-_/]{4,}\b", text_or_url, re.IGNORECASE)
+        return m.group(0).upper() if m else None
+
+    ident = normalize(detail_url or "", title_txt)
+    if not ident or ident == "NOID":
+        g = guess(f"{title_txt} {detail_url or ''}")
+        ident = g if g else ident
+    if not ident or ident == "NOID":
+        seg = ""
+        if detail_url:
+            seg = os.path.basename(urlparse(detail_url).path)
+            seg = re.sub(r"\.(html?|pdf|docx?)$", "", seg, flags=re.IGNORECASE)
+            seg = re.sub(r"[^A-Za-z0-9\-]+", "-", seg).strip("-")
+        ident = (seg or "NOID").upper()
+    return ident.replace("/", "-").replace("\\", "-").strip()
+
+
+def synthetic_cards(rnd: random.Random, n: int):
+    cards = []
+    for _ in range(n):
+        year = rnd.randint(2008, 2025)
+        base = f"https://www.workplacerelations.ie/en/cases/{year}/{rnd.choice(MONTHS)}/"
+        kind = rnd.random()
+        if kind < 0.55:
+            ident = f"ADJ-{rnd.randint(1, 99999):08d}"
+            cards.append((base + ident.lower() + ".html", ident))
+        elif kind < 0.7:
+            ident = rnd.choice(["LCR", "DEC", "EET"]) + f"-{rnd.randint(10000, 99999)}"
+            cards.append((base + ident.lower() + ".html", f"{ident} - Labour Court Recommendation"))
+        elif kind < 0.8:
+            ident = f"{rnd.choice(['UD', 'MN', 'WTC', 'EDA'])}-{rnd.randint(100, 2000)}/{year % 100:02d}"
+            cards.append((base + ident.replace("/", "-").lower() + ".html", ident))
+        elif kind < 0.88:
+            ident = f"IR-SC-{rnd.randint(10000, 99999):08d}"
+            cards.append((base + f"ir-sc-{rnd.randint(1, 999)}.html", f"{ident} (Section 13 referral)"))
+        elif kind < 0.95:
+            cards.append((base + f"decision-{rnd.randint(1, 9999)}.html", "Determination of the Labour Court"))
+        else:
+            cards.append((f"https://www.workplacerelations.ie/en/cases/{year}/", "—"))
+    return cards
+
+
+def load_corpus(path, n):
+    cards = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            cards.append((rec.get("detail_url"), rec.get("title") or ""))
+            if len(cards) >= n:
+                break
+    return cards
+
+
+def run(fn, cards, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for url, title in cards:
+            fn(url, title)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark search-card identifier extraction.")
+    ap.add_argument("--corpus", help="JSONL crawl output with title/detail_url")
+    ap.add_argument("--cards", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    cards = load_corpus(args.corpus, args.cards) if args.corpus else synthetic_cards(random.Random(7), args.cards)
+
+    mismatches = [(u, t) for u, t in cards if legacy_card_identifier(u, t) != utility.card_identifier(u, t)]
+    for u, t in mismatches[:10]:
+        print(f"MISMATCH {u!r} {t!r}: {legacy_card_identifier(u, t)} != {utility.card_identifier(u, t)}")
+
+    uncached = utility.card_identifier.__wrapped__
+    legacy = run(legacy_card_identifier, cards, args.repeat)
+    combined = run(uncached, cards, args.repeat)
+    utility.card_identifier.cache_clear()
+    first = run(utility.card_identifier, cards, 1)
+    warm = run(utility.card_identifier, cards, args.repeat)
+
+    n = len(cards)
+    print(f"cards={n} mismatches={len(mismatches)}")
+    for name, t in (("legacy", legacy), ("combined", combined), ("memo-first", first), ("memo-warm", warm)):
+        print(f"{name:<11} {t * 1000:8.1f} ms  {t / n * 1e6:6.2f} us/card  x{legacy / t:5.1f}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
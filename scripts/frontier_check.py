@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Exercise MongoFrontierScheduler from several processes against a local mongod.
+
+usage: frontier_check.py [--workers N] [--requests N] [--lease SECS]
+
+Every worker enqueues the same request set (only one copy may be stored),
+then claims until the frontier is drained. A first worker claims a few
+requests and exits without finishing them; their leases must expire and be
+picked up by the others. The check passes when every URL was completed
+exactly once.
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import scrapy  # noqa: E402
+from scrapy.utils.test import get_crawler  # noqa: E402
+from crawler.frontier import MongoFrontierScheduler  # noqa: E402
+
+
+class CheckSpider(scrapy.Spider):
+    name = "frontier_check"
+
+    def parse(self, response):
+        pass
+
+
+def make_scheduler(crawl_id, lease):
+    crawler = get_crawler(CheckSpider, {
+        "FRONTIER_CRAWL_ID": crawl_id,
+        "FRONTIER_COLLECTION": "frontier_check",
+        "FRONTIER_LEASE_SECS": lease,
+    })
+    spider = CheckSpider.from_crawler(crawler)
+    sched = MongoFrontierScheduler.from_crawler(crawler)
+    sched.open(spider)
+    return sched, spider
+
+
+def urls(n):
+    return [f"https://example.invalid/page/{i}" for i in range(n)]
+
+
+def worker(crawl_id, n, lease, out, die_after=None):
+    sched, spider = make_scheduler(crawl_id, lease)
+    for url in urls(n):
+        sched.enqueue_request(scrapy.Request(url, callback=spider.parse))
+    if die_after is not None:
+        for _ in range(die_after):
+            sched.next_request()
+        os._exit(0)  # simulated crash: these leases are never released
+    done = []
+    idle_since = None
+    while True:
+        req = sched.next_request()
+        if req is None:
+            if not sched.has_pending_requests():
+                break
+            idle_since = idle_since or time.time()
+            if time.time() - idle_since > lease * 4:
+                break
+            time.sleep(0.2)
+            continue
+        idle_since = None
+        done.append(req.url)
+        sched.ack(req.meta["frontier_id"])
+    sched.close("finished")
+    out.put(done)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-process check of the Mongo crawl frontier.")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--lease", type=float, default=2.0)
+    args = ap.parse_args()
+
+    crawl_id = f"check-{int(time.time())}"
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    crasher = ctx.Process(target=worker, args=(crawl_id, args.requests, args.lease, out, 5))
+    crasher.start()
+    crasher.join()
+    procs = [ctx.Process(target=worker, args=(crawl_id, args.requests, args.lease, out)) for _ in range(args.workers)]
+    for p in procs:
+        p.start()
+    completed = []
+    for _ in procs:
+        completed.extend(out.get())
+    for p in procs:
+        p.join()
+
+    sched, _ = make_scheduler(crawl_id, args.lease)
+    sched.coll.delete_many({"crawl": crawl_id})
+    sched.close("finished")
+
+    dupes = len(completed) - len(set(completed))
+    missing = set(urls(args.requests)) - set(completed)
+    print(f"completed={len(completed)} unique={len(set(completed))} duplicates={dupes} missing={len(missing)}")
+    sys.exit(0 if not dupes and not missing else 1)
+
+
+if __name__ == "__main__":
+    main()
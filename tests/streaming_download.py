@@ -0,0 +1,82 @@
+# Downloads through StreamingDownloadHandler from a local server, in a
+# process of its own so test_streaming does not install a reactor in the
+# test session. Prints one JSON object per download.
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scrapy.utils.reactor import install_reactor  # noqa: E402
+
+install_reactor("twisted.internet.asyncioreactor.AsyncioSelectorReactor")
+
+from scrapy import Spider  # noqa: E402
+from scrapy.http import Request  # noqa: E402
+from scrapy.utils.defer import deferred_from_coro  # noqa: E402
+from scrapy.utils.test import get_crawler  # noqa: E402
+from twisted.internet import defer, protocol, reactor  # noqa: E402
+
+from crawler import streaming  # noqa: E402
+
+BODY = os.urandom(300 * 1024)
+RESPONSES = {
+    b"/ok.pdf": b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(BODY) + BODY,
+    b"/loss.pdf": b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % (len(BODY) + 10) + BODY,
+    b"/missing.pdf": b"HTTP/1.1 404 Not Found\r\nContent-Length: 9\r\n\r\nnot found",
+}
+
+
+class Server(protocol.Protocol):
+    def dataReceived(self, data):
+        self.transport.write(RESPONSES[data.split(b" ")[1]])
+        self.transport.loseConnection()
+
+
+@defer.inlineCallbacks
+def download(handler, port, path, incoming):
+    request = Request(f"http://127.0.0.1:{port}{path}", meta={"files_stream": incoming})
+    out = {"path": path}
+    try:
+        response = yield handler.download_request(request, Spider("streaming"))
+    except Exception as e:
+        out["error"] = type(e).__name__
+    else:
+        out.update(status=response.status, flags=response.flags, body_sha256=hashlib.sha256(response.body).hexdigest())
+        streamed = request.meta.get("files_streamed")
+        if streamed:
+            data = Path(streamed["path"]).read_bytes()
+            out["file"] = {"size": streamed["size"], "sha256": streamed["sha256"],
+                           "file_sha256": hashlib.sha256(data).hexdigest()}
+            os.unlink(streamed["path"])
+    out["left"] = sorted(os.listdir(incoming))
+    print(json.dumps(out), flush=True)
+
+
+@defer.inlineCallbacks
+def main(port):
+    incoming = tempfile.mkdtemp()
+    handler = streaming.StreamingDownloadHandler.from_crawler(get_crawler(Spider))
+    for path in ("/ok.pdf", "/loss.pdf", "/missing.pdf"):
+        yield download(handler, port, path, incoming)
+    yield deferred_from_coro(handler.close())
+
+    # A Scrapy release without the reader's body buffer: buffered instead.
+    reader = streaming.http11._ResponseReader
+    del streaming.http11._ResponseReader
+    try:
+        handler = streaming.StreamingDownloadHandler.from_crawler(get_crawler(Spider))
+    finally:
+        streaming.http11._ResponseReader = reader
+    yield download(handler, port, "/ok.pdf", incoming)
+    yield deferred_from_coro(handler.close())
+
+
+if __name__ == "__main__":
+    print(json.dumps({"body_sha256": hashlib.sha256(BODY).hexdigest()}), flush=True)
+    port = reactor.listenTCP(0, protocol.Factory.forProtocol(Server), interface="127.0.0.1").getHost().port
+    main(port).addErrback(lambda f: f.printTraceback(file=sys.stderr)).addBoth(lambda _: reactor.stop())
+    reactor.run()
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+import lxml.html
+import pytest
+
+import transform_landing as tl
+
+PAGES = sorted((Path(__file__).parent / "fixtures" / "clean_html").glob("*.html"))
+
+
+def signature(html):
+    # What the curated page says and how: title, element sequence and text.
+    root = lxml.html.document_fromstring(html)
+    title = (root.findtext(".//title") or "").strip()
+    tags = [el.tag for el in root.iter() if isinstance(el.tag, str)]
+    text = " ".join(" ".join(root.itertext()).split())
+    return title, tags, text
+
+
+@pytest.mark.parametrize("page", PAGES, ids=lambda p: p.stem)
+def test_lxml_cleaner_matches_bs4(page):
+    html = page.read_text(encoding="utf-8")
+    assert signature(tl.clean_html_lxml(html)) == signature(tl.clean_html_bs4(html))
@@ -0,0 +1,55 @@
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+mongomock = pytest.importorskip("mongomock")
+
+import export_parquet as ep  # noqa: E402
+
+
+def doc(identifier, decision_date, updated_at, body="Labour Court", files=1):
+    return {"_id": identifier, "identifier": identifier, "detail_url": f"https://x/{identifier}.html",
+            "title": identifier, "decision_date": decision_date, "partition_date": decision_date[:7],
+            "body": body, "updated_at": updated_at,
+            "stored_files": [{"url": f"https://x/{identifier}-{i}.pdf", "stored_file_path": f"{identifier}-{i}.pdf"}
+                             for i in range(files)]}
+
+
+def exported(root, name="decisions"):
+    parts = {}
+    for path in sorted((root / name).rglob("*.parquet")):
+        part = (path.parent.parent.name.split("=")[1], path.parent.name.split("=")[1])
+        parts[part] = pq.read_table(path, partitioning=None).column("identifier").to_pylist()
+    return parts
+
+
+@pytest.fixture
+def src():
+    return mongomock.MongoClient().db.decisions
+
+
+def test_incremental_run_replaces_updated_rows(src, tmp_path):
+    src.insert_many([doc("A", "2024-01-05", "T1"), doc("B", "2024-01-09", "T1")])
+    ep.run(src, tmp_path)
+    src.update_one({"_id": "A"}, {"$set": {"title": "A v2", "updated_at": "T2"},
+                                  "$push": {"stored_files": {"url": "https://x/A-1.pdf"}}})
+    counts = ep.run(src, tmp_path, since="T2")
+    assert counts["docs"] == 1 and counts["moved"] == 0
+    assert exported(tmp_path) == {("2024-01", "labour-court"): ["A", "B"]}
+    assert sorted(exported(tmp_path, "stored_files")[("2024-01", "labour-court")]) == ["A", "A", "B"]
+    table = pq.read_table(ep.partition_path(tmp_path, "decisions", ("2024-01", "labour-court")), partitioning=None)
+    assert table.column("title").to_pylist() == ["A v2", "B"]
+
+
+def test_incremental_run_takes_moved_rows_out_of_their_old_partition(src, tmp_path):
+    src.insert_many([doc("A", "2024-01-05", "T1"), doc("B", "2024-01-09", "T1"), doc("C", "2024-02-01", "T1")])
+    ep.run(src, tmp_path)
+    src.update_one({"_id": "A"}, {"$set": {"decision_date": "2024-03-01", "partition_date": "2024-03",
+                                           "updated_at": "T2"}})
+    src.update_one({"_id": "C"}, {"$set": {"body": "Equality Tribunal", "updated_at": "T2"}})
+    counts = ep.run(src, tmp_path, since="T2")
+    assert counts["moved"] == 2
+    assert exported(tmp_path) == {("2024-01", "labour-court"): ["B"],
+                                  ("2024-03", "labour-court"): ["A"],
+                                  ("2024-02", "equality-tribunal"): ["C"]}
+    assert exported(tmp_path, "stored_files") == exported(tmp_path)
+    assert ep.load_keys(tmp_path)["A\x1fhttps://x/A.html"] == ("2024-03", "labour-court")
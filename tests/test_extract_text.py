@@ -0,0 +1,46 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+import extract_text as et
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def curated(tmp_path, *names):
+    files = []
+    for name in names:
+        shutil.copy(FIXTURES / name, tmp_path / name)
+        files.append({"status": "copied", "new_file_path": name, "new_file_hash": f"hash-{name}"})
+    return {"_id": 1, "identifier": "ADJ-00012345", "new_files": files}
+
+
+def test_html_text_comes_from_the_curated_article():
+    text, pages, engine = et.extract_html(FIXTURES / "decision.html")
+    assert text.splitlines() == ["ADJ-00012345", "The complaint is", "not", "well founded.",
+                                 "Adjudication Officer: J. Murphy"]
+    assert (pages, engine) == (1, "lxml")
+
+
+def test_extracts_pdf_and_html_and_skips_them_once_current(tmp_path):
+    if et.PdfReader is None and not shutil.which("pdftotext"):
+        pytest.skip("no PDF parser")
+    rec = curated(tmp_path, "decision.pdf", "decision.html")
+    [(_, update, pages, files, error)] = et.extract_chunk([rec], tmp_path)
+    assert error is None and (pages, files) == (2, 2)
+    pdf, html = update["text_files"]
+    assert pdf["status"] == html["status"] == "extracted"
+    assert "The complaint is well founded." in (tmp_path / pdf["text_path"]).read_text(encoding="utf-8")
+    assert (tmp_path / html["text_path"]).read_text(encoding="utf-8").startswith("ADJ-00012345\n")
+    assert "Adjudication Officer" in update["text"] and "well founded" in update["text"]
+
+    rec["text_files"] = update["text_files"]
+    assert et.extract_one(rec, tmp_path) is None
+
+
+def test_unknown_extension_is_unsupported(tmp_path):
+    (tmp_path / "decision.rtf").write_bytes(b"{\\rtf1 text}")
+    rec = {"_id": 1, "new_files": [{"status": "copied", "new_file_path": "decision.rtf", "new_file_hash": "h"}]}
+    [entry], pages, files = et.extract_one(rec, tmp_path)
+    assert entry["status"] == "unsupported" and (pages, files) == (0, 0)
@@ -0,0 +1,93 @@
+import pytest
+from scrapy import Spider, signals
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+
+from crawler.frontier import FrontierAckMiddleware, MongoFrontierScheduler, claim_processed
+
+FRONTIER = {"SCHEDULER": "crawler.frontier.MongoFrontierScheduler", "FRONTIER_CRAWL_ID": "test"}
+
+
+class FakeMongo:
+    def __init__(self):
+        self.pending = []
+
+    def written(self):
+        d = defer.Deferred()
+        self.pending.append(d)
+        return d
+
+
+class Acks(list):
+    # Signal receivers are held weakly, so this one lives with the test.
+    def record(self, frontier_id, state):
+        self.append((frontier_id, state))
+
+
+def setup(mongo=None):
+    crawler = get_crawler(Spider, FRONTIER)
+    if mongo is not None:
+        crawler.mongo_pipeline = mongo
+    acks = Acks()
+    crawler.signals.connect(acks.record, signal=claim_processed)
+    return crawler, FrontierAckMiddleware.from_crawler(crawler), acks
+
+
+def claimed_response(_id="claim-1"):
+    request = Request("https://www.workplacerelations.ie/en/search/", meta={"frontier_id": _id})
+    return Response(request.url, request=request)
+
+
+def test_claim_waits_for_items_and_the_mongo_write():
+    mongo = FakeMongo()
+    crawler, mw, acks = setup(mongo)
+    response = claimed_response()
+    item = {"identifier": "ADJ-00000001"}
+    out = list(mw.process_spider_output(response, [item, Request("https://www.workplacerelations.ie/x")], None))
+    assert len(out) == 2
+    assert acks == []
+    crawler.signals.send_catch_log(signals.item_scraped, item=item, response=response, spider=None)
+    assert acks == []
+    mongo.pending[0].callback(None)
+    assert acks == [("claim-1", "done")]
+
+
+def test_claim_without_items_is_done_when_the_callback_returns():
+    crawler, mw, acks = setup(FakeMongo())
+    list(mw.process_spider_output(claimed_response(), [], None))
+    assert acks == [("claim-1", "done")]
+
+
+def test_failed_download_fails_the_claim():
+    crawler, mw, acks = setup()
+    mw.process_exception(claimed_response().request, ConnectionError(), None)
+    mw.process_exception(claimed_response("claim-2").request, IgnoreRequest(), None)
+    assert acks == [("claim-1", "failed"), ("claim-2", "done")]
+
+
+def test_scheduler_requires_a_crawl_id():
+    crawler = get_crawler(Spider, {"SCHEDULER": "crawler.frontier.MongoFrontierScheduler"})
+    with pytest.raises(ValueError):
+        MongoFrontierScheduler.from_crawler(crawler)
+
+
+def test_a_new_crawl_id_enqueues_and_drains_the_same_urls():
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient()
+    urls = [f"https://www.workplacerelations.ie/en/search/?pageNumber={i}" for i in range(1, 4)]
+    for crawl_id in ("crawl-1", "crawl-2"):
+        crawler = get_crawler(Spider, dict(FRONTIER, FRONTIER_CRAWL_ID=crawl_id))
+        sched = MongoFrontierScheduler.from_crawler(crawler)
+        spider = Spider("frontier-test")
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr("crawler.frontier.MongoClient", lambda *a, **kw: client)
+            sched.open(spider)
+        assert all(sched.enqueue_request(Request(url)) for url in urls)
+        drained = []
+        while (request := sched.next_request()) is not None:
+            drained.append(request.url)
+            sched.ack(request.meta["frontier_id"])
+        assert sorted(drained) == sorted(urls)
+        assert not sched.has_pending_requests()
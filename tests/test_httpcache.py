@@ -0,0 +1,125 @@
+import time
+
+import pytest
+from scrapy import Spider
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from crawler import httpcache
+from crawler.httpcache import ResourceTTLPolicy, SqliteCacheStorage
+
+URL = "https://www.workplacerelations.ie/en/cases/2024/january/adj-00012345.html"
+
+
+def stale(request):
+    request.meta["cache_timestamp"] = time.time() - 30 * 86400
+    return request
+
+
+def test_stale_entry_is_replaced_by_a_fresh_response():
+    policy = ResourceTTLPolicy(Settings())
+    request = stale(Request(URL))
+    cached = Response(URL, body=b"old")
+    assert not policy.is_cached_response_fresh(cached, request)
+    assert not policy.is_cached_response_valid(cached, Response(URL, body=b"new"), request)
+
+
+def test_stale_entry_revalidates_with_304():
+    policy = ResourceTTLPolicy(Settings())
+    request = stale(Request(URL))
+    cached = Response(URL, body=b"old", headers={"ETag": '"v1"'})
+    assert not policy.is_cached_response_fresh(cached, request)
+    assert request.headers[b"If-None-Match"] == b'"v1"'
+    not_modified = Response(URL, status=304)
+    assert policy.is_cached_response_valid(cached, not_modified, request)
+    assert not policy.should_cache_response(not_modified, request)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(httpcache, "time", clock)
+    return clock
+
+
+def storage(tmp_path, **settings):
+    crawler = get_crawler(Spider)
+    spider = Spider("search")
+    spider.crawler = crawler
+    store = SqliteCacheStorage(Settings(dict({"HTTPCACHE_DIR": str(tmp_path)}, **settings)))
+    store.open_spider(spider)
+    return store, spider, crawler.stats
+
+
+def stored_sizes(store):
+    return store.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def test_sqlite_storage_round_trip(tmp_path, clock):
+    store, spider, _ = storage(tmp_path)
+    page = b"<html><body>" + b"<p>The complaint is not well founded.</p>" * 200 + b"</body></html>"
+    store.store_response(spider, Request(URL), HtmlResponse(URL, body=page, headers={"ETag": '"v1"'}))
+    pdf_url = URL.replace(".html", ".pdf")
+    store.store_response(spider, Request(pdf_url), Response(pdf_url, body=b"%PDF-1.4" + b"x" * 1000))
+
+    rows = dict(store.db.execute("SELECT kind, compressed FROM responses"))
+    assert rows == {"detail": 1, "attachment": 0}
+    assert stored_sizes(store) < len(page)
+
+    request = Request(URL)
+    cached = store.retrieve_response(spider, request)
+    assert isinstance(cached, HtmlResponse)
+    assert (cached.status, cached.body, cached.headers[b"ETag"]) == (200, page, b'"v1"')
+    assert request.meta["cache_timestamp"] == clock.now
+    assert store.retrieve_response(spider, Request(pdf_url)).body == b"%PDF-1.4" + b"x" * 1000
+
+
+def test_sqlite_storage_size_accounting(tmp_path, clock):
+    store, spider, stats = storage(tmp_path)
+    for i in range(3):
+        store.store_response(spider, Request(f"{URL}?v={i}"), Response(URL, body=b"x" * 100 * (i + 1)))
+    store.store_response(spider, Request(f"{URL}?v=0"), Response(URL, body=b"y" * 5000))
+    assert store.total_bytes == stored_sizes(store) == stats.get_value("httpcache/sqlite_bytes")
+    store.close_spider(spider)
+    reopened, _, stats = storage(tmp_path)
+    assert reopened.total_bytes == stored_sizes(reopened) == stats.get_value("httpcache/sqlite_bytes")
+
+
+def test_sqlite_storage_evicts_least_recently_read_entries(tmp_path, clock):
+    store, spider, stats = storage(tmp_path, HTTPCACHE_SQLITE_COMPRESS_LEVEL=0)
+    urls = [f"{URL}?v={i}" for i in range(4)]
+    for url in urls[:3]:
+        clock.now += 1
+        store.store_response(spider, Request(url), Response(url, body=b"x" * 1000))
+    clock.now += 1
+    assert store.retrieve_response(spider, Request(urls[0])) is not None  # now the most recently read
+    store.max_bytes = stored_sizes(store) + 500
+    clock.now += 1
+    store.store_response(spider, Request(urls[3]), Response(urls[3], body=b"x" * 1000))
+    kept = [url for url in urls if store.retrieve_response(spider, Request(url)) is not None]
+    assert kept == [urls[0], urls[2], urls[3]]
+    assert stats.get_value("httpcache/sqlite_evicted") == 1
+    assert store.total_bytes == stored_sizes(store) <= store.max_bytes * 0.9
+
+
+def test_sqlite_storage_hit_and_miss_stats(tmp_path, clock):
+    store, spider, stats = storage(tmp_path, HTTPCACHE_EXPIRATION_SECS=60)
+    search = "https://www.workplacerelations.ie/en/search/?pageNumber=1"
+    assert store.retrieve_response(spider, Request(search)) is None
+    store.store_response(spider, Request(search), Response(search, body=b"page"))
+    assert store.retrieve_response(spider, Request(search)) is not None
+    clock.now += 61
+    assert store.retrieve_response(spider, Request(search)) is None  # expired
+    assert store.retrieve_response(spider, Request(URL)) is None
+    assert stats.get_value("httpcache/sqlite_hit/search") == 1
+    assert stats.get_value("httpcache/sqlite_miss/search") == 2
+    assert stats.get_value("httpcache/sqlite_miss/detail") == 1
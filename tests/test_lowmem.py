@@ -0,0 +1,49 @@
+import os
+
+from scrapy import Spider, signals
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from crawler import settings as project_settings
+from crawler.lowmem import LowMemoryMode
+
+
+def test_temporary_jobdir_is_removed_when_the_engine_stops():
+    crawler = get_crawler(Spider)
+    settings = Settings({"LOW_MEMORY": True})
+    addon = LowMemoryMode.from_crawler(crawler)  # held by the AddonManager in a crawl
+    addon.update_settings(settings)
+    jobdir = settings["JOBDIR"]
+    assert os.path.isdir(jobdir)
+    crawler.signals.send_catch_log(signals.engine_stopped)
+    assert not os.path.exists(jobdir)
+
+
+def test_configured_jobdir_is_kept(tmp_path):
+    addon = LowMemoryMode(get_crawler(Spider))
+    settings = Settings({"LOW_MEMORY": True, "JOBDIR": str(tmp_path)})
+    addon.update_settings(settings)
+    assert addon.temp_jobdir is None
+    assert settings["JOBDIR"] == str(tmp_path)
+
+
+def test_low_memory_overrides_project_settings():
+    # settings.py at "project" priority, as in a crawl, and the addon applied
+    # by Crawler._apply_settings(); the stock handlers keep the reactor out.
+    project = {k: getattr(project_settings, k) for k in dir(project_settings) if k.isupper()}
+    project.pop("DOWNLOAD_HANDLERS")
+    crawler = get_crawler(Spider, dict(project, LOW_MEMORY=True))
+    try:
+        assert crawler.settings.getint("MONGO_BULK_MAX_PENDING") == 200
+        assert crawler.settings.getint("CONCURRENT_ITEMS") == 25
+        assert crawler.settings["DUPEFILTER_CLASS"] == "crawler.lowmem.SqliteDupeFilter"
+    finally:
+        crawler.signals.send_catch_log(signals.engine_stopped)
+
+
+def test_command_line_overrides_low_memory():
+    settings = Settings({"LOW_MEMORY": True, "JOBDIR": "unused"})
+    settings.set("CONCURRENT_ITEMS", 10, priority="cmdline")
+    LowMemoryMode(get_crawler(Spider)).update_settings(settings)
+    assert settings.getint("CONCURRENT_ITEMS") == 10
+    assert settings.getint("MONGO_BULK_MAX_PENDING") == 200
@@ -0,0 +1,134 @@
+import builtins
+import hashlib
+import os
+
+import pytest
+from scrapy import Spider
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+from crawler.pipelines import DecisionFilesPipeline, content_length
+
+URL = "https://www.workplacerelations.ie/en/cases/2024/january/adj-00012345.pdf"
+BODY = b"%PDF-1.4 " + os.urandom(256 * 1024)
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    # Bytes read through open(), per absolute path.
+    counted = {}
+    real_open = builtins.open
+
+    class Counting:
+        def __init__(self, f, path):
+            self._f, self._path = f, path
+
+        def read(self, *args):
+            data = self._f.read(*args)
+            counted[self._path] = counted.get(self._path, 0) + len(data)
+            return data
+
+        def __enter__(self):
+            self._f.__enter__()
+            return self
+
+        def __exit__(self, *exc):
+            return self._f.__exit__(*exc)
+
+        def __getattr__(self, name):
+            return getattr(self._f, name)
+
+    def counting_open(file, mode="r", *args, **kwargs):
+        f = real_open(file, mode, *args, **kwargs)
+        if isinstance(file, (str, os.PathLike)) and "r" in mode and "+" not in mode:
+            return Counting(f, os.path.abspath(file))
+        return f
+
+    monkeypatch.setattr(builtins, "open", counting_open)
+    return counted
+
+
+def pipeline(store, **settings):
+    crawler = get_crawler(Spider, dict({"FILES_STORE": str(store)}, **settings))
+    return DecisionFilesPipeline.from_crawler(crawler)
+
+
+def request(**meta):
+    return Request(URL, meta=dict({"identifier": "ADJ-00012345", "body": "15376",
+                                   "partition_date": "2024-01"}, **meta))
+
+
+def streamed_response(store, req):
+    incoming = os.path.join(str(store), ".incoming")
+    os.makedirs(incoming, exist_ok=True)
+    path = os.path.join(incoming, ".part-test")
+    with open(path, "wb") as f:
+        f.write(BODY)
+    req.meta["files_streamed"] = {"path": path, "size": len(BODY), "sha256": hashlib.sha256(BODY).hexdigest(),
+                                  "md5": hashlib.md5(BODY).hexdigest()}
+    return Response(URL, headers={"Content-Type": "application/pdf"}, flags=["streamed"], request=req)
+
+
+def stored(store, item):
+    return os.path.abspath(os.path.join(str(store), item["stored_files"][0]["stored_file_path"]))
+
+
+@pytest.mark.parametrize("settings", [{}, {"FILES_CAS_ENABLED": True}])
+def test_buffered_download_is_never_read_back(tmp_path, reads, settings):
+    pipe, req, item = pipeline(tmp_path, **settings), request(), {}
+    response = Response(URL, body=BODY, headers={"Content-Type": "application/pdf"}, request=req)
+    pipe.file_downloaded(response, req, None, item=item)
+    with open(stored(tmp_path, item), "rb") as f:
+        assert f.read() == BODY
+    reads.clear()
+    pipe.file_downloaded(response, req, None, item={})
+    assert reads == {}
+
+
+@pytest.mark.parametrize("settings", [{}, {"FILES_CAS_ENABLED": True}])
+def test_streamed_download_reads_only_the_sniffed_head(tmp_path, reads, settings):
+    pipe, req, item = pipeline(tmp_path, **settings), request(), {}
+    pipe.file_downloaded(streamed_response(tmp_path, req), req, None, item=item)
+    # One read of the temp file, for content sniffing, and none of the
+    # stored file.
+    assert list(reads.values()) == [4096]
+    assert stored(tmp_path, item) not in reads
+    assert item["stored_files"][0]["file_hash"] == hashlib.sha256(BODY).hexdigest()
+    with open(stored(tmp_path, item), "rb") as f:
+        assert f.read() == BODY
+
+
+def test_rewrite_does_not_change_hardlinked_copies(tmp_path):
+    req, item = request(), {}
+    response = Response(URL, body=BODY, headers={"Content-Type": "application/pdf"}, request=req)
+    pipeline(tmp_path, FILES_CAS_ENABLED=True).file_downloaded(response, req, None, item=item)
+    blob = os.path.join(str(tmp_path), item["stored_files"][0]["blob_path"])
+    curated = tmp_path / "curated.pdf"
+    os.link(stored(tmp_path, item), curated)
+
+    changed = Response(URL, body=b"%PDF-1.4 changed", headers={"Content-Type": "application/pdf"}, request=req)
+    item = {}
+    pipeline(tmp_path).file_downloaded(changed, req, None, item=item)
+    with open(stored(tmp_path, item), "rb") as f:
+        assert f.read() == b"%PDF-1.4 changed"
+    for copy in (blob, curated):
+        with open(copy, "rb") as f:
+            assert f.read() == BODY
+
+
+def test_malformed_content_length_counts_as_changed():
+    assert content_length(b"6012") == 6012
+    assert content_length(b"6012, 6012") is None
+    assert content_length(None) is None
+
+
+def test_landed_file_is_found_whatever_its_extension(tmp_path):
+    pipe = pipeline(tmp_path)
+    req = Request("https://www.workplacerelations.ie/en/cases/2024/january/adj-00012345",
+                  meta={"identifier": "ADJ-00012345", "body": "15376", "partition_date": "2024-01"})
+    expected = pipe.file_path(req)
+    assert expected.endswith(".bin")
+    assert pipe.landed_file(expected) is None
+    (tmp_path / "2024-01" / "15376").mkdir(parents=True)
+    (tmp_path / "2024-01" / "15376" / "ADJ-00012345.pdf").write_bytes(b"%PDF-1.4")
+    assert pipe.landed_file(expected) == "2024-01/15376/ADJ-00012345.pdf"
@@ -0,0 +1,133 @@
+import pytest
+from pymongo.errors import BulkWriteError
+from scrapy import Spider
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+
+from crawler.pipelines_mongo import MongoPipeline
+
+
+def pipeline(**kwargs):
+    return MongoPipeline("mongodb://localhost:27017", "kedra", "decisions", **kwargs)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.batches = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.batches.append([op._filter["identifier"] for op in ops])
+
+
+class Flushes(list):
+    # deferToThread that leaves each bulk_write pending until fire().
+    def __call__(self, fn, *args, **kwargs):
+        d = defer.Deferred()
+        self.append((fn, args, kwargs, d))
+        return d
+
+    def fire(self, i=0, error=None):
+        fn, args, kwargs, d = self.pop(i)
+        if error is not None:
+            d.errback(error)
+        else:
+            d.callback(fn(*args, **kwargs))
+
+
+@pytest.fixture
+def flushes(monkeypatch):
+    flushes = Flushes()
+    monkeypatch.setattr("crawler.pipelines_mongo.threads.deferToThread", flushes)
+    return flushes
+
+
+def buffered(**kwargs):
+    stats = get_crawler(Spider).stats
+    pipe = pipeline(stats=stats, **kwargs)
+    pipe.coll = FakeCollection()
+    return pipe, stats
+
+
+def item(identifier):
+    return {"identifier": identifier, "detail_url": f"https://x/{identifier}.html"}
+
+
+def test_configured_max_pending_is_honoured():
+    assert pipeline(batch_size=100, max_pending=200).max_pending == 200
+    assert pipeline(batch_size=100, max_pending=50).max_pending == 50
+
+
+def test_max_pending_defaults_to_four_batches():
+    assert pipeline(batch_size=100).max_pending == 400
+
+
+def test_flushes_a_full_batch_with_the_newest_version_of_each_document(flushes):
+    pipe, _ = buffered(batch_size=3)
+    for identifier in ("A", "B", "A", "C", "D"):
+        pipe.process_item(item(identifier), None)
+    assert len(flushes) == 1
+    flushes.fire()
+    assert pipe.coll.batches == [["B", "A", "C"]]
+    assert list(pipe._buffer) == [("D", "https://x/D.html")]
+
+
+def test_flushes_a_partial_batch_once_the_interval_is_up(flushes):
+    pipe, _ = buffered(batch_size=100, flush_interval=2.0)
+    pipe.process_item(item("A"), None)
+    pipe._flush_if_due()
+    assert not flushes
+    pipe._last_flush -= 2.0
+    pipe._flush_if_due()
+    flushes.fire()
+    assert pipe.coll.batches == [["A"]]
+
+
+def test_items_wait_for_the_oldest_flush_once_max_pending_is_reached(flushes):
+    pipe, stats = buffered(batch_size=2, max_pending=3)
+    assert pipe.process_item(item("A"), None) == item("A")
+    assert pipe.process_item(item("B"), None) == item("B")  # flushed, 2 in flight
+    waiting = pipe.process_item(item("C"), None)
+    assert isinstance(waiting, defer.Deferred) and not waiting.called
+    assert stats.get_value("mongo/backpressure_waits") == 1
+    flushes.fire()
+    assert waiting.result == item("C")
+    assert pipe._inflight == []
+
+
+def test_close_flushes_the_buffer_and_waits_for_every_flush(flushes):
+    pipe, _ = buffered(batch_size=2)
+    for identifier in "ABC":
+        pipe.process_item(item(identifier), None)
+    closed = pipe.close_spider(None)
+    assert not closed.called and len(flushes) == 2
+    flushes.fire()
+    assert not closed.called
+    flushes.fire()
+    assert closed.called
+    assert pipe.coll.batches == [["A", "B"], ["C"]]
+
+
+def test_written_fires_once_buffered_and_inflight_items_are_written(flushes):
+    pipe, _ = buffered(batch_size=2)
+    for identifier in "ABC":
+        pipe.process_item(item(identifier), None)
+    done = pipe.written()
+    pipe._flush()
+    flushes.fire()
+    assert not done.called
+    flushes.fire()
+    assert done.called
+
+
+def test_flush_stats(flushes):
+    pipe, stats = buffered(batch_size=2)
+    for identifier in "ABCD":
+        pipe.process_item(item(identifier), None)
+    flushes.fire()
+    flushes.fire(error=BulkWriteError({"writeErrors": [{"code": 11000, "errmsg": "duplicate key"}]}))
+    assert stats.get_value("mongo/flush_count") == 1
+    assert stats.get_value("mongo/flush_items") == 3
+    assert stats.get_value("mongo/batch_size_max") == 2
+    assert stats.get_value("mongo/flush_failed") == 1
+    assert stats.get_value("mongo/write_errors") == 1
+    assert stats.get_value("mongo/flush_latency_ms_total") >= 0
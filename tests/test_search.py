@@ -0,0 +1,112 @@
+import asyncio
+
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from crawler.spiders.search import SearchSpider
+
+BASE = "https://www.workplacerelations.ie"
+ARGS = {"body_id": 15376, "body_name": "Workplace Relations Commission",
+        "date_from": "1/1/2024", "date_to": "31/1/2024", "q": None}
+
+
+class AllKnown:
+    # Every card is already stored, with its attachment list.
+    def lookup(self, keys, fields=None):
+        return {k: {"file_urls": [f"{BASE}/f/{k[0]}.pdf"]} for k in keys}
+
+    def close(self):
+        pass
+
+
+def make_spider(settings=None, **kwargs):
+    crawler = get_crawler(SearchSpider, settings)
+    spider = SearchSpider.from_crawler(crawler, date_from="1/1/2024", date_to="31/1/2024", body="15376",
+                                       shard="none", **kwargs)
+    spider.known = AllKnown()
+
+    async def lookup_known(keys):
+        # KnownDecisions without Mongo or the reactor's thread pool.
+        return spider.known.lookup(keys)
+
+    spider.lookup_known = lookup_known
+    return spider
+
+
+def search_page(ids, extra=b""):
+    cards = "".join(f'<li class="each-item"><h3><a href="/en/cases/2024/{i}.html">{i}</a></h3>'
+                    f"<time>05/01/2024</time></li>" for i in ids)
+    return f"<html><body><ul>{cards}</ul>".encode() + extra + b"</body></html>"
+
+
+def parse(spider, page, ids, html_extra=b"", **extra):
+    cb_kwargs = dict(ARGS, page=page, **extra)
+    request = Request(f"{BASE}/en/search/?pageNumber={page}", cb_kwargs=cb_kwargs)
+    response = HtmlResponse(request.url, body=search_page(ids, html_extra), request=request, encoding="utf-8")
+    return asyncio.run(collect(spider.parse(response, **cb_kwargs)))
+
+
+async def collect(results):
+    return [r async for r in results]
+
+
+def next_pages(spider, out):
+    return [r.cb_kwargs["page"] for r in out if isinstance(r, Request) and r.callback == spider.parse]
+
+
+def test_known_cards_do_not_stop_a_non_incremental_crawl():
+    spider = make_spider(detail_policy="skip", prefetch_pages=0)
+    page, pages = 1, []
+    while page <= 3:
+        out = parse(spider, page, [f"ADJ-0000{page}00{i}" for i in range(3)])
+        nxt = next_pages(spider, out)
+        pages.append(page)
+        assert nxt == [page + 1]
+        page = nxt[0]
+    assert parse(spider, page, []) == []
+    assert pages == [1, 2, 3]
+    assert spider.crawler.stats.get_value("incremental/pagination_stopped") is None
+
+
+def test_incremental_crawl_stops_after_known_pages():
+    spider = make_spider(incremental="1", incremental_pages=1)
+    out = parse(spider, 1, ["ADJ-00000001"])
+    assert next_pages(spider, out) == []
+    assert spider.crawler.stats.get_value("incremental/pagination_stopped") == 1
+
+
+def test_low_memory_walks_pages_one_at_a_time():
+    cards = [f"ADJ-000001{i:02d}" for i in range(10)]
+    total = b"<p>Showing 1 - 10 of 95 results</p>"
+    for settings, expected in ((None, list(range(2, 11))), ({"LOW_MEMORY": True}, [2])):
+        spider = make_spider(settings, detail_policy="always", prefetch_pages=4)
+        spider.known = None
+        out = parse(spider, 1, cards, html_extra=total)
+        assert next_pages(spider, out) == expected
+
+
+def test_start_yields_the_first_page_of_each_shard():
+    spider = make_spider()
+    spider.shard = "week"
+    out = asyncio.run(collect(spider.start()))
+    assert out and all(r.cb_kwargs["page"] == 1 for r in out)
+    assert len(out) == spider.crawler.stats.get_value("shard/initial")
+
+
+def test_counts_in_card_summaries_are_not_the_result_count():
+    cards = [f"ADJ-000001{i:02d}" for i in range(10)]
+    spider = make_spider(detail_policy="always", prefetch_pages=4)
+    spider.known = None
+    request = Request(f"{BASE}/en/search/?pageNumber=1", cb_kwargs=dict(ARGS, page=1))
+    body = search_page(cards).replace(b"</time>", b"</time><p>Complaint 2 of 30 decisions upheld.</p>")
+    response = HtmlResponse(request.url, body=body, request=request, encoding="utf-8")
+    out = asyncio.run(collect(spider.parse(response, **request.cb_kwargs)))
+    # No count outside the cards: prefetch, not pages 2..3 from "of 30".
+    assert next_pages(spider, out) == [2, 3, 4, 5]
+
+    out = parse(spider, 1, cards, html_extra=b'<div class="results-count">Showing 10 of 3 results</div>')
+    assert next_pages(spider, out) == [2, 3, 4, 5]
+    assert spider.crawler.stats.get_value("pagination/count_ignored") == 1
+
+    out = parse(spider, 1, cards, html_extra=b'<div class="results-count">Showing 1 - 10 of 25 results</div>')
+    assert next_pages(spider, out) == [2, 3]
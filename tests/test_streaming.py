@@ -0,0 +1,29 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from crawler import streaming
+
+
+def test_missing_internals_are_reported(monkeypatch):
+    assert streaming.missing_internals() == []
+    monkeypatch.delattr(streaming.http11, "_ResponseReader")
+    monkeypatch.delattr(streaming.ScrapyAgent, "_cb_bodyready")
+    assert streaming.missing_internals() == ["ScrapyAgent._cb_bodyready", "_ResponseReader._bodybuf"]
+
+
+def test_downloads_through_the_handler():
+    # A real reactor and a local server, so in a process of its own.
+    script = Path(__file__).with_name("streaming_download.py")
+    run = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=60)
+    assert run.returncode == 0, run.stderr
+    header, *downloads = (json.loads(line) for line in run.stdout.splitlines())
+    ok, loss, missing, buffered = downloads
+    assert ok["status"] == 200 and ok["flags"] == ["streamed"]
+    assert ok["file"]["sha256"] == ok["file"]["file_sha256"] == header["body_sha256"]
+    assert ok["file"]["size"] == 300 * 1024
+    assert loss["error"] == streaming.ResponseDataLossError.__name__
+    assert missing["status"] == 404 and "file" not in missing
+    assert buffered["flags"] == [] and buffered["body_sha256"] == header["body_sha256"]
+    assert all(d["left"] == [] for d in downloads)
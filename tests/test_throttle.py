@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing as mp
+import sys
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Spider
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+
+from crawler import throttle
+from crawler.throttle import AdaptiveConcurrencyMiddleware, RateBudget, RateBudgetMiddleware, retry_after
+
+SLOT = "www.workplacerelations.ie"
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(throttle, "time", clock)
+    return clock
+
+
+def adaptive(concurrency=2, delay=0.0, **settings):
+    crawler = get_crawler(Spider, dict({"ADAPTIVE_CONCURRENCY_ENABLED": True, "ADAPTIVE_MAX_CONCURRENCY": 4,
+                                        "ADAPTIVE_TARGET_LATENCY": 1.0}, **settings))
+    slot = SimpleNamespace(concurrency=concurrency, delay=delay)
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots={SLOT: slot}))
+    return AdaptiveConcurrencyMiddleware.from_crawler(crawler), slot
+
+
+def respond(mw, latency, status=200, headers=None):
+    request = Request(f"https://{SLOT}/en/search/", meta={"download_slot": SLOT, "download_latency": latency})
+    return mw.process_response(request, Response(request.url, status=status, headers=headers), None)
+
+
+def test_concurrency_grows_by_one_per_full_window_of_fast_responses(clock):
+    mw, slot = adaptive(concurrency=2)
+    respond(mw, 0.1)
+    assert slot.concurrency == 2
+    respond(mw, 0.1)
+    assert slot.concurrency == 3
+    for _ in range(3 + 4):
+        respond(mw, 0.1)
+    assert slot.concurrency == 4  # ADAPTIVE_MAX_CONCURRENCY
+    assert mw.stats.get_value(f"adaptive/{SLOT}/concurrency_max") == 4
+
+
+def test_slow_responses_cut_concurrency_once_per_window(clock):
+    mw, slot = adaptive(concurrency=4)
+    respond(mw, 5.0)
+    respond(mw, 5.0)
+    assert slot.concurrency == 2
+    clock.now += 1.0
+    respond(mw, 5.0)
+    assert slot.concurrency == 1
+    mw.process_exception(Request(f"https://{SLOT}/", meta={"download_slot": SLOT}), TimeoutError(), None)
+    assert slot.concurrency == 1  # ADAPTIVE_MIN_CONCURRENCY
+    assert mw.stats.get_value("adaptive/decrease") == 2
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_backoff_drops_to_the_minimum_and_waits_as_asked(clock, status):
+    mw, slot = adaptive(concurrency=4)
+    respond(mw, 0.1, status=status, headers={"Retry-After": "7"})
+    assert (slot.concurrency, slot.delay) == (1, 7.0)
+    assert mw.stats.get_value(f"adaptive/backoff/{status}") == 1
+    # No growth while cooling down, then the delay is paid back first.
+    respond(mw, 0.1)
+    assert (slot.concurrency, slot.delay) == (1, 7.0)
+    clock.now += 7.0
+    respond(mw, 0.1)
+    assert (slot.concurrency, slot.delay) == (1, 3.5)
+
+
+def test_backoff_without_retry_after_doubles_the_delay(clock):
+    mw, slot = adaptive(concurrency=4, delay=1.5)
+    respond(mw, 0.1, status=429)
+    assert slot.delay == 3.0
+    clock.now += 10
+    respond(mw, 0.1, status=429)
+    assert slot.delay == 6.0
+
+
+def test_retry_after_seconds_and_http_date(clock):
+    assert retry_after(b"120") == 120.0
+    assert retry_after(formatdate(clock.now + 30, usegmt=True).encode()) == pytest.approx(30.0, abs=1)
+    assert retry_after(formatdate(clock.now - 30, usegmt=True)) == 0.0
+    assert retry_after(b"soon") is None
+    assert retry_after(None) is None
+
+
+def test_rate_budget_spaces_reservations(clock):
+    budget = RateBudget(4)
+    assert [budget.reserve() for _ in range(3)] == [0.0, 0.25, 0.5]
+    clock.now += 2.0
+    assert budget.reserve() == 0.0
+
+
+def test_rate_budget_middleware_delays_requests_over_the_budget(clock, monkeypatch):
+    monkeypatch.setattr(throttle, "_shared_budget", None)
+    waits = []
+    monkeypatch.setattr(throttle, "deferLater", lambda reactor, wait, f: waits.append(wait) or defer.succeed(None))
+    # The reactor is only handed to the patched deferLater; do not install one.
+    monkeypatch.setitem(sys.modules, "twisted.internet.reactor", object())
+    mw = RateBudgetMiddleware.from_crawler(get_crawler(Spider, {"RATE_BUDGET_RPS": 2}))
+    for _ in range(3):
+        assert asyncio.run(mw.process_request(Request(f"https://{SLOT}/"), None)) is None
+    assert waits == [0.5, 1.0]
+    assert mw.stats.get_value("rate_budget/delayed") == 2
+    assert mw.stats.get_value("rate_budget/wait_ms") == 1500
+
+
+def test_shared_rate_budget_spans_middlewares(clock, monkeypatch):
+    monkeypatch.setattr(throttle, "_shared_budget", None)
+    throttle.share_rate_budget(mp.Value("d", 0.0), mp.Lock())
+    first, second = (RateBudgetMiddleware.from_crawler(get_crawler(Spider, {"RATE_BUDGET_RPS": 10}))
+                     for _ in range(2))
+    assert first.budget.reserve() == 0.0
+    assert second.budget.reserve() == pytest.approx(0.1)
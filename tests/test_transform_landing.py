@@ -0,0 +1,110 @@
+import queue
+import threading
+
+import pytest
+
+import transform_landing as tl
+
+
+class FakeSource:
+    name = "decisions"
+
+    def __init__(self):
+        self.docs = []
+        self.polled = threading.Event()
+
+    def find(self, filt, projection=None):
+        since = filt["updated_at"]["$gte"]
+        return FakeCursor(self, [d for d in self.docs if d["updated_at"] >= since])
+
+
+class FakeCursor(list):
+    def __init__(self, src, docs):
+        super().__init__(docs)
+        src.polled.set()
+
+    def sort(self, keys):
+        return sorted(self, key=lambda d: tuple(d[k] for k, _ in keys))
+
+
+def drain(q):
+    out = []
+    while True:
+        try:
+            out.append(q.get_nowait()[0]["_id"])
+        except queue.Empty:
+            return out
+
+
+def poll_once(src):
+    src.polled.clear()
+    assert src.polled.wait(2)
+    src.polled.clear()
+    assert src.polled.wait(2)
+
+
+def test_polling_picks_up_writes_that_commit_out_of_order():
+    src, q, stop = FakeSource(), queue.Queue(), threading.Event()
+    src.docs.append({"_id": "a", "updated_at": "2024-01-05T10:00:05Z"})
+    follower = threading.Thread(target=tl.follow_updated_at,
+                                args=(src, q, stop, {"hwm": "2024-01-05T10:00:00Z"}, 0.01, 60))
+    follower.start()
+    try:
+        poll_once(src)
+        assert drain(q) == ["a"]
+        # A flush stamped before "a" commits after it was seen.
+        src.docs.append({"_id": "b", "updated_at": "2024-01-05T10:00:03Z"})
+        poll_once(src)
+        assert drain(q) == ["b"]
+        # A newer version of "a" is queued again; the old one is not.
+        src.docs[0] = {"_id": "a", "updated_at": "2024-01-05T10:00:09Z"}
+        poll_once(src)
+        assert drain(q) == ["a"]
+    finally:
+        stop.set()
+        follower.join()
+
+
+def test_take_batch_keeps_the_newest_version():
+    q = queue.Queue()
+    for doc, marker in [({"_id": 1, "v": 1}, {"token": "t1"}), ({"_id": 2}, {"token": "t2"}),
+                        ({"_id": 1, "v": 2}, {"token": "t3"})]:
+        q.put((doc, marker))
+    docs, marker = tl.take_batch(q, 10, wait=0.1)
+    assert docs == [{"_id": 2}, {"_id": 1, "v": 2}]
+    assert marker == {"token": "t3"}
+
+
+def test_same_identifier_on_two_detail_pages_does_not_collide(tmp_path, monkeypatch):
+    landing, curated = tmp_path / "landing", tmp_path / "curated"
+    monkeypatch.setattr(tl, "LANDING_DIR", landing)
+    docs = []
+    for n, url in enumerate(["https://www.workplacerelations.ie/en/cases/2024/a.html",
+                             "https://www.workplacerelations.ie/en/cases/2024/b.html"]):
+        rel = f"2024-01/15376/ADJ-00012345-{n}.pdf"
+        (landing / rel).parent.mkdir(parents=True, exist_ok=True)
+        (landing / rel).write_bytes(b"%PDF-1.4 " + str(n).encode())
+        docs.append({"identifier": "ADJ-00012345", "detail_url": url, "decision_date": "2024-01-05",
+                     "body": "Workplace Relations Commission", "stored_files": [{"stored_file_path": rel}]})
+    paths = [tl.curate_one(doc, curated)[0]["new_file_path"] for doc in docs]
+    assert paths[0] != paths[1]
+    assert [(curated / p).read_bytes()[-1:] for p in paths] == [b"0", b"1"]
+    assert tl.curate_one(docs[0], curated, force=True)[0]["new_file_path"] == paths[0]
+
+
+def test_window_is_read_once_per_document_in_id_order():
+    mongomock = pytest.importorskip("mongomock")
+    src = mongomock.MongoClient().db.decisions
+    src.create_index([("decision_date", 1)])
+    src.create_index([("partition_date", 1)])
+    src.insert_many([
+        {"_id": 1, "decision_date": "2024-01-05", "partition_date": "2024-01"},  # both branches
+        {"_id": 2, "decision_date": "2023-12-31", "partition_date": "2023-12"},  # neither
+        {"_id": 3, "partition_date": "2024-02"},
+        {"_id": 4, "decision_date": "2024-02-10", "partition_date": "2025-01"},
+        {"_id": 5, "decision_date": "2024-01-20", "partition_date": "2024-01"},
+    ])
+    filt = tl.query_window("2024-01-01", "2024-02-29")
+    assert [d["_id"] for d in tl.source_cursor(src, filt)] == [1, 3, 4, 5]
+    assert [d["_id"] for d in tl.source_cursor(src, filt, after=3)] == [4, 5]
+    assert [d["_id"] for d in tl.source_cursor(src, {}, after=3)] == [4, 5]
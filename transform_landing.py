@@ -1,17 +1,29 @@
 import os
 import re
 import sys
+import time
+import queue
 import shutil
+import errno
+import signal
+import heapq
 import hashlib
 import logging
 import argparse
+import threading
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 from typing import Dict, Any, List, Tuple, Optional
 from datetime import datetime, timezone
 from bs4 import BeautifulSoup, NavigableString, Comment
 from bs4.element import Tag
-from pymongo import MongoClient
+from lxml import etree
+import lxml.html
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 
 logging.basicConfig(
     level=os.getenv("TRANSFORM_LOGLEVEL", "INFO"),
@@ -25,6 +37,12 @@ SOURCE_COLLECTION  = os.getenv("MONGO_COLLECTION", "decisions")
 CURATED_COLLECTION = os.getenv("CURATED_COLLECTION", "decisions_curated")
 LANDING_DIR        = Path(os.getenv("FILES_STORE", "data/landing"))
 CURATED_DIR        = Path(os.getenv("CURATED_STORE", "data/curated"))
+CLEANER            = os.getenv("TRANSFORM_CLEANER", "bs4")
+CLEANER_REVISION   = 1  # bump whenever the cleaning rules change output
+CHECKPOINTS        = os.getenv("TRANSFORM_CHECKPOINTS", "transform_checkpoints")
+CURSOR_BATCH_SIZE  = int(os.getenv("TRANSFORM_BATCH_SIZE", "500"))
+PROMOTE            = os.getenv("TRANSFORM_PROMOTE", "auto")
+WATCH_POLL_LAG     = int(os.getenv("TRANSFORM_POLL_LAG", "120"))
 
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
@@ -36,19 +54,91 @@ def sha256_path(p: Path):
             h.update(chunk)
     return h.hexdigest()
 
+FICLONE = 0x40049409  # linux/fs.h
+
+def reflink(src: Path, dst: Path):
+    import fcntl
+    with src.open("rb") as s, dst.open("wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+def copy_range(src: Path, dst: Path):
+    # In-kernel copy; a filesystem that supports it may share the extents.
+    # Kernels refusing it (cross-device, tmpfs) get shutil's sendfile copy.
+    if hasattr(os, "copy_file_range"):
+        try:
+            with src.open("rb") as s, dst.open("wb") as d:
+                left = os.fstat(s.fileno()).st_size
+                while left > 0:
+                    n = os.copy_file_range(s.fileno(), d.fileno(), left)
+                    if n == 0:
+                        break
+                    left -= n
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+    shutil.copyfile(src, dst)
+
+PROMOTERS = {"reflink": reflink, "hardlink": lambda src, dst: os.link(src, dst), "copy": copy_range}
+PROMOTE_ORDER = {
+    "auto":     ("reflink", "hardlink", "copy"),
+    "reflink":  ("reflink", "copy"),
+    "hardlink": ("hardlink", "copy"),
+    "copy":     ("copy",),
+}
+# (method, source device, target device) pairs that already failed in this
+# process, so a filesystem without reflinks is not asked once per file.
+_unsupported = set()
+
+def promote(src: Path, target: Path, mode: Optional[str] = None):
+    # Puts a landing binary at `target` without reading it in Python where
+    # the filesystem allows, and returns the method used. Goes through a temp
+    # name, so an earlier hardlinked output is replaced rather than written
+    # through into the landing file. A hardlink shares the landing inode:
+    # curated binaries must not be edited in place.
+    order = PROMOTE_ORDER[mode or PROMOTE]
+    if "hardlink" in order and target.exists() and os.path.samefile(src, target):
+        return "hardlink"
+    tmp = target.with_name(f".{target.name}.tmp")
+    devs = (src.stat().st_dev, target.parent.stat().st_dev)
+    err = None
+    for method in order:
+        if (method,) + devs in _unsupported:
+            continue
+        if tmp.exists():
+            tmp.unlink()
+        try:
+            PROMOTERS[method](src, tmp)
+        except OSError as e:
+            err = e
+            if method != "copy":
+                _unsupported.add((method,) + devs)
+            continue
+        if method != "hardlink":
+            shutil.copystat(src, tmp)
+        os.replace(tmp, target)
+        return method
+    if tmp.exists():
+        tmp.unlink()
+    raise err
+
 def is_html_path(p: Path):
     return p.suffix.lower() in {".html", ".htm"}
 
 def is_binary_path(p: Path):
     return p.suffix.lower() in {".pdf", ".doc", ".docx"}
 
-def next_unique_name(dir_: Path, base_name: str, ext: str):
-    candidate = dir_ / f"{base_name}{ext}"
-    i = 2
-    while candidate.exists():
-        candidate = dir_ / f"{base_name}-{i}{ext}"
-        i += 1
-    return candidate
+def output_name(dir_: Path, base_name: str, ext: str, used: Dict[str, int]):
+    # Sources are visited in a stable order, so the n-th file with a given
+    # extension always lands on the same name and reruns overwrite in place.
+    n = used.get(ext, 0) + 1
+    used[ext] = n
+    return dir_ / (f"{base_name}{ext}" if n == 1 else f"{base_name}-{n}{ext}")
+
+def url_tag(url: Optional[str]) -> str:
+    # The same identifier can be published under two detail pages; a short
+    # hash of detail_url keeps their outputs apart, the same on every run.
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:8] if url else ""
 
 def decide_partition(doc: Dict[str, Any]):
     dd = (doc.get("decision_date") or "")[:7]
@@ -67,9 +157,9 @@ def body_folder(doc: Dict[str, Any]):
 def source_file_paths(doc: Dict[str, Any]):
     out: List[Tuple[Path, Optional[str]]] = []
     for rec in (doc.get("stored_files") or []):
-        rel = rec.get("path")
+        rel = rec.get("stored_file_path") or rec.get("path")
         if rel:
-            out.append((LANDING_DIR / rel, rec.get("content_type")))
+            out.append((LANDING_DIR / rel, rec.get("mime") or rec.get("content_type")))
     if not out:
         for rec in (doc.get("files") or []):
             rel = rec.get("path")
@@ -77,7 +167,25 @@ def source_file_paths(doc: Dict[str, Any]):
                 out.append((LANDING_DIR / rel, None))
     return out
 
-def clean_html(html: str):
+def landed_hashes(doc: Dict[str, Any]):
+    # Hash and size the crawler recorded as each file landed.
+    out: Dict[str, Tuple[str, int]] = {}
+    for rec in (doc.get("stored_files") or []):
+        rel = rec.get("stored_file_path") or rec.get("path")
+        if rel and rec.get("file_hash") and rec.get("filesize_bytes") is not None:
+            out[str(LANDING_DIR / rel)] = (rec["file_hash"], rec["filesize_bytes"])
+    return out
+
+BOILER_TAGS = {"header", "footer", "nav", "aside", "iframe", "noscript", "script", "style"}
+BOILER_KW = {
+    "breadcrumb","breadcrumbs","navbar","navigation","site-header","site-footer",
+    "cookie","consent","banner","sidebar","social","share","toc","skip-link",
+    "masthead","branding","advert","ad-","promo","newsletter","modal","popup",
+    "utility","topbar","menubar","pager","pagination"
+}
+EMPTY_SWEEP_TAGS = {"p", "div", "section", "article"}
+
+def clean_html_bs4(html: str):
     try:
         soup = BeautifulSoup(html, "lxml")
     except Exception as e:
@@ -96,13 +204,6 @@ def clean_html(html: str):
         except Exception:
             pass
 
-    KW = {
-        "breadcrumb","breadcrumbs","navbar","navigation","site-header","site-footer",
-        "cookie","consent","banner","sidebar","social","share","toc","skip-link",
-        "masthead","branding","advert","ad-","promo","newsletter","modal","popup",
-        "utility","topbar","menubar","pager","pagination"
-    }
-
     def looks_boiler(el):
         if not isinstance(el, Tag):
             return False
@@ -111,7 +212,7 @@ def clean_html(html: str):
         if not isinstance(_cls, (list, tuple)):
             _cls = [_cls] if _cls else []
         attrs = f"{_id} {' '.join(map(str, _cls))}".lower()
-        return any(k in attrs for k in KW)
+        return any(k in attrs for k in BOILER_KW)
 
     for el in list(soup.find_all(True)): 
         try:
@@ -138,7 +239,7 @@ def clean_html(html: str):
         if not isinstance(tag, Tag):
             continue
         try:
-            if tag.name in {"p","div","section","article"} and not tag.get_text(strip=True):
+            if tag.name in EMPTY_SWEEP_TAGS and not tag.get_text(strip=True):
                 tag.decompose()
         except Exception:
             continue
@@ -183,56 +284,213 @@ def clean_html(html: str):
 
     return str(out)
 
-def curate_one(doc: Dict[str, Any], curated_root: Path):
+def clean_html_lxml(html: str):
+    # Same selection rules as clean_html_bs4, but boilerplate removal is one
+    # walk that skips removed subtrees, and text scoring plus the empty-tag
+    # sweep share one bottom-up pass over the main container.
+    try:
+        root = lxml.html.document_fromstring(html)
+    except Exception as e:
+        logger.warning("lxml parse failed: %s", e)
+        return html
+
+    stack = [root]
+    while stack:
+        el = stack.pop()
+        for child in list(el):
+            if not isinstance(child.tag, str):
+                child.drop_tree()
+                continue
+            if child.tag in BOILER_TAGS:
+                child.drop_tree()
+                continue
+            attrs = f"{child.get('id') or ''} {child.get('class') or ''}".lower()
+            if any(k in attrs for k in BOILER_KW):
+                child.drop_tree()
+                continue
+            stack.append(child)
+
+    main = root.find(".//main")
+    if main is None:
+        main = root.find(".//*[@role='main']")
+    if main is None:
+        main = root.find("body")
+    if main is None:
+        main = root
+
+    # (stripped text length, non-blank string count) per element, children first
+    totals = {}
+    for el in reversed(list(main.iter(etree.Element))):
+        length = count = 0
+        t = el.text.strip() if el.text else ""
+        if t:
+            length += len(t); count += 1
+        for child in el:
+            c_len, c_cnt = totals[child]
+            length += c_len; count += c_cnt
+            t = child.tail.strip() if child.tail else ""
+            if t:
+                length += len(t); count += 1
+        totals[el] = (length, count)
+
+    candidates = [c for c in main if c.tag in ("article", "section", "div")] or [main]
+    chosen = max(candidates, key=lambda c: totals[c][0] + max(totals[c][1] - 1, 0))
+
+    if totals[chosen][0] < 200:
+        logger.info("Curated HTML too small; falling back to original.")
+        return html
+
+    for el in [d for d in chosen.iterdescendants() if d.tag in EMPTY_SWEEP_TAGS and not totals[d][0]]:
+        el.drop_tree()
+
+    title_txt = ""
+    t = root.find(".//title")
+    if t is not None and len(t) == 0 and t.text:
+        title_txt = t.text.strip()
+
+    out = etree.Element("html")
+    head = etree.SubElement(out, "head")
+    etree.SubElement(head, "meta", charset="utf-8")
+    if title_txt:
+        etree.SubElement(head, "title").text = title_txt
+    body = etree.SubElement(out, "body")
+    container = etree.SubElement(body, "article")
+    container.set("data-curated", "true")
+
+    if chosen.text and chosen.text.strip():
+        container.text = chosen.text
+    for child in list(chosen):
+        container.append(child)
+        if child.tail and not child.tail.strip():
+            child.tail = None
+
+    return lxml.html.tostring(out, doctype="<!DOCTYPE html>", encoding="unicode")
+
+CLEANERS = {"bs4": clean_html_bs4, "lxml": clean_html_lxml}
+
+def clean_html(html: str):
+    return CLEANERS.get(CLEANER, clean_html_bs4)(html)
+
+def cleaner_version():
+    return f"{CLEANER}-{CLEANER_REVISION}"
+
+def source_fingerprint(src_path: Path, prev: Optional[Dict[str, Any]], landed: Optional[Tuple[str, int]] = None):
+    # Trust the previously recorded hash while size and mtime are unchanged,
+    # then the crawler's hash while the size matches, so an untouched landing
+    # file is never re-read.
+    st = src_path.stat()
+    fp = {"source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+    if (prev and prev.get("source_hash")
+            and prev.get("source_size") == st.st_size
+            and prev.get("source_mtime_ns") == st.st_mtime_ns):
+        fp["source_hash"] = prev["source_hash"]
+    elif landed and landed[1] == st.st_size:
+        fp["source_hash"] = landed[0]
+    else:
+        fp["source_hash"] = sha256_path(src_path)
+    return fp
+
+def is_up_to_date(prev: Optional[Dict[str, Any]], sources: List[Tuple[Path, Optional[str]]],
+                  fingerprints: Dict[str, Dict[str, Any]], curated_root: Path):
+    if not prev or prev.get("cleaner_version") != cleaner_version():
+        return False
+    old = prev.get("new_files") or []
+    if len(old) != len(sources) or any(r.get("status") not in ("copied", "transformed") for r in old):
+        return False
+    old_hashes = {r.get("source"): r.get("source_hash") for r in old}
+    for src_path, _ in sources:
+        fp = fingerprints.get(str(src_path))
+        if not fp or old_hashes.get(str(src_path)) != fp["source_hash"]:
+            return False
+    return all((curated_root / r["new_file_path"]).exists() for r in old)
+
+def curate_one(doc: Dict[str, Any], curated_root: Path, prev: Optional[Dict[str, Any]] = None,
+               force: bool = False):
+    # Returns None when `prev` (the last decisions_curated record) already
+    # reflects the current landing files and cleaner version.
     ident = (doc.get("identifier") or "NOID").strip().replace("/", "-").replace("\\", "-")
     part = decide_partition(doc)
     body = body_folder(doc)
 
     dest_dir = curated_root / part / body / ident
-    ensure_dir(dest_dir)
+    tag = url_tag(doc.get("detail_url"))
+    base_name = f"{ident}-{tag}" if tag else ident
+
+    sources = sorted(source_file_paths(doc), key=lambda t: str(t[0]))
+    prev_by_source = {r.get("source"): r for r in ((prev or {}).get("new_files") or [])}
+    landed = landed_hashes(doc)
+    fingerprints: Dict[str, Dict[str, Any]] = {}
+    for src_path, _ in sources:
+        try:
+            fingerprints[str(src_path)] = source_fingerprint(src_path, prev_by_source.get(str(src_path)),
+                                                             landed.get(str(src_path)))
+        except OSError:
+            pass
+    if not force and is_up_to_date(prev, sources, fingerprints, curated_root):
+        return None
 
+    ensure_dir(dest_dir)
+    used: Dict[str, int] = {}
     results: List[Dict[str, Any]] = []
-    for src_path, ct in source_file_paths(doc):
+    for src_path, ct in sources:
         try:
-            if not src_path.exists():
+            fp = fingerprints.get(str(src_path))
+            if fp is None or not src_path.exists():
                 logger.warning("Missing source file: %s", src_path)
                 results.append({"status": "missing_source", "source": str(src_path)})
                 continue
 
             ext = src_path.suffix.lower()
             if is_binary_path(src_path) or (ext and ext not in {".html", ".htm"}):
-                target = next_unique_name(dest_dir, ident, ext or ".bin")
-                shutil.copy2(src_path, target)
-                h = sha256_path(target)
+                target = output_name(dest_dir, base_name, ext or ".bin", used)
+                # Promoted bytes are the source's, so its hash stands.
+                method = promote(src_path, target)
                 results.append({
                     "status": "copied",
                     "transformed": False,
+                    "promoted_by": method,
                     "new_file_path": str(target.relative_to(curated_root)),
-                    "new_file_hash": h,
+                    "new_file_hash": fp["source_hash"],
                     "content_type_hint": ct,
                     "ext": ext or ".bin",
+                    "source": str(src_path),
+                    **fp,
                 })
             else:
                 try:
                     raw = src_path.read_text(encoding="utf-8", errors="ignore")
                 except UnicodeDecodeError:
                     raw = src_path.read_text(errors="ignore")
-                cleaned = clean_html(raw)
-                target = next_unique_name(dest_dir, ident, ".html")
-                target.write_text(cleaned, encoding="utf-8")
-                h = sha256_path(target)
+                cleaned = clean_html(raw).encode("utf-8")
+                target = output_name(dest_dir, base_name, ".html", used)
+                target.write_bytes(cleaned)
                 results.append({
                     "status": "transformed",
                     "transformed": True,
                     "new_file_path": str(target.relative_to(curated_root)),
-                    "new_file_hash": h,
+                    "new_file_hash": hashlib.sha256(cleaned).hexdigest(),
                     "content_type_hint": "text/html",
                     "ext": ".html",
+                    "source": str(src_path),
+                    **fp,
                 })
 
         except Exception as e:
             logger.exception("Error curating %s (%s): %s", ident, src_path, e)
             results.append({"status": "error", "source": str(src_path), "error": str(e)})
+
+    # Outputs of an earlier run that this run no longer produces (including
+    # the -2/-3 copies older versions of this script left behind).
+    keep = {r["new_file_path"] for r in results if r.get("new_file_path")}
+    for r in ((prev or {}).get("new_files") or []):
+        old = r.get("new_file_path")
+        if old and old not in keep:
+            try:
+                (curated_root / old).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not remove stale output %s: %s", old, e)
     return results
 
 def query_window(start: str, end: str):
@@ -247,11 +505,409 @@ def query_window(start: str, end: str):
         }
     return {}
 
+def curated_record(doc: Dict[str, Any], curated: List[Dict[str, Any]]):
+    return {
+        "identifier":     doc.get("identifier"),
+        "detail_url":     doc.get("detail_url") or doc.get("source_url"),
+        "body":           doc.get("body") or "all",
+        "body_id":        doc.get("body_id"),
+        "decision_date":  doc.get("decision_date"),
+        "partition_date": decide_partition(doc),
+        "new_files":      curated,
+        "cleaner_version": cleaner_version(),
+        "curated_at":     datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+PREV_PROJECTION = {"identifier": 1, "detail_url": 1, "new_files": 1, "cleaner_version": 1}
+
+# Only what curate_one, curated_key and curated_record read.
+SOURCE_PROJECTION = {
+    "identifier": 1, "detail_url": 1, "source_url": 1, "body": 1, "body_id": 1,
+    "decision_date": 1, "partition_date": 1,
+    "stored_files.stored_file_path": 1, "stored_files.path": 1,
+    "stored_files.mime": 1, "stored_files.content_type": 1,
+    "stored_files.file_hash": 1, "stored_files.filesize_bytes": 1,
+    "files.path": 1,
+}
+
+def source_cursor(src, filt, after=None):
+    # _id order makes "everything up to the checkpoint is done" hold for
+    # both runners. Sorted by _id as one $or, a window is free to be planned
+    # as an _id index scan filtering every document of the collection, and
+    # mid-sized windows tend to win that race: the index union only returns
+    # its first document once its whole blocking sort is done. So each
+    # branch of query_window's $or is its own query, hinted to the index on
+    # its field (IXSCAN over the window -> FETCH -> SORT by _id, spilling to
+    # disk on wide windows), and the branches are merged by _id here.
+    branches = (filt or {}).get("$or")
+    if not branches:
+        return sorted_by_id(src, filt, after)
+    return merge_by_id([sorted_by_id(src, b, after, hint=[(next(iter(b)), 1)]) for b in branches])
+
+def sorted_by_id(src, filt, after=None, hint=None):
+    if after is not None:
+        filt = {"$and": [filt, {"_id": {"$gt": after}}]} if filt else {"_id": {"$gt": after}}
+    cursor = (src.find(filt, SOURCE_PROJECTION, no_cursor_timeout=True, allow_disk_use=True)
+              .sort("_id", 1)
+              .batch_size(CURSOR_BATCH_SIZE))
+    return cursor.hint(hint) if hint else cursor
+
+def merge_by_id(cursors):
+    # A document in both branches comes out once.
+    last = None
+    try:
+        for doc in heapq.merge(*cursors, key=lambda d: d["_id"]):
+            if last is not None and doc["_id"] == last:
+                continue
+            last = doc["_id"]
+            yield doc
+    finally:
+        for c in cursors:
+            c.close()
+
+class Checkpoint:
+    # Last source _id whose curation has been written, per --start/--end
+    # window, so --resume can skip what a crashed run already did.
+    def __init__(self, coll, key: str):
+        self.coll = coll
+        self.key = key
+
+    def load(self):
+        rec = self.coll.find_one({"_id": self.key})
+        if not rec:
+            return None, False
+        return rec.get("last_id"), rec.get("state") == "done"
+
+    def save(self, last_id, counts: Tuple[int, ...], state: str = "running"):
+        self.coll.update_one(
+            {"_id": self.key},
+            {"$set": {"last_id": last_id, "state": state, "counts": list(counts),
+                      "cleaner_version": cleaner_version(),
+                      "updated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}},
+            upsert=True,
+        )
+
+    def reset(self):
+        self.coll.delete_one({"_id": self.key})
+
+def curated_key(doc: Dict[str, Any]):
+    return doc.get("identifier"), doc.get("detail_url") or doc.get("source_url")
+
+def fetch_previous(dst, docs: List[Dict[str, Any]]):
+    # One indexed lookup per chunk instead of one round trip per document.
+    idents = list({d.get("identifier") for d in docs})
+    prev = {}
+    for rec in dst.find({"identifier": {"$in": idents}}, PREV_PROJECTION):
+        prev[(rec.get("identifier"), rec.get("detail_url"))] = rec
+    return [prev.get(curated_key(d)) for d in docs]
+
+def curate_chunk(docs: List[Dict[str, Any]], prevs: List[Optional[Dict[str, Any]]], curated_root: Path,
+                 force: bool = False):
+    # Runs in a worker process; only plain data goes back to the parent.
+    # (None, None) marks a document that was already up to date.
+    out = []
+    for doc, prev in zip(docs, prevs):
+        try:
+            curated = curate_one(doc, curated_root, prev, force=force)
+            out.append((curated_record(doc, curated) if curated is not None else None, None))
+        except Exception as e:
+            logger.exception("Curation failed for %s: %s", doc.get("identifier"), e)
+            out.append((None, str(e)))
+    return out
+
+def iter_chunks(cursor, size: int):
+    it = iter(cursor)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def run_sequential(src, dst, filt, force: bool = False, checkpoint: Optional[Checkpoint] = None, after=None):
+    processed = ok = skipped = errs = missing = 0
+    last_id = after
+    for doc in source_cursor(src, filt, after):
+        try:
+            ident, detail_url = curated_key(doc)
+            prev = dst.find_one({"identifier": ident, "detail_url": detail_url}, PREV_PROJECTION)
+            curated = curate_one(doc, CURATED_DIR, prev, force=force)
+            if curated is None:
+                skipped += 1
+            else:
+                errs    += sum(1 for r in curated if r.get("status") == "error")
+                missing += sum(1 for r in curated if r.get("status") == "missing_source")
+
+                update = curated_record(doc, curated)
+                dst.update_one(
+                    {"identifier": update["identifier"], "detail_url": update["detail_url"]},
+                    {"$set": update},
+                    upsert=True,
+                )
+                ok += 1
+        except Exception as e:
+            errs += 1
+            logger.exception("Upsert failed for %s: %s", doc.get("identifier"), e)
+        processed += 1
+        last_id = doc["_id"]
+        if processed % 200 == 0:
+            logger.info("... processed=%d ok=%d skipped=%d errs=%d missing=%d", processed, ok, skipped, errs, missing)
+            if checkpoint:
+                checkpoint.save(last_id, (processed, ok, skipped, errs, missing))
+    if checkpoint:
+        checkpoint.save(last_id, (processed, ok, skipped, errs, missing), state="done")
+    return processed, ok, skipped, errs, missing
+
+def write_results(dst, results: List[Tuple[Optional[Dict[str, Any]], Optional[str]]]):
+    # Upserts the output of curate_chunk; returns (processed, ok, skipped, errs, missing).
+    processed = ok = skipped = errs = missing = 0
+    ops = []
+    for update, err in results:
+        processed += 1
+        if err is not None:
+            errs += 1
+            continue
+        if update is None:
+            skipped += 1
+            continue
+        errs    += sum(1 for r in update["new_files"] if r.get("status") == "error")
+        missing += sum(1 for r in update["new_files"] if r.get("status") == "missing_source")
+        ops.append(UpdateOne(
+            {"identifier": update["identifier"], "detail_url": update["detail_url"]},
+            {"$set": update},
+            upsert=True,
+        ))
+    if ops:
+        try:
+            dst.bulk_write(ops, ordered=False)
+            ok += len(ops)
+        except BulkWriteError as e:
+            failed = len(e.details.get("writeErrors") or [])
+            ok += len(ops) - failed
+            errs += failed
+            logger.error("bulk_write reported %d write errors", failed)
+        except Exception as e:
+            errs += len(ops)
+            logger.exception("bulk_write of %d curated docs failed: %s", len(ops), e)
+    return processed, ok, skipped, errs, missing
+
+def run_parallel(src, dst, filt, workers: int, chunk_size: int, force: bool = False,
+                 checkpoint: Optional[Checkpoint] = None, after=None):
+    processed = ok = skipped = errs = missing = 0
+    last_log = 0
+    last_id = after
+
+    def drain(entry):
+        nonlocal processed, ok, skipped, errs, missing, last_log, last_id
+        fut, chunk_last_id = entry
+        d = write_results(dst, fut.result())
+        processed += d[0]; ok += d[1]; skipped += d[2]; errs += d[3]; missing += d[4]
+        # Chunks are drained in submission (_id) order, so every document up
+        # to the end of this chunk has been written.
+        last_id = chunk_last_id
+        if checkpoint:
+            checkpoint.save(last_id, (processed, ok, skipped, errs, missing))
+        if processed // 200 > last_log // 200:
+            logger.info("... processed=%d ok=%d skipped=%d errs=%d missing=%d", processed, ok, skipped, errs, missing)
+        last_log = processed
+
+    # At most two chunks per worker are in flight, so memory stays bounded
+    # no matter how large the window is.
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in iter_chunks(source_cursor(src, filt, after), chunk_size):
+            fut = pool.submit(curate_chunk, chunk, fetch_previous(dst, chunk), CURATED_DIR, force)
+            pending.append((fut, chunk[-1]["_id"]))
+            if len(pending) >= workers * 2:
+                drain(pending.popleft())
+        while pending:
+            drain(pending.popleft())
+    if checkpoint:
+        checkpoint.save(last_id, (processed, ok, skipped, errs, missing), state="done")
+    return processed, ok, skipped, errs, missing
+
+WATCH_FIELDS = dict(SOURCE_PROJECTION, updated_at=1)
+
+def put_until_stopped(q: "queue.Queue", item, stop: threading.Event):
+    # The queue is bounded: a full queue holds the producer back.
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def follow_change_stream(src, q, stop, state):
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+        {"$project": {"fullDocument._id": 1, **{f"fullDocument.{k}": 1 for k in WATCH_FIELDS}}},
+    ]
+    with src.watch(pipeline, full_document="updateLookup", resume_after=state.get("token"),
+                   max_await_time_ms=1000) as stream:
+        logger.info("Following %s with a change stream", src.name)
+        while not stop.is_set():
+            change = stream.try_next()
+            if change is None:
+                continue
+            doc = change.get("fullDocument")
+            if doc:
+                put_until_stopped(q, (doc, {"token": change["_id"]}), stop)
+
+def shift_ts(ts: str, seconds: int) -> str:
+    t = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(t.timestamp() + seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def follow_updated_at(src, q, stop, state, interval: float, lag: int = WATCH_POLL_LAG):
+    # The crawler stamps updated_at when it buffers a document, not when its
+    # bulk write commits, and concurrent flushes commit out of order. So each
+    # poll reaches `lag` seconds behind the newest stamp seen, and versions
+    # already queued in that window are skipped by (_id, updated_at). After
+    # a restart the window is read again; unchanged documents are skipped
+    # by curation.
+    hwm = state.get("hwm") or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    seen = {}
+    logger.info("Polling %s.updated_at every %.1fs from %s (lag %ds)", src.name, interval, hwm, lag)
+    while not stop.is_set():
+        found = 0
+        since = shift_ts(hwm, -lag)
+        for doc in src.find({"updated_at": {"$gte": since}}, WATCH_FIELDS).sort([("updated_at", 1), ("_id", 1)]):
+            ts = doc.get("updated_at") or hwm
+            if seen.get(doc["_id"]) == ts:
+                continue
+            seen[doc["_id"]] = ts
+            hwm = max(hwm, ts)
+            found += 1
+            if not put_until_stopped(q, (doc, {"hwm": hwm}), stop):
+                return
+        since = shift_ts(hwm, -lag)
+        seen = {i: t for i, t in seen.items() if t >= since}
+        if not found:
+            stop.wait(interval)
+
+def follow_source(src, q, stop, state, interval: float):
+    try:
+        try:
+            follow_change_stream(src, q, stop, state)
+        except (OperationFailure, NotImplementedError) as e:
+            # Standalone servers have no change streams.
+            logger.info("Change streams unavailable (%s); falling back to polling", e)
+            follow_updated_at(src, q, stop, state, interval)
+    except Exception as e:
+        logger.exception("Source follower failed: %s", e)
+        stop.set()
+
+def take_batch(q: "queue.Queue", size: int, wait: float):
+    # Up to `size` changes; the newest version of a document wins. Returns
+    # the documents and the position marker of the last change taken.
+    try:
+        first = q.get(timeout=wait)
+    except queue.Empty:
+        return [], None
+    items = [first]
+    while len(items) < size:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            break
+    docs = {}
+    for doc, _ in items:
+        docs.pop(doc["_id"], None)
+        docs[doc["_id"]] = doc
+    return list(docs.values()), items[-1][1]
+
+def ignore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def run_watch(src, dst, state_coll, workers: int, chunk_size: int, force: bool = False,
+              interval: float = 2.0, queue_size: int = 1000):
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info("Stopping after in-flight documents...")
+        stop.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, request_stop)
+
+    key = f"{SOURCE_COLLECTION}:watch"
+    state = state_coll.find_one({"_id": key}) or {}
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    follower = threading.Thread(target=follow_source, args=(src, q, stop, state, interval),
+                                name="source-follower", daemon=True)
+    follower.start()
+
+    totals = [0, 0, 0, 0, 0]
+    pending = deque()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=ignore_sigint) if workers > 1 else None
+
+    def finish(results, marker, started):
+        d = write_results(dst, results)
+        for i, v in enumerate(d):
+            totals[i] += v
+        state_coll.update_one({"_id": key}, {"$set": dict(marker, updated_at=time.time())}, upsert=True)
+        logger.info("Curated %d changed document(s) in %.2fs (ok=%d skipped=%d errs=%d missing=%d, queued=%d)",
+                    d[0], time.monotonic() - started, d[1], d[2], d[3], d[4], q.qsize())
+
+    try:
+        while True:
+            if stop.is_set():
+                # Changes still queued are past the saved position, so they
+                # come back on the next start.
+                break
+            docs, marker = take_batch(q, chunk_size, wait=0.5)
+            if docs:
+                started = time.monotonic()
+                prevs = fetch_previous(dst, docs)
+                if pool is None:
+                    finish(curate_chunk(docs, prevs, CURATED_DIR, force), marker, started)
+                else:
+                    pending.append((pool.submit(curate_chunk, docs, prevs, CURATED_DIR, force), marker, started))
+            # In order, so the saved position never passes an unwritten batch.
+            while pending and (pending[0][0].done() or len(pending) >= workers * 2):
+                fut, m, t0 = pending.popleft()
+                finish(fut.result(), m, t0)
+    finally:
+        stop.set()
+        while pending:
+            fut, m, t0 = pending.popleft()
+            finish(fut.result(), m, t0)
+        if pool is not None:
+            pool.shutdown()
+        follower.join(timeout=5)
+    return tuple(totals)
+
 def main():
     ap = argparse.ArgumentParser(description="Transform Landing Zone into curated container.")
-    ap.add_argument("--start", required=True, help="YYYY-MM-DD inclusive")
-    ap.add_argument("--end",   required=True, help="YYYY-MM-DD inclusive")
+    ap.add_argument("--start", help="YYYY-MM-DD inclusive")
+    ap.add_argument("--end",   help="YYYY-MM-DD inclusive")
+    ap.add_argument("--workers", type=int, default=1, help="curate in N worker processes (1 = sequential)")
+    ap.add_argument("--chunk-size", type=int, default=100, help="documents per worker task")
+    ap.add_argument("--cleaner", choices=sorted(CLEANERS), default=None,
+                    help="HTML cleaning engine (default: $TRANSFORM_CLEANER or bs4)")
+    ap.add_argument("--force", action="store_true", help="re-curate documents even if unchanged")
+    ap.add_argument("--promote", choices=sorted(PROMOTE_ORDER), default=None,
+                    help="how PDF/DOC/DOCX reach the curated tree; each falls back to copying "
+                         "(default: $TRANSFORM_PROMOTE or auto = reflink, then hardlink)")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue after the last checkpoint of an unfinished run over the same window")
+    ap.add_argument("--watch", action="store_true",
+                    help="curate documents as the crawler upserts them, until interrupted")
+    ap.add_argument("--poll-interval", type=float, default=2.0,
+                    help="--watch without change streams: seconds between updated_at polls")
+    ap.add_argument("--queue-size", type=int, default=1000, help="--watch: max changes waiting for curation")
     args = ap.parse_args()
+    if not args.watch and not (args.start and args.end):
+        ap.error("--start and --end are required unless --watch is given")
+
+    global CLEANER, PROMOTE
+    if args.cleaner:
+        CLEANER = args.cleaner
+        os.environ["TRANSFORM_CLEANER"] = CLEANER
+    if args.promote:
+        PROMOTE = args.promote
+        os.environ["TRANSFORM_PROMOTE"] = PROMOTE
+    if PROMOTE not in PROMOTE_ORDER:
+        ap.error(f"TRANSFORM_PROMOTE must be one of {', '.join(sorted(PROMOTE_ORDER))}")
 
     ensure_dir(CURATED_DIR)
 
@@ -269,10 +925,36 @@ def main():
     try:
         dst.create_index([("identifier", 1), ("detail_url", 1)])
         dst.create_index([("new_files.new_file_path", 1)])
+        # One per branch of query_window's $or; source_cursor hints them.
+        src.create_index([("decision_date", 1)])
+        src.create_index([("partition_date", 1)])
+        if args.watch:
+            src.create_index([("updated_at", 1)])
     except Exception as e:
         logger.warning("Index creation failed (continuing): %s", e)
 
+    if args.watch:
+        processed, ok, skipped, errs, missing = run_watch(
+            src, dst, db[CHECKPOINTS], max(1, args.workers), max(1, args.chunk_size), force=args.force,
+            interval=args.poll_interval, queue_size=args.queue_size)
+        client.close()
+        logger.info("Watch stopped. processed=%d ok=%d skipped=%d errs=%d missing=%d", processed, ok, skipped, errs, missing)
+        return
+
     filt = query_window(args.start, args.end)
+    checkpoint = Checkpoint(db[CHECKPOINTS], f"{SOURCE_COLLECTION}:{args.start}:{args.end}")
+    after = None
+    if args.resume:
+        after, done = checkpoint.load()
+        if done:
+            logger.info("Window %s..%s already completed; nothing to resume", args.start, args.end)
+            client.close()
+            return
+        if after is not None:
+            logger.info("Resuming after _id %s", after)
+    else:
+        checkpoint.reset()
+
     try:
         total = src.count_documents(filt)
     except Exception as e:
@@ -281,39 +963,16 @@ def main():
 
     logger.info("Transforming %s documents from '%s' to '%s'", total, SOURCE_COLLECTION, CURATED_COLLECTION)
 
-    processed = ok = errs = missing = 0
-    for doc in src.find(filt, no_cursor_timeout=True):
-        try:
-            curated = curate_one(doc, CURATED_DIR)
-            errs    += sum(1 for r in curated if r.get("status") == "error")
-            missing += sum(1 for r in curated if r.get("status") == "missing_source")
-
-            update = {
-                "identifier":     doc.get("identifier"),
-                "detail_url":     doc.get("detail_url") or doc.get("source_url"),
-                "body":           doc.get("body") or "all",
-                "body_id":        doc.get("body_id"),
-                "decision_date":  doc.get("decision_date"),
-                "partition_date": decide_partition(doc),
-                "new_files":      curated,
-                "curated_at":     datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-            }
-
-            dst.update_one(
-                {"identifier": update["identifier"], "detail_url": update["detail_url"]},
-                {"$set": update},
-                upsert=True,
-            )
-            ok += 1
-        except Exception as e:
-            errs += 1
-            logger.exception("Upsert failed for %s: %s", doc.get("identifier"), e)
-        processed += 1
-        if processed % 200 == 0:
-            logger.info("... processed=%d ok=%d errs=%d missing=%d", processed, ok, errs, missing)
+    if args.workers > 1:
+        processed, ok, skipped, errs, missing = run_parallel(
+            src, dst, filt, args.workers, max(1, args.chunk_size), force=args.force,
+            checkpoint=checkpoint, after=after)
+    else:
+        processed, ok, skipped, errs, missing = run_sequential(
+            src, dst, filt, force=args.force, checkpoint=checkpoint, after=after)
 
     client.close()
-    logger.info("Done. processed=%d ok=%d errs=%d missing=%d", processed, ok, errs, missing)
+    logger.info("Done. processed=%d ok=%d skipped=%d errs=%d missing=%d", processed, ok, skipped, errs, missing)
 
 if __name__ == "__main__":
     main()